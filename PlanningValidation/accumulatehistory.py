@@ -44,6 +44,17 @@ resultfileList = [
 
 outputDirectory = '/tmp/outputs/dakota/%04d'
 
+# figures for all studies are generated in parallel. each run has its own
+# GPUWORKDIR for the brainNek setup files, the device is only used when a
+# SEM history is not stored. VISRUN sets a launcher for the render window,
+# ie VISRUN=vglrun, renderer = numpy in global.ini needs no display
+GPUDeviceList = [0,1,2,3,4,5]
+def RunVisualization(jobinfo):
+  (idjob,runcmd) = jobinfo
+  runcmd = "GPUWORKDIR=optpp_pds/vis%03d/%d %s %s" % (idjob,GPUDeviceList[idjob % len(GPUDeviceList)],os.getenv('VISRUN',''),runcmd)
+  print runcmd
+  return os.system( runcmd )
+
 def DiceTxtFileParse(DiceInputFilename):
   # (1) split on ':' (2)  filter lists > 1 (3) convert to dictionary
   c3doutput = dict(filter( lambda x: len(x) > 1,[line.strip().split(':') for line in open(DiceInputFilename) ] ))
@@ -55,6 +66,8 @@ with file('datasummary.tex' , 'w') as texHandle:
     fileHandle.write("iddata,mu_eff,obj\n")
     # loop over files and extract optimal value
     opttype = 'heating'
+    runcmdList    = []
+    dicesetupList = []
     for filenamebase in resultfileList:
       # get latex command
       config = ConfigParser.SafeConfigParser({})
@@ -78,10 +91,17 @@ with file('datasummary.tex' , 'w') as texHandle:
       #dataarray = numpy.loadtxt(filename,skiprows=1,usecols=(0,1,2,3,4,6)
       fileHandle.write("%05d,%12.5e,%12.5e\n" %(dataid,mu_effopt,minobjval))
       # FIXME
-      runcmd = "vglrun python ./brainsearch.py --param_file  %s/opt/optpp_pds.%s.in.%d %s/opt/optpp_pds.%s.out.%d --vis_out" % (filenamebase,opttype,idmin,filenamebase,opttype,idmin)
-      print runcmd
-      os.system( runcmd )
-  
+      runcmd = "python ./brainsearch.py --param_file  %s/opt/optpp_pds.%s.in.%d %s/opt/optpp_pds.%s.out.%d --vis_out" % (filenamebase,opttype,idmin,filenamebase,opttype,idmin)
+      runcmdList.append( runcmd )
+      dicesetupList.append( (filenamebase,config) )
+
+    # run all studies
+    import multiprocessing
+    visPool = multiprocessing.Pool( len(GPUDeviceList) )
+    visPool.map( RunVisualization, list(enumerate(runcmdList)) )
+    visPool.close()
+
+    for (filenamebase,config) in dicesetupList:
       # get arrhenius dice value
       heattimeinterval               = eval(config.get('mrti','heating')  )
       SEMDataDirectory               = outputDirectory % int(filenamebase.split('/')[-2]) 
@@ -0,0 +1,421 @@
+# offline benchmarks of the python side of brainsearch.py
+#
+# brainNekLibrary is replaced by SyntheticBrain3d, a stand-in w/ the
+# PyBrain3d methods used by brainsearch.py on a uniform hex mesh. a
+# gaussian source is heated and cooled w/ an explicit update of the nodal
+# temperature. the MRTI series is generated from the same model on the
+# image grid w/ a slightly wider source so that the objective is not zero.
+# the study (global.ini, MRTI, landmarks, dakota output) is written to a
+# scratch directory, no GPU, StudyDatabase, or display is needed
+#
+# one json record per line is written for each benchmark and size, ie
+#
+#   python benchbrainsearch.py --mesh=8,16 --voi=32,64 --repeat=3 --output=bench.json
+
+import sys
+import os
+import time
+import types
+import json
+import platform
+import tempfile
+import shutil
+import subprocess
+
+# numerical support
+import numpy
+
+# synthetic heating
+BodyTemperature = 37.0
+SourcePower     = 10.0     # W  on for t < SourceOffTime
+SourceOffTime   = 60.0     # s
+HeatingRate     = 0.175    # degC/s/W at the center of the source
+CoolingTime     = 20.0     # s  newton cooling toward body temperature
+SEMSourceWidth  = 0.004    # m
+MRTISourceWidth = 0.0045   # m
+
+# synthetic geometry and acquisition
+MeshHalfWidth     = 0.02   # m
+VOIHalfWidth      = 0.015  # m
+NumberOfSlices    = 5
+SliceSpacing      = 0.002  # m
+MRTIInterval      = 5.0    # s
+NumberOfMRTIFrames = 20
+
+# Convenience Routine
+def SourcePowerHistory(time):
+  """ power of the synthetic laser """
+  if ( time < SourceOffTime ):
+    return SourcePower
+  return 0.0
+
+# Convenience Routine
+def SourceProfile(points,width):
+  """ gaussian source at the origin """
+  return numpy.exp( -(points**2).sum(axis=1) / (2.*width**2) )
+
+##################################################################
+class SyntheticSetupAide:
+  """ Class for the brainNek setuprc stand-in...  """
+  def __init__(self,setuprcfilename):
+    self.SetupRCFileName = setuprcfilename
+
+##################################################################
+class SyntheticBrain3d:
+  """ Class for a brainNek stand-in w/ the PyBrain3d methods used by brainsearch.py...  """
+  # set before each benchmark
+  NumberOfElementsPerSide = 8
+  FinalTime = NumberOfMRTIFrames * MRTIInterval
+
+  def __init__(self,setup):
+    self.Setup = setup
+    numSide = self.NumberOfElementsPerSide
+    axis = numpy.linspace(-MeshHalfWidth,MeshHalfWidth,numSide+1)
+    # x fastest
+    (zz,yy,xx) = numpy.mgrid[0:numSide+1,0:numSide+1,0:numSide+1]
+    self.Nodes = numpy.vstack( (axis[xx.ravel()],axis[yy.ravel()],axis[zz.ravel()]) ).transpose().astype(numpy.float32)
+    # vtk hex ordering, each cell is preceded by the number of points
+    nodeid = numpy.arange((numSide+1)**3).reshape(numSide+1,numSide+1,numSide+1)[:-1,:-1,:-1].ravel()
+    di = 1
+    dj = numSide+1
+    dk = (numSide+1)**2
+    self.Elements = numpy.vstack( (8*numpy.ones(nodeid.size,dtype=numpy.int64),
+                                   nodeid      ,nodeid+di      ,nodeid+di+dj      ,nodeid+dj      ,
+                                   nodeid+dk   ,nodeid+di+dk   ,nodeid+di+dj+dk   ,nodeid+dj+dk   ) ).transpose().astype(numpy.int32)
+    self.Profile     = SourceProfile(self.Nodes.astype(numpy.float64),SEMSourceWidth)
+    self.Temperature = BodyTemperature * numpy.ones(self.Nodes.shape[0])
+
+  def GetNumberOfNodes(self):
+    return self.Nodes.shape[0]
+
+  def GetNumberOfElements(self):
+    return self.Elements.shape[0]
+
+  def GetNodes(self,nodes):
+    nodes[:] = self.Nodes.ravel()
+
+  def GetElements(self,elements):
+    elements[:] = self.Elements.ravel()
+
+  def dt(self):
+    return 0.25
+
+  def heatStep(self,time,power):
+    """ explicit update, source and newton cooling """
+    self.Temperature = self.Temperature + self.dt() * ( power * HeatingRate * self.Profile - (self.Temperature - BodyTemperature)/CoolingTime )
+
+  def timeStep(self,time,power):
+    if ( time >= self.FinalTime ):
+      return False
+    self.heatStep(time,power)
+    return True
+
+  def getHostTemperature(self,temperature):
+    temperature[:] = self.Temperature
+
+  def setDeviceTemperature(self,temperature):
+    self.Temperature = temperature.astype(numpy.float64)
+
+  def getHostForcing(self,forcing):
+    forcing[:] = 0.0
+
+  def ResetState(self,temperature,forcing):
+    self.setDeviceTemperature(temperature)
+
+  def SetFinalTime(self,finaltime):
+    self.FinalTime = finaltime
+
+  def PrintSelf(self):
+    print "synthetic brainNek %d nodes %d elements" % (self.GetNumberOfNodes(),self.GetNumberOfElements())
+
+# Convenience Routine
+def InstallSyntheticBrainNek():
+  """ brainsearch.py imports brainNekLibrary in the solve """
+  brainNekLibrary = types.ModuleType('brainNekLibrary')
+  brainNekLibrary.PySetupAide = SyntheticSetupAide
+  brainNekLibrary.PyBrain3d   = SyntheticBrain3d
+  sys.modules['brainNekLibrary'] = brainNekLibrary
+
+##################################################################
+def WriteSyntheticStudy(studydirectory,voisize):
+  """
+  MRTI temperature series of the synthetic heating, the images are
+  centered at the origin w/ voisize^2 pixels in plane
+  returns the MRTI directory and VOI
+  """
+  import vtk
+  import vtk.util.numpy_support as vtkNumPy
+  mrtidirectory = '%s/mrti%04d' % (studydirectory,voisize)
+  os.system('mkdir -p %s' % mrtidirectory )
+  dimensions = [voisize,voisize,NumberOfSlices]
+  spacing    = [2.*VOIHalfWidth/(voisize-1),2.*VOIHalfWidth/(voisize-1),SliceSpacing]
+  origin     = [-0.5*(dimensions[idim]-1)*spacing[idim] for idim in range(3)]
+  (kk,jj,ii) = numpy.mgrid[0:dimensions[2],0:dimensions[1],0:dimensions[0]]
+  imagepoints = numpy.vstack( (origin[0] + spacing[0] * ii.ravel(),
+                               origin[1] + spacing[1] * jj.ravel(),
+                               origin[2] + spacing[2] * kk.ravel()) ).transpose()
+  profile = SourceProfile(imagepoints,MRTISourceWidth)
+
+  # same explicit update as the synthetic brainNek
+  deltat = 0.25
+  temperature = BodyTemperature * numpy.ones(imagepoints.shape[0])
+  currentTime = 0.0
+  for MRTItimeID in range(NumberOfMRTIFrames+1):
+    while( currentTime < MRTItimeID * MRTIInterval ):
+      currentTime = currentTime + deltat
+      temperature = temperature + deltat * ( SourcePowerHistory(currentTime) * HeatingRate * profile - (temperature - BodyTemperature)/CoolingTime )
+    vtkImage = vtk.vtkImageData()
+    vtkImage.SetDimensions( dimensions )
+    vtkImage.SetSpacing( spacing )
+    vtkImage.SetOrigin( origin )
+    vtkArray = vtkNumPy.numpy_to_vtk( temperature.astype(numpy.float32), 1)
+    vtkArray.SetName("image_data")
+    vtkImage.GetPointData().SetScalars(vtkArray)
+    vtkImageDataWriter = vtk.vtkDataSetWriter()
+    vtkImageDataWriter.SetFileTypeToBinary()
+    vtkImageDataWriter.SetFileName( '%s/temperature.%04d.vtk' % (mrtidirectory,MRTItimeID) )
+    vtkImageDataWriter.SetInput(vtkImage)
+    vtkImageDataWriter.Update()
+  return (mrtidirectory,[0,dimensions[0]-1,0,dimensions[1]-1,0,dimensions[2]-1])
+
+# Convenience Routine
+def WriteSyntheticLandmarks(landmarkfilename):
+  """ identical source and target landmarks for ForwardSolve """
+  import vtk
+  vtkLandmarks = vtk.vtkPoints()
+  for point in [[0.,0.,0.],[0.01,0.,0.],[0.,0.01,0.],[0.,0.,0.01]]:
+    vtkLandmarks.InsertNextPoint(point)
+  vtkLandmarkData = vtk.vtkPolyData()
+  vtkLandmarkData.SetPoints(vtkLandmarks)
+  vtkLandmarkWriter = vtk.vtkPolyDataWriter()
+  vtkLandmarkWriter.SetFileName(landmarkfilename)
+  vtkLandmarkWriter.SetInput(vtkLandmarkData)
+  vtkLandmarkWriter.Update()
+
+# Convenience Routine
+def WriteSyntheticDakotaOutput(optdirectory,numberofevaluations):
+  """ dakota output files and dice files for the accumulation """
+  os.system('mkdir -p %s' % optdirectory )
+  objectivevalues = numpy.random.RandomState(0).rand(numberofevaluations,4)
+  for (idopt,objfunctionlist) in enumerate(objectivevalues):
+    with file('%s/optpp_pds.heating.out.%d' % (optdirectory,idopt+1),'w') as fileHandle:
+      for objfncvalue in objfunctionlist:
+        fileHandle.write('%f\n' % objfncvalue )
+    with file('%s/dice.heating.%04d.txt' % (optdirectory,idopt+1),'w') as fileHandle:
+      fileHandle.write("Dice similarity coefficient: %f\n" % objfunctionlist[2] )
+
+##################################################################
+def SyntheticParameters(brainsearch,UID,mrtidirectory,voi,studydirectory):
+  """ fem_params as from brainsearch.ParseInput """
+  continuous_vars = {'robin_coeff':0.0,'probe_init':21.0,'mu_eff_healthy':180.,'body_temp':BodyTemperature,
+                     'anfact_healthy':0.88,'mu_a_healthy':5.0,'mu_s_healthy':14000.,'c_blood_healthy':3840.,
+                     'c_p_healthy':3840.,'rho_healthy':1045.,'alpha_healthy':1.3e-7,'k_0_healthy':0.527,'w_0_healthy':6.0,
+                     'x_displace':0.0,'y_displace':0.0,'z_displace':0.0,'x_rotate':0.0,'y_rotate':0.0,'z_rotate':0.0}
+  fem_params = {}
+  fem_params['UID']          = UID
+  fem_params['fileID']       = UID
+  fem_params['opttype']      = 'heating'
+  fem_params['cv']           = brainsearch.ConvertContinuousVariables(continuous_vars)
+  fem_params['asv']          = [1,1,1,1]
+  fem_params['dvv']          = []
+  fem_params['functions']    = 4
+  fem_params['mrti']         = mrtidirectory
+  fem_params['voi']          = voi
+  fem_params['mrtideltat']   = MRTIInterval
+  fem_params['timeinterval'] = [0,NumberOfMRTIFrames]
+  fem_params['maxheatid']    = NumberOfMRTIFrames-1
+  fem_params['initialtime']  = 0.0
+  fem_params['finaltime']    = NumberOfMRTIFrames * MRTIInterval
+  fem_params['powerhistory'] = [[SourceOffTime,NumberOfMRTIFrames * MRTIInterval],[SourcePower,0.0]]
+  fem_params['lambdacode']   = SourcePowerHistory
+  fem_params['segment_file'] = '%s/segment.vtk' % studydirectory
+  fem_params['target_landmarks']   = '%s/landmarks.vtk' % studydirectory
+  fem_params['transformlandmarks'] = '%s/landmarks.vtk' % studydirectory
+  fem_params['VisualizeOutput'] = False
+  return fem_params
+
+##################################################################
+class BenchmarkTimer:
+  """ Class for repeated timing w/ json output...  """
+  def __init__(self,outputHandle,repeat,verbose):
+    self.OutputHandle = outputHandle
+    self.Repeat       = repeat
+    self.Verbose      = verbose
+    import vtk
+    self.HostInfo = {'hostname': platform.node(),
+                     'python'  : platform.python_version(),
+                     'numpy'   : numpy.__version__,
+                     'vtk'     : vtk.vtkVersion.GetVTKVersion() }
+
+  def Time(self,benchmarkname,benchmarkfunction,caseinfo={}):
+    """ wall clock of each call, brainsearch output is discarded """
+    timings = []
+    for idrepeat in range(self.Repeat):
+      stdout = sys.stdout
+      if ( not self.Verbose ):
+        sys.stdout = open(os.devnull,'w')
+      try:
+        starttime = time.time()
+        benchmarkfunction()
+        timings.append( time.time() - starttime )
+      finally:
+        if ( not self.Verbose ):
+          sys.stdout.close()
+        sys.stdout = stdout
+    record = dict(self.HostInfo)
+    record.update(caseinfo)
+    record.update({'benchmark':benchmarkname,'repeat':self.Repeat,
+                   'min':min(timings),'mean':sum(timings)/len(timings),'max':max(timings)})
+    self.OutputHandle.write('%s\n' % json.dumps(record,sort_keys=True) )
+    self.OutputHandle.flush()
+    return timings
+
+##################################################################
+def RunBenchmarks(meshsizes,voisizes,repeat,evaluations,outputHandle,verbose,studydirectory):
+  """ time the python hot path for each mesh and VOI size """
+  # brainsearch.py reads global.ini (LoadGlobalConfig) and the GPU work directory
+  with file('%s/global.ini' % studydirectory,'w') as fileHandle:
+    fileHandle.write('[exec]\n')
+    fileHandle.write('databaseDIR     = %s/database/\n' % studydirectory)
+    fileHandle.write('c3dexe          = c3d\n')
+    fileHandle.write('brainNekDIR     = %s\n' % studydirectory)
+    fileHandle.write('outputDirectory = %s/outputs/%%%%04d\n' % studydirectory)
+    fileHandle.write('MatlabDriver    = False\n')
+  os.environ['GPUWORKDIR'] = '%s/optpp_pds/0' % studydirectory
+  os.chdir(studydirectory)
+  InstallSyntheticBrainNek()
+  sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)))
+  stdout = sys.stdout
+  sys.stdout = open(os.devnull,'w')
+  try:
+    import brainsearch
+    brainsearch.LoadGlobalConfig()
+  finally:
+    sys.stdout.close()
+    sys.stdout = stdout
+  WriteSyntheticLandmarks('%s/landmarks.vtk' % studydirectory)
+  benchmarkTimer = BenchmarkTimer(outputHandle,repeat,verbose)
+
+  # interpreter startup of the lightweight command line modes, vtk and
+  # global.ini are not loaded
+  brainsearchscript = '%s/brainsearch.py' % os.path.dirname(os.path.abspath(__file__))
+  startupenv = dict(os.environ,PYTHONPATH=os.path.dirname(brainsearchscript))
+  devnullHandle = open(os.devnull,'w')
+  for (startupname,startupargs) in [('import',['-c','import brainsearch']),
+                                    ('help'  ,[brainsearchscript,'--help'])]:
+    startupcommand = [sys.executable] + startupargs
+    benchmarkTimer.Time('startup.%s' % startupname,
+                        lambda: subprocess.call(startupcommand,stdout=devnullHandle,env=startupenv))
+  devnullHandle.close()
+
+  UID = 0
+  for meshsize in meshsizes:
+    SyntheticBrain3d.NumberOfElementsPerSide = meshsize
+    numnodes = (meshsize+1)**3
+
+    # forward solve and stl output
+    UID = UID + 1
+    fem_params = SyntheticParameters(brainsearch,UID,None,None,studydirectory)
+    benchmarkTimer.Time('ForwardSolve',lambda: brainsearch.ForwardSolve(**fem_params),
+                        {'mesh':meshsize,'nodes':numnodes})
+
+    for voisize in voisizes:
+      (mrtidirectory,voi) = WriteSyntheticStudy(studydirectory,voisize)
+      caseinfo = {'mesh':meshsize,'nodes':numnodes,'voi':voisize,
+                  'points':voisize*voisize*NumberOfSlices,'frames':NumberOfMRTIFrames}
+      UID = UID + 1
+      fem_params = SyntheticParameters(brainsearch,UID,mrtidirectory,voi,studydirectory)
+      os.system('mkdir -p %s' % brainsearch.outputDirectory % UID )
+
+      # SEM solve and history storage
+      benchmarkTimer.Time('SolveSEMHistory',lambda: brainsearch.SolveSEMHistory(**fem_params),caseinfo)
+
+      # stored history, first evaluation of a registration
+      def ComputeObjectiveFirst():
+        fem_params['shareddata'] = {}
+        brainsearch.ComputeObjective(**fem_params)
+      benchmarkTimer.Time('ComputeObjective',ComputeObjectiveFirst,caseinfo)
+
+      # stored history, MRTI and interpolation weights shared w/ a
+      # previous evaluation as in the finite difference gradient
+      fem_params['shareddata'] = {}
+      sys.stdout = open(os.devnull,'w')
+      try:
+        brainsearch.ComputeObjective(**fem_params)
+      finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+      benchmarkTimer.Time('ComputeObjective.shared',lambda: brainsearch.ComputeObjective(**fem_params),caseinfo)
+
+      # registration gradient
+      fem_params['asv'] = [3,1,1,1]
+      benchmarkTimer.Time('ComputeObjective.gradient',lambda: brainsearch.ComputeObjective(**fem_params),caseinfo)
+      fem_params['asv'] = [1,1,1,1]
+      del fem_params['shareddata']
+
+  # dose accumulation over the MRTI series
+  for voisize in voisizes:
+    (mrtidirectory,voi) = WriteSyntheticStudy(studydirectory,voisize)
+    # keep the images, the arrays do not own the data
+    mrtiList = [ brainsearch.ReadMRTIVOI(mrtidirectory,MRTItimeID,voi,{}) for MRTItimeID in range(1,NumberOfMRTIFrames) ]
+    def UpdateDoseMapSeries():
+      mrtiDose = brainsearch.ImageDoseHelper(voi,MRTIInterval,'%s/temperature.0001.vtk' % mrtidirectory)
+      for (vtkMRTIImage,mrti_array) in mrtiList:
+        mrtiDose.UpdateDoseMap(mrti_array)
+    benchmarkTimer.Time('ImageDoseHelper.UpdateDoseMap',UpdateDoseMapSeries,
+                        {'voi':voisize,'points':voisize*voisize*NumberOfSlices,'frames':NumberOfMRTIFrames})
+
+  # accumulation of the dakota output
+  optdirectory = '%s/accumulate/opt' % studydirectory
+  WriteSyntheticDakotaOutput(optdirectory,evaluations)
+  benchmarkTimer.Time('GetMinJobID',lambda: brainsearch.GetMinJobID('%s/optpp_pds.heating' % optdirectory),
+                      {'evaluations':evaluations})
+  def ParseDiceFiles():
+    for idopt in range(evaluations):
+      brainsearch.DiceTxtFileParse('%s/dice.heating.%04d.txt' % (optdirectory,idopt+1))
+  benchmarkTimer.Time('DiceTxtFileParse',ParseDiceFiles,{'evaluations':evaluations})
+# end def RunBenchmarks:
+##################################################################
+
+# setup command line parser to control execution
+from optparse import OptionParser
+parser = OptionParser()
+parser.add_option( "--mesh",
+                  action="store", dest="mesh", default="8,16",
+                  help="comma separated elements per side of the synthetic mesh", metavar="LIST")
+parser.add_option( "--voi",
+                  action="store", dest="voi", default="32,64",
+                  help="comma separated pixels per side of the synthetic VOI", metavar="LIST")
+parser.add_option( "--repeat",
+                  action="store", dest="repeat", type="int", default=3,
+                  help="timings of each benchmark", metavar="INT")
+parser.add_option( "--evaluations",
+                  action="store", dest="evaluations", type="int", default=500,
+                  help="dakota evaluations for the accumulation", metavar="INT")
+parser.add_option( "--output",
+                  action="store", dest="output", default=None,
+                  help="append json records to FILE, default stdout", metavar="FILE")
+parser.add_option( "--scratch",
+                  action="store", dest="scratch", default=None,
+                  help="keep the synthetic study in DIR", metavar="DIR")
+parser.add_option( "--verbose",
+                  action="store_true", dest="verbose", default=False,
+                  help="show brainsearch output", metavar="bool")
+(options, args) = parser.parse_args()
+
+if ( options.output != None ):
+  outputHandle = file(os.path.abspath(options.output),'a')
+else:
+  outputHandle = sys.stdout
+if ( options.scratch != None ):
+  studydirectory = os.path.abspath(options.scratch)
+  os.system('mkdir -p %s' % studydirectory )
+else:
+  studydirectory = tempfile.mkdtemp(prefix='benchbrainsearch.')
+try:
+  RunBenchmarks([int(meshsize) for meshsize in options.mesh.split(',')],
+                [int(voisize ) for voisize  in options.voi.split(',') ],
+                options.repeat,options.evaluations,outputHandle,options.verbose,studydirectory)
+finally:
+  if ( options.scratch == None ):
+    shutil.rmtree(studydirectory)
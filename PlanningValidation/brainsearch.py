@@ -6,34 +6,149 @@
 import sys
 import re
 import os
+import time
 import ConfigParser
 
 # numerical support
 import numpy
+import meshprojection
+import objectivemetrics
+import pennesfd
+import mrtiio
 
 # vis support
-import vtk
-import vtk.util.numpy_support as vtkNumPy 
-print "using vtk version", vtk.vtkVersion.GetVTKVersion()
+#   vtk is slow to start and only needed to solve, register, and render.
+#   ImportVTK is called by the routines using it, --help, --accum_history,
+#   --run_min, and cached evaluations start w/o vtk
+vtk                = None
+vtkNumPy           = None
+FIXMEHackTransform = None
 
+# Convenience Routine
+def ImportVTK():
+  """ import vtk on first use """
+  global vtk, vtkNumPy, FIXMEHackTransform
+  if ( vtk != None ):
+    return
+  import vtk
+  import vtk.util.numpy_support as vtkNumPy 
+  print "using vtk version", vtk.vtkVersion.GetVTKVersion()
+
+  # FIXME quick hack for 180deg flip 
+  FIXMEHackTransform = vtk.vtkTransform()
+  FIXMEHackTransform.RotateY( 180. )
+
+# GPU work directory, created by brainNekWrapper
 if( os.getenv("GPUWORKDIR") ) :
   workDirectory   = os.getenv("GPUWORKDIR") 
 else:
   workDirectory   = 'optpp_pds/1'
-os.system('mkdir -p %s' % workDirectory )
+
+# generated brainNek case, function, and material files are named by their
+# content and shared by all evaluations and GPU work directories so that the
+# OCCA kernels built for one evaluation are found in the OCCA_CACHE_DIR by
+# the next. only the setuprc file is written per evaluation
+SetupCacheDirectory = '%s/setupcache' % os.path.dirname(os.path.abspath(workDirectory))
+OCCACacheDirectory  = None
 
 #FIXME global vars
-globalconfig = ConfigParser.SafeConfigParser({})
-globalconfig.read('./global.ini')
-databaseDIR     = globalconfig.get('exec','databaseDIR')
-c3dexe          = globalconfig.get('exec','c3dexe')
-brainNekDIR     = globalconfig.get('exec','brainNekDIR')
-outputDirectory = globalconfig.get('exec','outputDirectory')
-MatlabDriver    = globalconfig.getboolean('exec','MatlabDriver')
-
-# FIXME quick hack for 180deg flip 
-FIXMEHackTransform = vtk.vtkTransform()
-FIXMEHackTransform.RotateY( 180. )
+#  set from global.ini by LoadGlobalConfig after the command line is parsed
+databaseDIR     = None
+c3dexe          = None
+brainNekDIR     = None
+outputDirectory = None
+MatlabDriver    = False
+
+# finite difference gradients: relative step size and the GPU devices
+# available for concurrent solves of the perturbed parameters
+FDStepSize    = 1.e-3
+GPUDeviceList = None
+
+# persistent cache of evaluations, disabled unless a database is given
+EvalCacheFile       = None
+EvalCacheTolerance  = 0.0
+EvalCacheMaxEntries = None
+
+# JPG output w/ a single offscreen vtkRenderWindow (colorbar title and
+# labels) or numpy colored slices (no display needed, unlabeled colorbar)
+VisRenderer = 'window'
+JPGRenderer = None
+
+# named objective components returned to DAKOTA, see objectivemetrics.py
+ObjectiveComponents = objectivemetrics.DefaultObjectiveComponents
+
+# time window of the objective functions returned to DAKOTA, the other
+# windows of setup.ini are reduced from the same solve and stored.
+# opttype selects the heating or cooling window of the study
+ObjectiveWindow = 'fulltime'
+
+# seconds to wait for an MRTI frame not yet converted (tmap.py --watch),
+# the objective then keeps pace w/ the acquisition. 0 uses frame 0
+MRTIWaitTime = 0.0
+
+# forward model: brainNek SEM on the GPU or the pennes finite difference
+# model on the MRTI grid (CPU only, low fidelity, see pennesfd.py)
+ForwardModel    = 'brainNek'
+PennesFDPadding = 10
+
+# Convenience Routine
+def ParseDeviceList(devicelist):
+  """ GPU devices of global.ini, ie 0,1,2 or [0,1,2] """
+  return [ int(device) for device in devicelist.replace('[','').replace(']','').split(',') if device.strip() ]
+
+# Convenience Routine
+def LoadGlobalConfig(globalinifile='./global.ini'):
+  """ read the [exec] section of global.ini """
+  global databaseDIR, c3dexe, brainNekDIR, outputDirectory, MatlabDriver
+  global FDStepSize, GPUDeviceList, EvalCacheFile, EvalCacheTolerance, EvalCacheMaxEntries
+  global VisRenderer, ObjectiveComponents, ObjectiveWindow, ForwardModel, PennesFDPadding
+  global SetupCacheDirectory, OCCACacheDirectory, MRTIWaitTime
+  globalconfig = ConfigParser.SafeConfigParser({})
+  globalconfig.read(globalinifile)
+  databaseDIR     = globalconfig.get('exec','databaseDIR')
+  c3dexe          = globalconfig.get('exec','c3dexe')
+  brainNekDIR     = globalconfig.get('exec','brainNekDIR')
+  outputDirectory = globalconfig.get('exec','outputDirectory')
+  MatlabDriver    = globalconfig.getboolean('exec','MatlabDriver')
+  if ( globalconfig.has_option('exec','fdstepsize') ):
+    FDStepSize    = globalconfig.getfloat('exec','fdstepsize')
+  if ( globalconfig.has_option('exec','gpudevices') ):
+    GPUDeviceList = ParseDeviceList(globalconfig.get('exec','gpudevices'))
+  if ( globalconfig.has_option('exec','evalcache') ):
+    EvalCacheFile       = globalconfig.get('exec','evalcache')
+  if ( globalconfig.has_option('exec','evalcachetolerance') ):
+    EvalCacheTolerance  = globalconfig.getfloat('exec','evalcachetolerance')
+  if ( globalconfig.has_option('exec','evalcachemaxentries') ):
+    EvalCacheMaxEntries = globalconfig.getint('exec','evalcachemaxentries')
+  if ( globalconfig.has_option('exec','renderer') ):
+    VisRenderer = globalconfig.get('exec','renderer')
+  if ( globalconfig.has_option('exec','objectives') ):
+    ObjectiveComponents = globalconfig.get('exec','objectives').split()
+  if ( globalconfig.has_option('exec','objectivewindow') ):
+    ObjectiveWindow = globalconfig.get('exec','objectivewindow')
+  if ( globalconfig.has_option('exec','setupcache') ):
+    SetupCacheDirectory = globalconfig.get('exec','setupcache')
+  if ( globalconfig.has_option('exec','occacachedir') ):
+    OCCACacheDirectory  = globalconfig.get('exec','occacachedir')
+  if ( globalconfig.has_option('exec','forwardmodel') ):
+    ForwardModel    = globalconfig.get('exec','forwardmodel')
+  if ( globalconfig.has_option('exec','pennesfdpadding') ):
+    PennesFDPadding = globalconfig.getint('exec','pennesfdpadding')
+  if ( globalconfig.has_option('exec','mrtiwait') ):
+    MRTIWaitTime    = globalconfig.getfloat('exec','mrtiwait')
+
+# Convenience Routine
+def ConfiguredObjectiveComponents(globalinifile='./global.ini'):
+  """ objectives of global.ini w/o reading the rest of the configuration """
+  globalconfig = ConfigParser.SafeConfigParser({})
+  globalconfig.read(globalinifile)
+  if ( globalconfig.has_option('exec','objectives') ):
+    return globalconfig.get('exec','objectives').split()
+  return ObjectiveComponents
+
+# registration variables only change the rigid transform applied before the
+# comparison with MRTI, the SEM physics does not depend on them
+RegistrationVariableList = ['x_displace','y_displace','z_displace','x_rotate','y_rotate','z_rotate']
 
 # $ ls database workdir/
 # database:
@@ -213,7 +328,7 @@ setuprcTemplate = \
 OpenCL
 
 [CASE FILE]
-%s/case.%04d.setup
+%s
 
 [MESH FILE]
 meshes/cooledConformMesh.inp
@@ -252,7 +367,7 @@ caseFileTemplate = \
 # all physical quantities should be in MKS units and degrees Celsius
 
 [FUNCTION FILE]
-%s/casefunctions.%04d.occa
+%s
 
 [HAS EXACT SOLUTION]
 0
@@ -314,7 +429,7 @@ probeSurface
 %s
 
 [BRAIN MATERIAL PROPERTIES FILE]
-%s/material_types.%04d.setup
+%s
 
 # Currently has material properties of water
 [PROBE MATERIAL PROPERTIES]
@@ -323,7 +438,36 @@ catheter  1.0      4180           0.5985        500         14000       0.88
 laserTip  1.0      4180           0.5985        500         14000       0.88
 """
 # Convenience Routine
-def GetMinJobID(FileNameTemplate):
+def ReadDakotaFunctionValues(resultsfilename):
+  """
+  function values of a DAKOTA results file, the gradients [ ... ] and
+  hessians [[ ... ]] follow the function values
+  """
+  functionvalues = []
+  for line in open(resultsfilename):
+    if ( line.strip().startswith('[') ):
+      break
+    if ( len(line.split()) > 0 ):
+      functionvalues.append( float(line.split()[0]) )
+  return numpy.array(functionvalues)
+
+# Convenience Routine
+def GetMinJobID(FileNameTemplate,ComponentNames=None):
+    """
+    evaluation w/ the minimum of the first objective component plus the
+    dice penalty. the positions of the components in the results files are
+    those of the objectives of global.ini (ObjectiveComponents)
+    """
+    if ( ComponentNames == None ):
+      ComponentNames = ObjectiveComponents
+    MetricNames = [ objectivemetrics.ParseComponent(componentname)[0] for componentname in ComponentNames ]
+    def ComponentPosition(metricname):
+      if ( metricname in MetricNames ):
+        return MetricNames.index(metricname)
+      return None
+    PenaltyPosition      = ComponentPosition('dicepenalty')
+    DicePosition         = ComponentPosition('dice')
+    OneMinusDicePosition = ComponentPosition('oneminusdice')
     OptID      = 1  
     MinObjVal  = 1.e99
     MinL2Value     = 1.e99
@@ -339,19 +483,29 @@ def GetMinJobID(FileNameTemplate):
     for dakotaoutfile in DirectoryOutList:
       datafile = '%s/%s'  % (DirectoryLocation ,dakotaoutfile ) 
       print datafile 
-      obj_fn_data = numpy.loadtxt(datafile )
+      try:
+        obj_fn_data = ReadDakotaFunctionValues(datafile )
+      except ValueError:
+        print "WARNING: skipping unreadable results file", datafile
+        continue
       #print '%s/%s'  % (DirectoryLocation, dakotaoutfile), obj_fn_data 
       # FIXME: find the best one, ignore errors
-      if( obj_fn_data.size == 4 ):
-        L2Value       = obj_fn_data[0] # SJF - This records the best L2_norm
-        DicePenalty   = obj_fn_data[1]   
-        if(L2Value  + DicePenalty   < MinObjVal ): # SJF - this finds the best L2_norm 
-          MinObjVal = L2Value  + DicePenalty  
-          OptID     = int(dakotaoutfile.split(".").pop()) 
-          MinL2Value     = L2Value  
-          MinDicePenalty = DicePenalty  
-          DiceAtL2Min    = obj_fn_data[2]   
-          OneMinuseDice  = obj_fn_data[3]   
+      if( obj_fn_data.size != len(ComponentNames) ):
+        print "WARNING: %d functions in %s, %d objective components %s" % (obj_fn_data.size,datafile,len(ComponentNames),ComponentNames)
+        continue
+      L2Value       = obj_fn_data[0] # SJF - This records the best L2_norm
+      DicePenalty   = 0.0
+      if ( PenaltyPosition not in [None,0] ):
+        DicePenalty = obj_fn_data[PenaltyPosition]
+      if(L2Value  + DicePenalty   < MinObjVal ): # SJF - this finds the best L2_norm 
+        MinObjVal = L2Value  + DicePenalty  
+        OptID     = int(dakotaoutfile.split(".").pop()) 
+        MinL2Value     = L2Value  
+        MinDicePenalty = DicePenalty  
+        if ( DicePosition != None ):
+          DiceAtL2Min    = obj_fn_data[DicePosition]   
+        if ( OneMinusDicePosition != None ):
+          OneMinuseDice  = obj_fn_data[OneMinusDicePosition]   
     return (OptID,MinL2Value,MinDicePenalty ,DiceAtL2Min  ,OneMinuseDice )
 
 # Convenience Routine
@@ -362,6 +516,7 @@ def DiceTxtFileParse(DiceInputFilename):
   
 # Convenience Routine
 def WriteVTKOutputFile(vtkImageData,VTKOutputFilename):
+    ImportVTK()
     vtkImageDataWriter = vtk.vtkDataSetWriter()
     vtkImageDataWriter.SetFileTypeToBinary()
     print "writing ", VTKOutputFilename 
@@ -369,40 +524,166 @@ def WriteVTKOutputFile(vtkImageData,VTKOutputFilename):
     vtkImageDataWriter.SetInput(vtkImageData)
     vtkImageDataWriter.Update()
 
+# Convenience Routine
+def BuildHexahedronGrid(bNekNodes,bNekConnectivity):
+  """ setup vtkUnstructuredGrid from brainNek nodes and connectivity """
+  ImportVTK()
+  numPoints = bNekNodes.shape[0]
+  numHexPts = 8 
+  numElems  = bNekConnectivity.size / (numHexPts +1)
+  hexahedronGrid   = vtk.vtkUnstructuredGrid()
+
+  # TODO : check if deepcopy needed
+  DeepCopy = 1
+
+  # setup points
+  hexahedronPoints = vtk.vtkPoints()
+  vtkNodeArray = vtkNumPy.numpy_to_vtk( bNekNodes, DeepCopy)
+  hexahedronPoints.SetData(vtkNodeArray)
+  hexahedronGrid.SetPoints(hexahedronPoints);
+
+  # setup elements
+  aHexahedron = vtk.vtkHexahedron()
+  HexCellType = aHexahedron.GetCellType()
+  vtkTypeArray     = vtkNumPy.numpy_to_vtk( HexCellType * numpy.ones(  numElems) ,DeepCopy,vtk.VTK_UNSIGNED_CHAR) 
+  #TODO: off by 1 indexing from npts, ie
+  #TODO: note vtkIdType vtkCellArray::InsertNextCell(vtkIdList *pts) 
+  #TODO:    this->InsertLocation += npts + 1;   (line 264)
+  vtkLocationArray = vtkNumPy.numpy_to_vtk( numpy.arange(0,numElems*(numHexPts+1),(numHexPts+1)) ,DeepCopy,vtk.VTK_ID_TYPE) 
+  vtkCells = vtk.vtkCellArray()
+  vtkElemArray     = vtkNumPy.numpy_to_vtk( bNekConnectivity  , DeepCopy,vtk.VTK_ID_TYPE)
+  vtkCells.SetCells(numElems,vtkElemArray)
+  hexahedronGrid.SetCells(vtkTypeArray,vtkLocationArray,vtkCells) 
+  print "done setting hex mesh with %d nodes %d elem"  % (numPoints,numElems)
+  return hexahedronGrid
+
+# Convenience Routine
+def ImagePointCoordinates(vtkImage):
+  """ coordinates of the image points, x fastest as in the vtk arrays """
+  origin  = vtkImage.GetOrigin()
+  spacing = vtkImage.GetSpacing()
+  extent  = vtkImage.GetExtent()
+  (kk,jj,ii) = numpy.mgrid[extent[4]:extent[5]+1,extent[2]:extent[3]+1,extent[0]:extent[1]+1]
+  return numpy.vstack( (origin[0] + spacing[0] * ii.ravel(),
+                        origin[1] + spacing[1] * jj.ravel(),
+                        origin[2] + spacing[2] * kk.ravel()) ).transpose()
+
+# Convenience Routine
+def BuildSEMProjection(hexahedronGrid,vtkImage,ImagePoints,AffineTransform):
+  """ interpolation weights from the registered SEM mesh to the image points """
+  ImportVTK()
+  # locate the image points w/ the cell data of a probe
+  numElems = hexahedronGrid.GetNumberOfCells()
+  locateGrid = vtk.vtkUnstructuredGrid()
+  locateGrid.ShallowCopy(hexahedronGrid)
+  vtkCellIdArray = vtkNumPy.numpy_to_vtk( numpy.arange(numElems,dtype=numpy.int32), 1)
+  vtkCellIdArray.SetName("cellid")
+  locateGrid.GetCellData().AddArray(vtkCellIdArray)
+  FixmeHackSEMRegister = vtk.vtkTransformFilter()
+  FixmeHackSEMRegister.SetInput( locateGrid )
+  FixmeHackSEMRegister.SetTransform(FIXMEHackTransform)
+  FixmeHackSEMRegister.Update()
+  SEMRegister = vtk.vtkTransformFilter()
+  SEMRegister.SetInput( FixmeHackSEMRegister.GetOutput() )
+  SEMRegister.SetTransform(AffineTransform)
+  SEMRegister.Update()
+  vtkLocate = vtk.vtkProbeFilter()
+  vtkLocate.SetSource( SEMRegister.GetOutput() )
+  vtkLocate.SetInput( vtkImage )
+  vtkLocate.Update()
+  locate_point_data = vtkLocate.GetOutput().GetPointData()
+  cellids   = vtkNumPy.vtk_to_numpy(locate_point_data.GetArray('cellid')).astype(numpy.int64)
+  validmask = vtkNumPy.vtk_to_numpy(locate_point_data.GetArray('vtkValidPointMask'))
+  cellids[validmask == 0] = -1
+  print "located %d of %d image points in the SEM mesh" % ((validmask != 0).sum(),validmask.size)
+
+  registerednodes = vtkNumPy.vtk_to_numpy(SEMRegister.GetOutput().GetPoints().GetData())
+  connectivity    = vtkNumPy.vtk_to_numpy(hexahedronGrid.GetCells().GetData()).reshape(numElems,9)[:,1:]
+  return meshprojection.HexahedronProjection(registerednodes,connectivity,cellids,ImagePoints)
+
+# Convenience Routine
+def CoolingInitialCondition(mrtifilename,voi,body_temp,cachedirectory):
+  """
+  MRTI initial condition for cooling blurred out of plane for a physical
+  temperature field. the smoothed image only depends on the study and the
+  body temperature and is stored in the cache directory
+  returns origin of image[0,0,0], spacing, and image (nz,ny,nx)
+  """
+  import hashlib
+  cachekey = hashlib.sha1(repr( (os.path.abspath(mrtifilename),mrtiio.ImageModificationTime(mrtifilename),
+                                 tuple(voi),'%.12e' % body_temp) )).hexdigest()
+  cachefilename = '%s/coolingic.%s.npz' % (cachedirectory,cachekey)
+  if ( os.path.isfile(cachefilename) ):
+    print 'reading initial condition', cachefilename
+    npzfile = numpy.load(cachefilename)
+    return (npzfile['origin'],npzfile['spacing'],npzfile['image'])
+
+  print 'initial condition opening' , mrtifilename 
+  (icorigin,spacing,extent,mrti_ic_array) = mrtiio.ReadStructuredPoints(mrtifilename,'image_data',voi)
+  spacing = numpy.array(spacing)
+  mrti_ic_image = mrti_ic_array.astype(numpy.float64).reshape(extent[5]-extent[4]+1,extent[3]-extent[2]+1,extent[1]-extent[0]+1)
+
+  # NOTE to keep the same MRTI values in plane
+  # NOTE   1. mirror pad out of plane in one pixel
+  # NOTE   2. constant pad out of plane in one pixel
+  # NOTE   3. gauss blur out of plane with 1 pixel std dev, the 3 pixel
+  # NOTE      kernel is truncated and renormalized at the boundary as in
+  # NOTE      vtkImageGaussianSmooth. the in plane std dev is negligible
+  bodytempslice = body_temp * numpy.ones((1,)+mrti_ic_image.shape[1:])
+  padimage = numpy.concatenate( (bodytempslice,mrti_ic_image[:1],mrti_ic_image,mrti_ic_image[-1:],bodytempslice), axis=0)
+  kernel = numpy.exp( -0.5 * numpy.array([1.,0.,1.]) )
+  smoothimage   = kernel[1] * padimage
+  normalization = kernel[1] * numpy.ones(padimage.shape[0])
+  smoothimage[1:]  = smoothimage[1:]  + kernel[0] * padimage[:-1]
+  smoothimage[:-1] = smoothimage[:-1] + kernel[2] * padimage[1:]
+  normalization[1:]  = normalization[1:]  + kernel[0]
+  normalization[:-1] = normalization[:-1] + kernel[2]
+  smoothimage = smoothimage / normalization[:,numpy.newaxis,numpy.newaxis]
+  origin = numpy.array(icorigin) + spacing * numpy.array([extent[0],extent[2],extent[4]-2])
+
+  # write to a temporary file first, concurrent evaluations
+  # may share the same output directory
+  tmpfilename = '%s.%d.tmp.npz' % (cachefilename[:-4],os.getpid())
+  numpy.savez(tmpfilename,origin=origin,spacing=spacing,image=smoothimage)
+  os.rename(tmpfilename,cachefilename)
+  return (origin,spacing,smoothimage)
+
 # Convenience Routine
 def WriteJPGOutputFiles(**visargs):
-    print 'opening' , visargs['magnitudefilename'] 
-    vtkMagnImageReader = vtk.vtkDataSetReader() 
-    vtkMagnImageReader.SetFileName( visargs['magnitudefilename'] )
-    vtkMagnImageReader.Update() 
+    ImportVTK()
+    # one renderer and pipeline is reused for all images and studies
+    global JPGRenderer
+    if ( JPGRenderer == None ):
+      JPGRenderer = JPGImageRenderer( VisRenderer == 'window' )
+    magnitudeImage = JPGRenderer.ReadMagnitudeImage( visargs['magnitudefilename'] )
     # display VOI outline
     vtkVOIExtract = vtk.vtkExtractVOI() 
-    vtkVOIExtract.SetInput( vtkMagnImageReader.GetOutput() ) 
+    vtkVOIExtract.SetInput( magnitudeImage ) 
     vtkVOIExtract.SetVOI( visargs['voi'] ) 
     vtkVOIExtract.Update()
-    
-    vtkOutline = vtk.vtkOutlineFilter() 
-    vtkOutline.SetInput( vtkVOIExtract.GetOutput() ) 
-    vtkOutline.Update()
-    
-    # slight rotation fixes vis bug/error
-    AffineTransform = vtk.vtkTransform()
-    AffineTransform.RotateX( 1.0 )
-    OutlineRegister = vtk.vtkTransformFilter()
-    OutlineRegister.SetInput( vtkOutline.GetOutput() )
-    OutlineRegister.SetTransform(AffineTransform)
-    OutlineRegister.Update()
 
-    # create actor to render VOI
-    outlineMapper = vtk.vtkPolyDataMapper(); 
-    outlineMapper.SetInput(OutlineRegister.GetOutput());
-    outlineActor = vtk.vtkActor(); 
-    outlineActor.SetMapper(outlineMapper); 
-    outlineActor.GetProperty().SetColor(1,1,1);
-    outlineActor.GetProperty().SetLineWidth(2);
-    outlineActor.GetProperty().SetRepresentationToWireframe();
-    outlineActor.GetProperty().SetRepresentationToPoints();
-    outlineActor.GetProperty().SetRepresentationToSurface();
+    # plot mrti, fem, and magn
+    for (lookuptable,legendname,sourceimage,outputname) in [  
+                           ('hue',"SEM" ,visargs['roisem']     ,'roisem' ),
+                           ('hue',"MRTI",visargs['roimrti']    ,'roimrti'),
+                           ('arr',"PDAM",visargs['roisemdose'] ,'roisemdose' ),
+                           ('arr',"MDAM",visargs['roimrtidose'],'roimrtidose'),
+                           ('bw' ,"Magn",magnitudeImage        ,"magn")]:
+      JPGRenderer.WriteJPG(sourceimage,lookuptable,legendname,vtkVOIExtract.GetOutput(),
+                           visargs['jpgoutnameformat'] % (outputname) )
+
+##################################################################
+class JPGImageRenderer:
+  """ Class for JPG output of image slices...  """
+  def __init__(self,UseRenderWindow):
+    # UseRenderWindow  render w/ a single offscreen vtkRenderWindow,
+    #                  otherwise the slices are colored w/ numpy and no
+    #                  display is needed, the colorbar has no title or
+    #                  labels
+    ImportVTK()
+    self.UseRenderWindow = UseRenderWindow
+    self.MagnitudeImages = {}
+    self.LookupTables    = {}
 
     # Start by creating a black/white lookup table.
     bwLut = vtk.vtkLookupTable()
@@ -411,6 +692,7 @@ def WriteJPGOutputFiles(**visargs):
     bwLut.SetHueRange (0, 0);
     bwLut.SetValueRange (0, 1);
     bwLut.Build(); #effective built
+    self.LookupTables['bw'] = bwLut
     # color table
     # http://www.vtk.org/doc/release/5.8/html/c2_vtk_e_3.html#c2_vtk_e_vtkLookupTable
     # http://vtk.org/gitweb?p=VTK.git;a=blob;f=Examples/ImageProcessing/Python/ImageSlicing.py
@@ -423,6 +705,7 @@ def WriteJPGOutputFiles(**visargs):
     hueLut.SetHueRange (0.667, 0.0)
     hueLut.SetRampToLinear ()
     hueLut.Build()
+    self.LookupTables['hue'] = hueLut
 
     # color table
     # http://www.vtk.org/doc/release/5.8/html/c2_vtk_e_3.html#c2_vtk_e_vtkLookupTable
@@ -436,49 +719,131 @@ def WriteJPGOutputFiles(**visargs):
     arrLut.SetHueRange (0.667, 0.0)
     arrLut.SetRampToLinear ()
     arrLut.Build()
-    # plot mrti, fem, and magn
-    for (lookuptable,legendname,sourceimage,outputname) in [  
-                           (hueLut,"SEM" ,visargs['roisem']     ,'roisem' ),
-                           (hueLut,"MRTI",visargs['roimrti']    ,'roimrti'),
-                           (arrLut,"PDAM",visargs['roisemdose'] ,'roisemdose' ),
-                           (arrLut,"MDAM",visargs['roimrtidose'],'roimrtidose'),
-                           (bwLut ,"Magn",vtkMagnImageReader.GetOutput(),"magn")]:
-      # colorbar
-      # http://www.vtk.org/doc/release/5.8/html/c2_vtk_e_3.html#c2_vtk_e_vtkLookupTable
-      scalarBar = vtk.vtkScalarBarActor()
-      scalarBar.SetTitle(legendname)
-      scalarBar.SetNumberOfLabels(4)
-      scalarBar.SetLookupTable(lookuptable)
-
-      # mapper
-      #mapper = vtk.vtkDataSetMapper()
-      mapper = vtk.vtkImageMapToColors()
-      mapper.SetInput(  sourceimage )
-      # set echo to display
-      mapper.SetActiveComponent( 0 )
-      mapper.SetLookupTable(lookuptable)
+    self.LookupTables['arr'] = arrLut
+
+    self.JPGWriter = vtk.vtkJPEGWriter() 
+    if ( not UseRenderWindow ):
+      return
+
+    # VOI outline, slight rotation fixes vis bug/error
+    self.Outline = vtk.vtkOutlineFilter() 
+    AffineTransform = vtk.vtkTransform()
+    AffineTransform.RotateX( 1.0 )
+    OutlineRegister = vtk.vtkTransformFilter()
+    OutlineRegister.SetInput( self.Outline.GetOutput() )
+    OutlineRegister.SetTransform(AffineTransform)
+
+    # create actor to render VOI
+    outlineMapper = vtk.vtkPolyDataMapper(); 
+    outlineMapper.SetInput(OutlineRegister.GetOutput());
+    outlineActor = vtk.vtkActor(); 
+    outlineActor.SetMapper(outlineMapper); 
+    outlineActor.GetProperty().SetColor(1,1,1);
+    outlineActor.GetProperty().SetLineWidth(2);
+    outlineActor.GetProperty().SetRepresentationToSurface();
+
+    # colorbar
+    # http://www.vtk.org/doc/release/5.8/html/c2_vtk_e_3.html#c2_vtk_e_vtkLookupTable
+    self.ScalarBar = vtk.vtkScalarBarActor()
+    self.ScalarBar.SetNumberOfLabels(4)
+
+    # mapper
+    self.ColorMapper = vtk.vtkImageMapToColors()
+    # set echo to display
+    self.ColorMapper.SetActiveComponent( 0 )
   
-      # actor
-      actor = vtk.vtkImageActor()
-      actor.SetInput(mapper.GetOutput())
+    # actor
+    actor = vtk.vtkImageActor()
+    actor.SetInput(self.ColorMapper.GetOutput())
        
-      # assign actor to the renderer
-      ren = vtk.vtkRenderer()
-      ren.AddActor(actor)
-      ren.AddActor(outlineActor)
-      ren.AddActor2D(scalarBar)
-      renWin = vtk.vtkRenderWindow()
-      renWin.AddRenderer(ren)
-      renWin.SetSize(512,512)
-      renWin.Render()
-
-      windowToImage = vtk.vtkWindowToImageFilter() 
-      windowToImage.SetInput(renWin)
-      windowToImage.Update()
-      jpgWriter     = vtk.vtkJPEGWriter() 
-      jpgWriter.SetFileName( visargs['jpgoutnameformat'] % (outputname) )
-      jpgWriter.SetInput(windowToImage.GetOutput())
-      jpgWriter.Write()
+    # assign actor to the renderer
+    self.Renderer = vtk.vtkRenderer()
+    self.Renderer.AddActor(actor)
+    self.Renderer.AddActor(outlineActor)
+    self.Renderer.AddActor2D(self.ScalarBar)
+    self.RenderWindow = vtk.vtkRenderWindow()
+    self.RenderWindow.SetOffScreenRendering(1)
+    self.RenderWindow.AddRenderer(self.Renderer)
+    self.RenderWindow.SetSize(512,512)
+
+    self.WindowToImage = vtk.vtkWindowToImageFilter() 
+    self.WindowToImage.SetInput(self.RenderWindow)
+    self.JPGWriter.SetInput(self.WindowToImage.GetOutput())
+
+  def ReadMagnitudeImage(self,magnitudefilename):
+    """ magnitude images are read once """
+    if ( magnitudefilename not in self.MagnitudeImages ):
+      print 'opening' , magnitudefilename 
+      vtkMagnImageReader = vtk.vtkDataSetReader() 
+      vtkMagnImageReader.SetFileName( magnitudefilename )
+      vtkMagnImageReader.Update() 
+      magnitudeImage = vtk.vtkImageData()
+      magnitudeImage.DeepCopy( vtkMagnImageReader.GetOutput() )
+      self.MagnitudeImages[magnitudefilename] = magnitudeImage
+    return self.MagnitudeImages[magnitudefilename]
+
+  def WriteJPG(self,sourceimage,lookuptablename,legendname,voiimage,jpgfilename):
+    """ first slice of the image w/ the VOI outline and a colorbar """
+    lookuptable = self.LookupTables[lookuptablename]
+    if ( self.UseRenderWindow ):
+      self.Outline.SetInput( voiimage ) 
+      self.ColorMapper.SetInput( sourceimage )
+      self.ColorMapper.SetLookupTable( lookuptable )
+      self.ScalarBar.SetTitle( legendname )
+      self.ScalarBar.SetLookupTable( lookuptable )
+      self.Renderer.ResetCamera()
+      self.RenderWindow.Render()
+      self.WindowToImage.Modified()
+    else:
+      self.JPGWriter.SetInput( self.ColorSlice(sourceimage,lookuptable,voiimage) )
+    print "writing ", jpgfilename 
+    self.JPGWriter.SetFileName( jpgfilename )
+    self.JPGWriter.Write()
+
+  def ColorSlice(self,sourceimage,lookuptable,voiimage):
+    """ RGB image of the first slice, VOI outline, and unlabeled colorbar """
+    extent  = sourceimage.GetExtent()
+    origin  = numpy.array(sourceimage.GetOrigin())
+    spacing = numpy.array(sourceimage.GetSpacing())
+    (nx,ny) = (extent[1]-extent[0]+1,extent[3]-extent[2]+1)
+    scalars = vtkNumPy.vtk_to_numpy(sourceimage.GetPointData().GetScalars())
+    if ( len(scalars.shape) > 1 ):
+      scalars = scalars[:,0]
+    imageslice = scalars[:nx*ny].reshape(ny,nx).astype(numpy.float64)
+
+    # lookup table colors, the scalar range is mapped to the table entries
+    colortable = vtkNumPy.vtk_to_numpy(lookuptable.GetTable())[:,:3]
+    (rangemin,rangemax) = lookuptable.GetTableRange()
+    def MapColors(values):
+      tableindex = (values - rangemin) / (rangemax - rangemin) * colortable.shape[0]
+      return colortable[ numpy.clip(tableindex,0,colortable.shape[0]-1).astype(numpy.int64) ]
+
+    # upsample to about the size of the render window
+    scale = max(1, 512 / max(nx,ny) )
+    rgbslice = MapColors(imageslice).repeat(scale,axis=0).repeat(scale,axis=1)
+
+    # VOI outline in white
+    voibounds = voiimage.GetBounds()
+    lower = numpy.round( ( numpy.array(voibounds[0::2]) - origin) / spacing - numpy.array(extent[0::2]) ).astype(numpy.int64)[:2]
+    upper = numpy.round( ( numpy.array(voibounds[1::2]) - origin) / spacing - numpy.array(extent[0::2]) ).astype(numpy.int64)[:2]
+    (x0,y0) = numpy.clip(lower*scale            , 0, [nx*scale-1,ny*scale-1])
+    (x1,y1) = numpy.clip(upper*scale + scale - 1, 0, [nx*scale-1,ny*scale-1])
+    rgbslice[y0:y1+1,[x0,x1]] = 255
+    rgbslice[[y0,y1],x0:x1+1] = 255
+
+    # colorbar, minimum at the bottom
+    barwidth = max(4, rgbslice.shape[1]/16)
+    colorbar = MapColors( numpy.linspace(rangemin,rangemax,rgbslice.shape[0]) )[:,numpy.newaxis,:].repeat(barwidth,axis=1)
+    gap      = numpy.zeros((rgbslice.shape[0],barwidth/2,3),dtype=rgbslice.dtype)
+    rgbslice = numpy.concatenate( (rgbslice,gap,colorbar), axis=1)
+
+    vtkRGBImage = vtk.vtkImageData()
+    vtkRGBImage.SetDimensions( rgbslice.shape[1], rgbslice.shape[0], 1 )
+    vtkRGBImage.SetScalarTypeToUnsignedChar()
+    vtkRGBImage.SetNumberOfScalarComponents(3)
+    vtkRGBArray = vtkNumPy.numpy_to_vtk( numpy.ascontiguousarray(rgbslice.reshape(-1,3),dtype=numpy.uint8), 1) 
+    vtkRGBImage.GetPointData().SetScalars(vtkRGBArray)
+    return vtkRGBImage
 
 ##################################################################
 ##################################################################
@@ -495,19 +860,10 @@ class ImageDoseHelper:
     self.DeltaT               = DeltaT               
 
     # open image and extract VOI for a reference
-    vtkImageReader = vtk.vtkDataSetReader() 
-    vtkImageReader.SetFileName(ImageFileNameExample )
-    vtkImageReader.Update() 
-    
-    # extract voi for QOI
-    vtkVOIExtract = vtk.vtkExtractVOI() 
-    vtkVOIExtract.SetInput( vtkImageReader.GetOutput() ) 
-    vtkVOIExtract.SetVOI( VOISizeInfo ) 
-    vtkVOIExtract.Update()
+    (imageorigin,imagespacing,voiextent,voi_array) = mrtiio.ReadStructuredPoints(ImageFileNameExample,None,VOISizeInfo)
     # VOI Origin should be at the lower bound
-    VOIBounds = vtkVOIExtract.GetOutput().GetBounds()
-    self.origin               = (VOIBounds[0],VOIBounds[2],VOIBounds[4])
-    self.spacing              = vtkVOIExtract.GetOutput().GetSpacing()
+    self.origin               = tuple([imageorigin[idaxis] + imagespacing[idaxis] * voiextent[2*idaxis] for idaxis in range(3)])
+    self.spacing              = imagespacing
 
     # initialize dose map
     self.dimensions = [(VOISizeInfo[1] - VOISizeInfo[0]+1) , 
@@ -519,6 +875,13 @@ class ImageDoseHelper:
 
   def UpdateDoseMap(self,NumpyTemperatureData ):
     """ update dose map with temperature """
+    self.AccumulateDose(NumpyTemperatureData )
+
+    # return vtk format for write (as single precision)
+    return self.ConvertNumpyVTKImage(self.PredictedDamage.astype(numpy.float32))
+
+  def AccumulateDose(self,NumpyTemperatureData ):
+    """ update dose map with temperature w/o the vtk image """
     #  input should be temperature in degC
     #  convert to Kelvin (using double precision)
     TemperatureKelvin = NumpyTemperatureData.astype(numpy.float) + self.BaseTemperature
@@ -526,11 +889,9 @@ class ImageDoseHelper:
     #  A exp ( - E_a/ (RT)  ) \Delta t
     self.PredictedDamage = self.PredictedDamage + self.ActivationEnergy * numpy.exp(- self.FrequencyFactor/self.GasConstant * numpy.reciprocal( TemperatureKelvin )) * self.DeltaT;
 
-    # return vtk format for write (as single precision)
-    return self.ConvertNumpyVTKImage(self.PredictedDamage.astype(numpy.float32))
-
   # write a numpy data to disk in vtk format
   def ConvertNumpyVTKImage(self,NumpyImageData):
+    ImportVTK()
     # Create initial image
     dim = self.dimensions
     # imports raw data and stores it.
@@ -560,8 +921,52 @@ class ImageDoseHelper:
     dataImporter.SetScalarArrayName("arrayname")
     return dataImporter.GetOutput()
 
+##################################################################
+class SEMHistoryStore:
+  """ Class for storage of the SEM temperature history at MRTI times...  """
+  def __init__(self,SEMDataDirectory,**kwargs):
+    # the SEM history depends only on the physics parameters.
+    # for cooling the MRTI initial condition is registered to the mesh
+    # w/ the rigid transform, so the registration variables matter
+    ICFromMRTI = (kwargs['opttype'] == 'cooling')
+    physicsvars = sorted([ (varname,'%.12e' % float(varvalue))
+                             for (varname,varvalue) in kwargs['cv'].items()
+                             if ICFromMRTI or varname not in RegistrationVariableList ])
+    keystring = repr( (physicsvars, ICFromMRTI,
+                       tuple(kwargs['timeinterval']), kwargs['mrtideltat'],
+                       kwargs['powerhistory']) )
+    import hashlib
+    self.HistoryKey      = hashlib.sha1(keystring).hexdigest()
+    self.HistoryFileName = '%s/semhistory.%s.npz' % (SEMDataDirectory,self.HistoryKey)
+
+  def IsStored(self):
+    return os.path.isfile(self.HistoryFileName)
+
+  def Load(self):
+    """ return nodes, connectivity, and temperature history dictionary """
+    print 'reading SEM history', self.HistoryFileName
+    npzfile = numpy.load(self.HistoryFileName)
+    SEMHistory = dict( zip( npzfile['timeid'], npzfile['temperature'] ) )
+    return (npzfile['nodes'],npzfile['connectivity'],SEMHistory)
+
+  def Save(self,bNekNodes,bNekConnectivity,SEMHistory):
+    """ store history as single precision """
+    timeidlist = sorted(SEMHistory.keys())
+    temperature = numpy.array([SEMHistory[timeid] for timeid in timeidlist],dtype=numpy.float32)
+    # write to a temporary file first, concurrent evaluations
+    # may share the same output directory
+    tmpfilename = '%s.%d.tmp.npz' % (self.HistoryFileName[:-4],os.getpid())
+    numpy.savez_compressed(tmpfilename,
+                           nodes        = bNekNodes,
+                           connectivity = bNekConnectivity,
+                           timeid       = numpy.array(timeidlist,dtype=numpy.int32),
+                           temperature  = temperature)
+    os.rename(tmpfilename,self.HistoryFileName)
+    print 'wrote SEM history', self.HistoryFileName
+
 
 def ForwardSolve(**kwargs):
+  ImportVTK()
   ObjectiveFunction = 0.0
   # Debugging flags
   DebugObjective = True
@@ -575,8 +980,6 @@ def ForwardSolve(**kwargs):
   setup = brainNekLibrary.PySetupAide(outputSetupRCFile )
   brainNek = brainNekLibrary.PyBrain3d(setup);
 
-  # setup vtkUnstructuredGrid
-  hexahedronGrid   = vtk.vtkUnstructuredGrid()
   numPoints = brainNek.GetNumberOfNodes( ) 
   numElems  = brainNek.GetNumberOfElements( ) 
   # initialize nodes and connectivity
@@ -591,30 +994,12 @@ def ForwardSolve(**kwargs):
   # reshape for convenience
   bNekNodes        = bNekNodes.reshape(      numPoints , 3)
 
+  # setup vtkUnstructuredGrid
+  hexahedronGrid = BuildHexahedronGrid(bNekNodes,bNekConnectivity)
+
   # TODO : check if deepcopy needed
   DeepCopy = 1
 
-  #hexahedronGrid.DebugOn()
-  # setup points
-  hexahedronPoints = vtk.vtkPoints()
-  vtkNodeArray = vtkNumPy.numpy_to_vtk( bNekNodes, DeepCopy)
-  hexahedronPoints.SetData(vtkNodeArray)
-  hexahedronGrid.SetPoints(hexahedronPoints);
-
-  # setup elements
-  aHexahedron = vtk.vtkHexahedron()
-  HexCellType = aHexahedron.GetCellType()
-  vtkTypeArray     = vtkNumPy.numpy_to_vtk( HexCellType * numpy.ones(  numElems) ,DeepCopy,vtk.VTK_UNSIGNED_CHAR) 
-  #TODO: off by 1 indexing from npts, ie
-  #TODO: note vtkIdType vtkCellArray::InsertNextCell(vtkIdList *pts) 
-  #TODO:    this->InsertLocation += npts + 1;   (line 264)
-  vtkLocationArray = vtkNumPy.numpy_to_vtk( numpy.arange(0,numElems*(numHexPts+1),(numHexPts+1)) ,DeepCopy,vtk.VTK_ID_TYPE) 
-  vtkCells = vtk.vtkCellArray()
-  vtkElemArray     = vtkNumPy.numpy_to_vtk( bNekConnectivity  , DeepCopy,vtk.VTK_ID_TYPE)
-  vtkCells.SetCells(numElems,vtkElemArray)
-  hexahedronGrid.SetCells(vtkTypeArray,vtkLocationArray,vtkCells) 
-  print "done setting hex mesh with %d nodes %d elem"  % (numPoints,numElems)
-
   # setup solution
   bNekSoln = numpy.zeros(numPoints,dtype=numpy.float32)
   brainNek.getHostTemperature(bNekSoln )
@@ -752,24 +1137,126 @@ def ForwardSolve(**kwargs):
   return ObjectiveFunction 
 # end def ForwardSolve:
 ##################################################################
-def ComputeObjective(**kwargs):
-  ObjectiveFunction = 0.0
-  dicevalue = 0.0
-  # Debugging flags
-  DebugObjective = False
-  DebugObjective = True
+# Convenience Routine
+def RegistrationTransform(variableDictionary):
+  """
+  rigid transform registering the SEM data to MRTI
+  """
+  ImportVTK()
+  AffineTransform = vtk.vtkTransform()
+  AffineTransform.Translate([ 
+    float(variableDictionary['x_displace']),
+    float(variableDictionary['y_displace']),
+    float(variableDictionary['z_displace'])
+                            ])
+  # FIXME  notice that order of operations is IMPORTANT
+  # FIXME   translation followed by rotation will give different results
+  # FIXME   than rotation followed by translation
+  # FIXME  Translate -> RotateZ -> RotateY -> RotateX -> Scale seems to be the order of paraview
+  AffineTransform.RotateZ( float(variableDictionary['z_rotate'  ] ) ) 
+  AffineTransform.RotateY( float(variableDictionary['y_rotate'  ] ) )
+  AffineTransform.RotateX( float(variableDictionary['x_rotate'  ] ) )
+  AffineTransform.Scale([1.e0,1.e0,1.e0])
+  return AffineTransform
 
-  # initialize brainNek
+# Convenience Routine
+def VOIImageData(origin,spacing,extent,image_array):
+  """ vtkImageData of a voi w/ the image_data point array, as vtkExtractVOI """
+  ImportVTK()
+  # TODO : check if deepcopy needed
+  DeepCopy = 1
+  vtkVOIImage = vtk.vtkImageData()
+  vtkVOIImage.SetOrigin( origin )
+  vtkVOIImage.SetSpacing( spacing )
+  vtkVOIImage.SetExtent( extent )
+  vtkVOIImage.SetWholeExtent( extent )
+  vtkImageArray = vtkNumPy.numpy_to_vtk( image_array, DeepCopy) 
+  vtkImageArray.SetName("image_data") 
+  vtkVOIImage.GetPointData().SetScalars(vtkImageArray)
+  return vtkVOIImage
+
+# Convenience Routine
+def ReadMRTIVOI(mrtidirectory,MRTItimeID,voi,MRTICache):
+  """
+  MRTI voi image and temperature array at a time instance
+  evaluations in the same process share the cache dictionary
+  """
+  cachekey = (mrtidirectory,MRTItimeID,tuple(voi))
+  if ( cachekey not in MRTICache ):
+    mrtifilename = '%s/temperature.%04d.vtk' % (mrtidirectory, MRTItimeID) 
+    if ( not mrtiio.ImageExists(mrtifilename) and MRTIWaitTime > 0.0 ):
+      # frame of an acquisition in progress
+      waitstart = time.time()
+      if ( mrtiio.WaitForImage(mrtifilename,MRTIWaitTime) ):
+        print 'waited %f s for' % (time.time()-waitstart), mrtifilename
+    found = mrtiio.ImageExists(mrtifilename )
+    if ( found ):
+      print 'opening' , mrtifilename 
+    else:
+      print '#####NOT FOUND' , mrtifilename 
+      print '#####USING DEFAULT at time 0' 
+      mrtifilename = '%s/temperature.%04d.vtk' % (mrtidirectory, 0) 
+    # read the voi slab only
+    (mrtiorigin,mrtispacing,voiextent,mrti_array) = mrtiio.ReadStructuredPoints(mrtifilename,'image_data',voi)
+    vtkMRTIImage = VOIImageData(mrtiorigin,mrtispacing,voiextent,mrti_array)
+    if ( not found ):
+      # the frame may still arrive, the default is not cached
+      return (vtkMRTIImage,mrti_array)
+    MRTICache[cachekey] = (vtkMRTIImage,mrti_array)
+  return MRTICache[cachekey]
+
+##################################################################
+# brainNek solvers of this process, one per GPU device. an evaluation w/ the
+# same case file (materials, temperatures, probe) on the device resets the
+# state of the previous solver instead of reloading the mesh and rebuilding
+# the operators and kernels, ie a cooling registration or power history change
+BrainNekSolvers = {}
+
+# Convenience Routine
+def BrainNekSolver(setuprcfilename,solverkey,finaltime):
+  """ new or reset brainNek solver, solverkey = (case file, GPU device) """
+  (casefilename,GPUDeviceID) = solverkey
+  if ( GPUDeviceID in BrainNekSolvers and BrainNekSolvers[GPUDeviceID][0] == casefilename ):
+    (casefilename,setup,brainNek,initialtemperature,initialforcing) = BrainNekSolvers[GPUDeviceID]
+    print 'reusing brainNek solver', casefilename, 'on device', GPUDeviceID
+    brainNek.ResetState(initialtemperature,initialforcing)
+    brainNek.SetFinalTime(finaltime)
+    return brainNek
+  # release the previous solver on the device first
+  if ( GPUDeviceID in BrainNekSolvers ):
+    del BrainNekSolvers[GPUDeviceID]
   # CYTHON AND VTK NEED TO BUILD with the same PYTHON INCLUDE and LIB 
   import brainNekLibrary
-  # setuprc file
-  outputSetupRCFile = '%s/setuprc.%04d' % (workDirectory,kwargs['fileID'])
-  setup = brainNekLibrary.PySetupAide(outputSetupRCFile )
+  setup = brainNekLibrary.PySetupAide(setuprcfilename )
   brainNek = brainNekLibrary.PyBrain3d(setup);
+  # initial state for reuse
+  initialtemperature = numpy.zeros(brainNek.GetNumberOfNodes(),dtype=numpy.float32)
+  initialforcing     = numpy.zeros(brainNek.GetNumberOfNodes(),dtype=numpy.float32)
+  brainNek.getHostTemperature(initialtemperature)
+  brainNek.getHostForcing(    initialforcing    )
+  BrainNekSolvers[GPUDeviceID] = (casefilename,setup,brainNek,initialtemperature,initialforcing)
+  return brainNek
+
+def SolveSEMHistory(**kwargs):
+  """
+  run brainNek and store the SEM temperature at the MRTI times
+  """
+  ImportVTK()
+  # Debugging flags
+  DebugObjective = False
+  DebugObjective = True
+  # the perturbed solves of the finite difference gradient write no debug output
+  DebugObjective = kwargs.get('debugobjective',DebugObjective)
+
+  # FIXME  should this be different ?  
+  SEMDataDirectory = outputDirectory % kwargs['UID']
 
+  # write brainNek setup files
+  (outputSetupRCFile,solverkey) = brainNekWrapper(**kwargs)
+
+  # initialize brainNek
+  brainNek = BrainNekSolver(outputSetupRCFile,solverkey,kwargs['finaltime'])
 
-  # setup vtkUnstructuredGrid
-  hexahedronGrid   = vtk.vtkUnstructuredGrid()
   numPoints = brainNek.GetNumberOfNodes( ) 
   numElems  = brainNek.GetNumberOfElements( ) 
   # initialize nodes and connectivity
@@ -783,47 +1270,14 @@ def ComputeObjective(**kwargs):
   brainNek.GetElements(bNekConnectivity);
   # reshape for convenience
   bNekNodes        = bNekNodes.reshape(      numPoints , 3)
+  SEMHistory       = {}
 
-  ## # setup elements
-  ## bNekConnectivityreshape = bNekConnectivity.reshape(numElems , numHexPts +1)
-  ## for ielem in range(numElems ):
-  ##   aHexahedron = vtk.vtkHexahedron()
-  ##   # print 'number of nodes %d ' % bNekConnectivityreshape[ielem][0]
-  ##   aHexahedron.GetPointIds().SetId(0,bNekConnectivityreshape[ielem][1])
-  ##   aHexahedron.GetPointIds().SetId(1,bNekConnectivityreshape[ielem][2])
-  ##   aHexahedron.GetPointIds().SetId(2,bNekConnectivityreshape[ielem][3])
-  ##   aHexahedron.GetPointIds().SetId(3,bNekConnectivityreshape[ielem][4])
-  ##   aHexahedron.GetPointIds().SetId(4,bNekConnectivityreshape[ielem][5])
-  ##   aHexahedron.GetPointIds().SetId(5,bNekConnectivityreshape[ielem][6])
-  ##   aHexahedron.GetPointIds().SetId(6,bNekConnectivityreshape[ielem][7])
-  ##   aHexahedron.GetPointIds().SetId(7,bNekConnectivityreshape[ielem][8])
-  ##   hexahedronGrid.InsertNextCell(aHexahedron.GetCellType(),
-  ##                                 aHexahedron.GetPointIds())
+  # setup vtkUnstructuredGrid
+  hexahedronGrid = BuildHexahedronGrid(bNekNodes,bNekConnectivity)
 
   # TODO : check if deepcopy needed
   DeepCopy = 1
 
-  #hexahedronGrid.DebugOn()
-  # setup points
-  hexahedronPoints = vtk.vtkPoints()
-  vtkNodeArray = vtkNumPy.numpy_to_vtk( bNekNodes, DeepCopy)
-  hexahedronPoints.SetData(vtkNodeArray)
-  hexahedronGrid.SetPoints(hexahedronPoints);
-
-  # setup elements
-  aHexahedron = vtk.vtkHexahedron()
-  HexCellType = aHexahedron.GetCellType()
-  vtkTypeArray     = vtkNumPy.numpy_to_vtk( HexCellType * numpy.ones(  numElems) ,DeepCopy,vtk.VTK_UNSIGNED_CHAR) 
-  #TODO: off by 1 indexing from npts, ie
-  #TODO: note vtkIdType vtkCellArray::InsertNextCell(vtkIdList *pts) 
-  #TODO:    this->InsertLocation += npts + 1;   (line 264)
-  vtkLocationArray = vtkNumPy.numpy_to_vtk( numpy.arange(0,numElems*(numHexPts+1),(numHexPts+1)) ,DeepCopy,vtk.VTK_ID_TYPE) 
-  vtkCells = vtk.vtkCellArray()
-  vtkElemArray     = vtkNumPy.numpy_to_vtk( bNekConnectivity  , DeepCopy,vtk.VTK_ID_TYPE)
-  vtkCells.SetCells(numElems,vtkElemArray)
-  hexahedronGrid.SetCells(vtkTypeArray,vtkLocationArray,vtkCells) 
-  print "done setting hex mesh with %d nodes %d elem"  % (numPoints,numElems)
-
   # setup solution
   bNekSoln = numpy.zeros(numPoints,dtype=numpy.float32)
   brainNek.getHostTemperature(bNekSoln )
@@ -870,48 +1324,14 @@ def ComputeObjective(**kwargs):
   ## # dbg 
   ## brainNek.screenshot( 0.0 )
 
-  # get registration parameters
-  variableDictionary = kwargs['cv']
-
   # register the SEM data to MRTI
-  AffineTransform = vtk.vtkTransform()
-  AffineTransform.Translate([ 
-    float(variableDictionary['x_displace']),
-    float(variableDictionary['y_displace']),
-    float(variableDictionary['z_displace'])
-                            ])
-  # FIXME  notice that order of operations is IMPORTANT
-  # FIXME   translation followed by rotation will give different results
-  # FIXME   than rotation followed by translation
-  # FIXME  Translate -> RotateZ -> RotateY -> RotateX -> Scale seems to be the order of paraview
-  AffineTransform.RotateZ( float(variableDictionary['z_rotate'  ] ) ) 
-  AffineTransform.RotateY( float(variableDictionary['y_rotate'  ] ) )
-  AffineTransform.RotateX( float(variableDictionary['x_rotate'  ] ) )
-  AffineTransform.Scale([1.e0,1.e0,1.e0])
-
-  # FIXME  should this be different ?  
-  SEMDataDirectory = outputDirectory % kwargs['UID']
-
-  ## vtkSEMReader = vtk.vtkXMLUnstructuredGridReader()
-  ## SEMDataDirectory = outputDirectory % kwargs['UID']
-  ## SEMtimeID = 0 
-  ## vtufileName = "%s/%d.vtu" % (SEMDataDirectory,SEMtimeID)
-  ## print "reading ", vtufileName 
-  ## vtkSEMReader.SetFileName( vtufileName )
-  ## vtkSEMReader.SetPointArrayStatus("Temperature",1)
-  ## vtkSEMReader.Update()
-  ## fem_point_data= vtkSEMReader.GetOutput().GetPointData() 
-  ## tmparray = vtkNumPy.vtk_to_numpy(fem_point_data.GetArray('Temperature')) 
+  AffineTransform = RegistrationTransform(kwargs['cv'])
 
   print " brainNek deltat:", brainNek.dt()
 
   # setup MRTI data read
-  MRTIInterval = fem_params['mrtideltat'] 
-  MRTItimeID   = fem_params['timeinterval'][0]
-
-  # initialize image dose
-  semDose  = ImageDoseHelper(  kwargs['voi'], MRTIInterval ,'%s/temperature.0001.vtk' % (kwargs['mrti']))
-  mrtiDose = ImageDoseHelper(  kwargs['voi'], MRTIInterval ,'%s/temperature.0001.vtk' % (kwargs['mrti']))
+  MRTIInterval = kwargs['mrtideltat'] 
+  MRTItimeID   = kwargs['timeinterval'][0]
 
   # setup screen shot interval 
   screenshotNum = 1;
@@ -922,62 +1342,42 @@ def ComputeObjective(**kwargs):
   if(kwargs['opttype'] == 'cooling'): 
     # load mrti for initial condition 
     mrtifilename = '%s/temperature.%04d.vtk' % ( kwargs['mrti'], MRTItimeID ) 
-    print 'initial condition opening' , mrtifilename 
-    vtkICImageReader = vtk.vtkDataSetReader() 
-    vtkICImageReader.SetFileName(mrtifilename )
-    vtkICImageReader.Update() 
-    vtkICVOIExtract = vtk.vtkExtractVOI() 
-    vtkICVOIExtract.SetInput( vtkICImageReader.GetOutput() ) 
-    vtkICVOIExtract.SetVOI( kwargs['voi'] ) 
-    vtkICVOIExtract.Update()
-    # blur out of plane for physical temperature field
-    imagevoiextents = list(vtkICVOIExtract.GetOutput().GetExtent())
-    imagevoiextents [4] = imagevoiextents [4] - 1 
-    imagevoiextents [5] = imagevoiextents [5] + 1 
-    # NOTE to keep the same MRTI values in plane
-    # NOTE   1. mirror pad out of plane in one pixel
-    # NOTE   2. constant pad out of plane in one pixel
-    # NOTE   3. gauss blur with 1 pixel std dev
-    vtkMirrorPad = vtk.vtkImageMirrorPad() 
-    vtkMirrorPad.SetOutputWholeExtent( imagevoiextents ) 
-    vtkMirrorPad.SetInput( vtkICVOIExtract.GetOutput() ) 
-    imagevoiextents [4] = imagevoiextents [4] - 1 
-    imagevoiextents [5] = imagevoiextents [5] + 1 
-    vtkImagePad = vtk.vtkImageConstantPad() 
-    vtkImagePad.SetOutputWholeExtent( imagevoiextents ) 
-    vtkImagePad.SetInput( vtkMirrorPad.GetOutput() ) 
     body_temp = float(kwargs['cv']['body_temp']) 
-    vtkImagePad.SetConstant( body_temp ) 
-    GaussSmooth = vtk.vtkImageGaussianSmooth()
-    GaussSmooth.SetInput( vtkImagePad.GetOutput() ) 
-    GaussSmooth.SetStandardDeviations( 1.e-6,1.e-6,1 ) 
-    #GaussSmooth.SetRadiusFactors( 1,1,1.5 )
-    # register and resample the MRTI onto the SEM mesh
-    ICSEMRegister = vtk.vtkTransformFilter()
-    ICSEMRegister.SetInput( hexahedronGrid )
-    ICSEMRegister.SetTransform(AffineTransform)
-    ICSEMRegister.Update()
-    vtkICResample = vtk.vtkProbeFilter()
-    vtkICResample.SetSource( GaussSmooth.GetOutput() )
-    vtkICResample.SetInput( ICSEMRegister.GetOutput() ) 
-    vtkICResample.Update()
-    mrti_ic_point_data= vtkICResample.GetUnstructuredGridOutput().GetPointData() 
-    mrti_ic_array = vtkNumPy.vtk_to_numpy(mrti_ic_point_data.GetArray('image_data')) 
+    (icorigin,icspacing,icimage) = CoolingInitialCondition(mrtifilename,kwargs['voi'],body_temp,SEMDataDirectory)
+    # register and interpolate the MRTI onto the SEM mesh
+    (rotation,derivatives) = meshprojection.RotationMatrices(
+                 [float(kwargs['cv'][varname]) for varname in RegistrationVariableList[3:6]])
+    translation = numpy.array([float(kwargs['cv'][varname]) for varname in RegistrationVariableList[0:3]])
+    registerednodes = numpy.dot(bNekNodes.astype(numpy.float64),rotation.T) + translation
+    mrti_ic_array = meshprojection.ImageTrilinearInterpolation(icorigin,icspacing,icimage,registerednodes)
     # threshold by body temp
     mrti_ic_array[ mrti_ic_array < body_temp ] = body_temp  
+    mrti_ic_array = mrti_ic_array.astype(numpy.float32)
     brainNek.setDeviceTemperature( mrti_ic_array )
     # write output
     if ( DebugObjective ):
       # check gauss image
-      WriteVTKOutputFile ( GaussSmooth.GetOutput()   ,"%s/gauss.%s.%04d.vtk"   % (SEMDataDirectory,kwargs['opttype'],MRTItimeID))
-
+      vtkGaussImage = vtk.vtkImageData()
+      vtkGaussImage.SetOrigin( icorigin )
+      vtkGaussImage.SetSpacing( icspacing )
+      vtkGaussImage.SetDimensions( icimage.shape[::-1] )
+      vtkGaussArray = vtkNumPy.numpy_to_vtk( icimage.ravel(), DeepCopy) 
+      vtkGaussArray.SetName("image_data") 
+      vtkGaussImage.GetPointData().SetScalars(vtkGaussArray)
+      WriteVTKOutputFile ( vtkGaussImage ,"%s/gauss.%s.%04d.vtk"   % (SEMDataDirectory,kwargs['opttype'],MRTItimeID))
+
+      ICSEMRegister = vtk.vtkTransformFilter()
+      ICSEMRegister.SetInput( hexahedronGrid )
+      ICSEMRegister.SetTransform(AffineTransform)
+      ICSEMRegister.Update()
+      vtkICArray = vtkNumPy.numpy_to_vtk( mrti_ic_array, DeepCopy) 
+      vtkICArray.SetName("image_data") 
+      ICSEMRegister.GetOutput().GetPointData().AddArray(vtkICArray)
       vtkSEMWriter = vtk.vtkXMLUnstructuredGridWriter()
       semfileName = "%s/semtransform.%04d.vtu" % (SEMDataDirectory,MRTItimeID)
       print "writing ", semfileName 
       vtkSEMWriter.SetFileName( semfileName )
-      #vtkSEMWriter.SetInput(hexahedronGrid )
-      vtkSEMWriter.SetInput(vtkICResample.GetUnstructuredGridOutput())
-      #vtkSEMWriter.SetDataModeToAscii()
+      vtkSEMWriter.SetInput(ICSEMRegister.GetOutput())
       vtkSEMWriter.Update()
 
       # verify temperature on  brainNek data structures 
@@ -1001,10 +1401,10 @@ def ComputeObjective(**kwargs):
   brainNek.PrintSelf()
 
   ## loop over time
-  currentTime = fem_params['initialtime'] 
+  currentTime = kwargs['initialtime'] 
   ## FIXME timing errors
   PowerLambdaFunction = kwargs['lambdacode']
-  for MRTItimeID in range(fem_params['timeinterval'][0]+1,fem_params['timeinterval'][1]):
+  for MRTItimeID in range(kwargs['timeinterval'][0]+1,kwargs['timeinterval'][1]):
 
     while( currentTime  < (MRTItimeID +1)*MRTIInterval ) :
       currentTime  = currentTime + brainNek.dt()
@@ -1015,101 +1415,238 @@ def ComputeObjective(**kwargs):
       ##    screenshotNum = screenshotNum + 1;
       ##    print "get host data",bNekSoln 
 
-    # load image 
-    mrtifilename = '%s/temperature.%04d.vtk' % (kwargs['mrti'], MRTItimeID) 
-    if (os.path.isfile(mrtifilename ) ):
-      print 'opening' , mrtifilename , currentTime
+    # store brainNek solution 
+    brainNek.getHostTemperature( bNekSoln )
+    SEMHistory[MRTItimeID] = bNekSoln.copy()
+
+  # store the SEM history for registration only re-evaluation
+  SEMHistoryStore(SEMDataDirectory,**kwargs).Save(bNekNodes,bNekConnectivity,SEMHistory)
+  return (bNekNodes,bNekConnectivity,SEMHistory)
+# end def SolveSEMHistory:
+##################################################################
+def SolvePennesHistory(**kwargs):
+  """
+  pennes finite difference temperature on the MRTI VOI at the MRTI times
+  the laser tip is registered to the MRTI w/ the SEM transform
+  """
+  ImportVTK()
+  # FIXME  should this be different ?  
+  SEMDataDirectory = outputDirectory % kwargs['UID']
+
+  # grid of the VOI
+  MRTICache = kwargs.get('shareddata',{}).setdefault('mrti',{})
+  (vtkMRTIImage,mrti_array) = ReadMRTIVOI(kwargs['mrti'],kwargs['timeinterval'][0]+1,kwargs['voi'],MRTICache)
+  (gridorigin,gridspacing,griddimensions,voislices) = pennesfd.VOIGrid(
+          vtkMRTIImage.GetOrigin(),vtkMRTIImage.GetSpacing(),vtkMRTIImage.GetExtent(),PennesFDPadding)
+  gridpoints = pennesfd.GridPointCoordinates(gridorigin,gridspacing,griddimensions)
+  print "pennes finite difference grid", griddimensions
+
+  # probe position and direction are the first two landmarks
+  vtkProbeReader = vtk.vtkPolyDataReader()
+  vtkProbeReader.SetFileName( kwargs['target_landmarks'] )
+  vtkProbeReader.Update()
+  probepoints = vtkNumPy.vtk_to_numpy(vtkProbeReader.GetOutput().GetPoints().GetData()).astype(numpy.float64)
+  # same registration as the SEM mesh:  x -> R FIXMEHack x + t
+  (rotation,derivatives) = meshprojection.RotationMatrices(
+               [float(kwargs['cv'][varname]) for varname in RegistrationVariableList[3:6]])
+  translation = numpy.array([float(kwargs['cv'][varname]) for varname in RegistrationVariableList[0:3]])
+  probepoints = numpy.dot(probepoints * numpy.array([-1.,1.,-1.]),rotation.T) + translation
+  tippoints = pennesfd.LaserTipPoints(probepoints[0],probepoints[1]-probepoints[0])
+  laserSource = pennesfd.LaserSource(gridpoints,tippoints,float(kwargs['cv']['mu_a']),float(kwargs['cv']['mu_s']),
+                                     float(kwargs['cv']['anfact']),0.5*gridspacing.min())
+
+  materials = dict([ (varname,kwargs['cv'][varname]) for varname in ['rho','c_p','k_0','w_0','c_blood','body_temp'] ])
+  pennesSolver = pennesfd.PennesFiniteDifference(gridspacing,griddimensions,materials,laserSource)
+  print " pennes deltat:", pennesSolver.TimeStep
+
+  # initialize temperature field with MRTI for cooling optimization
+  MRTIInterval = kwargs['mrtideltat'] 
+  if(kwargs['opttype'] == 'cooling'): 
+    mrtifilename = '%s/temperature.%04d.vtk' % ( kwargs['mrti'], kwargs['timeinterval'][0] ) 
+    body_temp = float(kwargs['cv']['body_temp']) 
+    (icorigin,icspacing,icimage) = CoolingInitialCondition(mrtifilename,kwargs['voi'],body_temp,SEMDataDirectory)
+    mrti_ic_array = meshprojection.ImageTrilinearInterpolation(icorigin,icspacing,icimage,gridpoints)
+    # threshold by body temp
+    mrti_ic_array[ mrti_ic_array < body_temp ] = body_temp  
+    pennesSolver.SetTemperature( mrti_ic_array )
+
+  ## loop over time
+  currentTime = kwargs['initialtime'] 
+  PennesHistory = {}
+  for MRTItimeID in range(kwargs['timeinterval'][0]+1,kwargs['timeinterval'][1]):
+    currentTime = pennesSolver.Advance(currentTime,(MRTItimeID +1)*MRTIInterval,kwargs['lambdacode'])
+    PennesHistory[MRTItimeID] = pennesSolver.Temperature[voislices].ravel().astype(numpy.float32)
+  return PennesHistory
+# end def SolvePennesHistory:
+##################################################################
+def ComputeObjective(**kwargs):
+  ImportVTK()
+  # Debugging flags
+  DebugObjective = False
+  DebugObjective = True
+  # the perturbed solves of the finite difference gradient write no debug output
+  DebugObjective = kwargs.get('debugobjective',DebugObjective)
+
+  # FIXME  should this be different ?  
+  SEMDataDirectory = outputDirectory % kwargs['UID']
+
+  # evaluations in the same process share the MRTI data, the mesh,
+  # and the interpolation weights
+  SharedData      = kwargs.get('shareddata',{})
+  MRTICache       = SharedData.setdefault('mrti',{})
+  ProjectionCache = SharedData.setdefault('projection',{})
+
+  # the finite difference model is solved on the VOI
+  PennesFD = ( kwargs.get('forwardmodel',ForwardModel) == 'pennesfd' )
+  if ( PennesFD ):
+    SEMHistory = SolvePennesHistory(**kwargs)
+  else:
+    # skip the solve when only the registration variables changed
+    semHistory = SEMHistoryStore(SEMDataDirectory,**kwargs)
+    if ( semHistory.IsStored() ):
+      (bNekNodes,bNekConnectivity,SEMHistory) = semHistory.Load()
     else:
-      print '#####NOT FOUND' , mrtifilename 
-      print '#####USING DEFAULT at time 0' 
-      mrtifilename = '%s/temperature.%04d.vtk' % (kwargs['mrti'], 0) 
-    vtkImageReader = vtk.vtkDataSetReader() 
-    vtkImageReader.SetFileName(mrtifilename )
-    vtkImageReader.Update() 
-    ## image_cells = vtkImageReader.GetOutput().GetPointData() 
-    ## data_array = vtkNumPy.vtk_to_numpy(image_cells.GetArray('scalars')) 
-    
-    # extract voi for QOI
-    vtkVOIExtract = vtk.vtkExtractVOI() 
-    vtkVOIExtract.SetInput( vtkImageReader.GetOutput() ) 
-    vtkVOIExtract.SetVOI( kwargs['voi'] ) 
-    vtkVOIExtract.Update()
-    mrti_point_data= vtkVOIExtract.GetOutput().GetPointData() 
-    mrti_array = vtkNumPy.vtk_to_numpy(mrti_point_data.GetArray('image_data')) 
+      (bNekNodes,bNekConnectivity,SEMHistory) = SolveSEMHistory(**kwargs)
+
+    # setup vtkUnstructuredGrid
+    if ( 'hexgrid' not in SharedData ):
+      SharedData['hexgrid'] = BuildHexahedronGrid(bNekNodes,bNekConnectivity)
+    hexahedronGrid = SharedData['hexgrid']
+
+  # TODO : check if deepcopy needed
+  DeepCopy = 1
+
+  # get registration parameters
+  variableDictionary = kwargs['cv']
+
+  # register the SEM data to MRTI
+  AffineTransform = RegistrationTransform(variableDictionary)
+
+  # setup MRTI data read
+  MRTIInterval = kwargs['mrtideltat'] 
+
+  # initialize image dose
+  semDose  = ImageDoseHelper(  kwargs['voi'], MRTIInterval ,'%s/temperature.0001.vtk' % (kwargs['mrti']))
+  mrtiDose = ImageDoseHelper(  kwargs['voi'], MRTIInterval ,'%s/temperature.0001.vtk' % (kwargs['mrti']))
+
+  # every time window (heating, cooling, ...) is reduced in the same pass
+  # over the solve interval, the dose of a window accumulates from its
+  # first frame. windows w/ the same first frame share the dose
+  TimeWindows   = kwargs.get('timewindows',{'fulltime':kwargs['timeinterval']})
+  WindowResults = kwargs.get('windowresults',{})
+  WindowDose    = {kwargs['timeinterval'][0]:(semDose,mrtiDose)}
+  for (windowname,windowinterval) in TimeWindows.items():
+    if ( windowinterval[0] not in WindowDose ):
+      WindowDose[windowinterval[0]] = (ImageDoseHelper( kwargs['voi'], MRTIInterval ,'%s/temperature.0001.vtk' % (kwargs['mrti'])),
+                                       ImageDoseHelper( kwargs['voi'], MRTIInterval ,'%s/temperature.0001.vtk' % (kwargs['mrti'])))
+  windowReducers = {}
+  windowDiceMaxHeat = dict([ (windowname,None) for windowname in TimeWindows ])
+
+  # analytic derivatives w.r.t. the rigid registration
+  # FIXME the MRTI initial condition for cooling also depends on the
+  # FIXME registration, the analytic derivative does not account for it
+  ComputeGradient = len(filter(lambda asvvalue: asvvalue & 2, kwargs['asv'])) > 0
+  if ( ComputeGradient and kwargs['opttype'] == 'cooling' ):
+    print "WARNING: no analytic registration derivatives w/ MRTI initial condition"
+  if ( ComputeGradient and PennesFD ):
+    print "WARNING: no analytic registration derivatives w/ the finite difference model"
+    ComputeGradient = False
+
+  # every metric is reduced in the same pass over the VOI
+  objectiveWindow  = kwargs.get('objectivewindow','fulltime')
+  objectiveReducer = None
+
+  # the registered mesh does not change in time, locate the MRTI
+  # voxels once and reuse the interpolation weights
+  registrationkey = tuple([float(variableDictionary[varname]) for varname in RegistrationVariableList])
+
+  ## loop over time
+  for MRTItimeID in range(kwargs['timeinterval'][0]+1,kwargs['timeinterval'][1]):
+
+    # load image 
+    (vtkMRTIImage,mrti_array) = ReadMRTIVOI(kwargs['mrti'],MRTItimeID,kwargs['voi'],MRTICache)
     # update dose
     vtkmrtiDose = mrtiDose.UpdateDoseMap(mrti_array)
-    # x = vtkNumPy.vtk_to_numpy(vtkmrtiDose.GetPointData().GetArray('scalars')) 
-    
-    #print mrti_array
-    #print type(mrti_array)
+    for (windowstart,(windowsemDose,windowmrtiDose)) in WindowDose.items():
+      if ( windowstart != kwargs['timeinterval'][0] and MRTItimeID > windowstart ):
+        windowmrtiDose.AccumulateDose(mrti_array)
 
     # get brainNek solution 
-    brainNek.getHostTemperature( bNekSoln )
-    vtkScalarArray = vtkNumPy.numpy_to_vtk( bNekSoln, DeepCopy) 
-    vtkScalarArray.SetName("bioheat") 
-    hexahedronGrid.GetPointData().SetScalars(vtkScalarArray);
-    hexahedronGrid.Update()
-
-    # project SEM onto MRTI for comparison
-    print 'resampling' 
-    FixmeHackSEMRegister = vtk.vtkTransformFilter()
-    FixmeHackSEMRegister.SetInput( hexahedronGrid )
-    FixmeHackSEMRegister.SetTransform(FIXMEHackTransform)
-    FixmeHackSEMRegister.Update()
-    SEMRegister = vtk.vtkTransformFilter()
-    SEMRegister.SetInput( FixmeHackSEMRegister.GetOutput() )
-    SEMRegister.SetTransform(AffineTransform)
-    SEMRegister.Update()
-    vtkResample = vtk.vtkCompositeDataProbeFilter()
-    vtkResample.SetSource( SEMRegister.GetOutput() )
-    vtkResample.SetInput( vtkVOIExtract.GetOutput() ) 
-    vtkResample.Update()
-
-    fem_point_data= vtkResample.GetOutput().GetPointData() 
-    fem_array = vtkNumPy.vtk_to_numpy(fem_point_data.GetArray('bioheat')) 
+    bNekSoln = SEMHistory[MRTItimeID]
+
+    if ( PennesFD ):
+      # the finite difference solution is on the VOI
+      fem_array = bNekSoln
+    else:
+      # project SEM onto MRTI for comparison
+      if ( registrationkey not in ProjectionCache ):
+        print 'locating voxels' 
+        voipoints = ImagePointCoordinates(vtkMRTIImage)
+        ProjectionCache[registrationkey] = {'points'    : voipoints,
+                                            'projection': BuildSEMProjection(hexahedronGrid,vtkMRTIImage,voipoints,AffineTransform)}
+      semProjection = ProjectionCache[registrationkey]['projection']
+      if ( ComputeGradient and 'directions' not in ProjectionCache[registrationkey] ):
+        ProjectionCache[registrationkey]['directions'] = meshprojection.RigidRegistrationDerivatives(
+                   [float(variableDictionary[varname]) for varname in RegistrationVariableList[0:3]],
+                   [float(variableDictionary[varname]) for varname in RegistrationVariableList[3:6]],
+                   ProjectionCache[registrationkey]['points'])
+      fem_array = semProjection.Interpolate(bNekSoln)
     # update dose
     vtksemDose  = semDose.UpdateDoseMap(  fem_array)
+    for (windowstart,(windowsemDose,windowmrtiDose)) in WindowDose.items():
+      if ( windowstart != kwargs['timeinterval'][0] and MRTItimeID > windowstart ):
+        windowsemDose.AccumulateDose(fem_array)
+
+    # accumulate objective function of each window containing the frame
+    if ( ComputeGradient ):
+      # dfem/dtheta = grad fem . directions
+      femderivatives = numpy.einsum('pi,pki->pk',semProjection.Gradient(bNekSoln),ProjectionCache[registrationkey]['directions'])
+    for (windowname,windowinterval) in TimeWindows.items():
+      (windowsemDose,windowmrtiDose) = WindowDose[windowinterval[0]]
+      # dice of every window at the end of heating, in or out of the window
+      if ( MRTItimeID == kwargs['maxheatid'] ):
+        windowDiceMaxHeat[windowname] = objectivemetrics.DoseDice(windowmrtiDose.PredictedDamage,windowsemDose.PredictedDamage)
+      # the last frame of the window is included
+      if ( MRTItimeID <= windowinterval[0] or MRTItimeID > windowinterval[1] ):
+        continue
+      if ( windowname not in windowReducers ):
+        windowReducers[windowname] = objectivemetrics.ObjectiveReducer(ObjectiveComponents,len(fem_array),len(RegistrationVariableList))
+      windowReducers[windowname].UpdateFrame(mrti_array,fem_array,windowmrtiDose.PredictedDamage,windowsemDose.PredictedDamage)
+      if ( ComputeGradient ):
+        windowReducers[windowname].UpdateGradient( femderivatives )
+    if ( objectiveReducer == None ):
+      objectiveReducer = windowReducers.get(objectiveWindow)
     print 'resampled' 
-    #print fem_array 
-    #print type(fem_array )
-
-
-    # write output
-    if ( False ):
-      vtkSEMWriter = vtk.vtkXMLUnstructuredGridWriter()
-      semfileName = "%s/semtransform.%04d.vtu" % (SEMDataDirectory,MRTItimeID)
-      print "writing ", semfileName
-      vtkSEMWriter.SetFileName( semfileName )
-      vtkSEMWriter.SetInput(SEMRegister.GetOutput())
-      #vtkSEMWriter.SetDataModeToAscii()
-      vtkSEMWriter.Update()
+    # image of the resampled SEM for output
+    vtkResampleImage = vtk.vtkImageData()
+    vtkResampleImage.DeepCopy( vtkMRTIImage              )
+    vtkFEMArray = vtkNumPy.numpy_to_vtk( fem_array, DeepCopy) 
+    vtkFEMArray.SetName("bioheat") 
+    vtkResampleImage.GetPointData().SetScalars(vtkFEMArray)
 
     # write output
     # FIXME auto read ??
     if ( DebugObjective ):
        # write temperature
-       WriteVTKOutputFile ( vtkResample.GetOutput()   ,"%s/roisem.%s.%04d.vtk"   % (SEMDataDirectory,kwargs['opttype'],MRTItimeID))
-       WriteVTKOutputFile ( vtkVOIExtract.GetOutput() ,"%s/roimrti.%s.%04d.vtk"  % (SEMDataDirectory,kwargs['opttype'],MRTItimeID))
+       WriteVTKOutputFile ( vtkResampleImage          ,"%s/roisem.%s.%04d.vtk"   % (SEMDataDirectory,kwargs['opttype'],MRTItimeID))
+       WriteVTKOutputFile ( vtkMRTIImage              ,"%s/roimrti.%s.%04d.vtk"  % (SEMDataDirectory,kwargs['opttype'],MRTItimeID))
        # write dose
        WriteVTKOutputFile ( vtksemDose  ,"%s/roisemdose.%s.%04d.vtk"   % (SEMDataDirectory,kwargs['opttype'],MRTItimeID))
        WriteVTKOutputFile ( vtkmrtiDose ,"%s/roimrtidose.%s.%04d.vtk"  % (SEMDataDirectory,kwargs['opttype'],MRTItimeID))
 
-       # write dice coefficient
-       dicefilename = "%s/dice.%s.%04d.txt" % ( SEMDataDirectory,kwargs['opttype'],MRTItimeID)
-       dicecmd = "%s -verbose %s/roisemdose.%s.%04d.vtk -thresh 1 inf 1 0 -type uchar -as SEM %s/roimrtidose.%s.%04d.vtk -thresh 1 inf 1 0 -type uchar -push SEM -overlap 1 > %s  2>&1" % (c3dexe,SEMDataDirectory,kwargs['opttype'],MRTItimeID,SEMDataDirectory,kwargs['opttype'],MRTItimeID,dicefilename)
-       print dicecmd, dicefilename 
-       os.system(dicecmd)
-       #if (  MRTItimeID == fem_params['maxheatid'] ):
-       dicevalue = DiceTxtFileParse(dicefilename)
-       ##if (MRTItimeID > 20):
-       ##  raise 
+       # write dice coefficient in the c3d -overlap format for DiceTxtFileParse
+       if ( objectiveReducer != None ):
+         dicefilename = "%s/dice.%s.%04d.txt" % ( SEMDataDirectory,kwargs['opttype'],MRTItimeID)
+         dicefile = open(dicefilename,'w')
+         dicefile.write("Dice similarity coefficient: %f\n" % objectiveReducer.Dice[objectivemetrics.DamageDoseThreshold])
+         dicefile.close()
 
     # Write JPG's for tex
-    if ( kwargs['VisualizeOutput'] and MRTItimeID == fem_params['maxheatid'] ):
+    if ( kwargs['VisualizeOutput'] and MRTItimeID == kwargs['maxheatid'] ):
     #if ( kwargs['VisualizeOutput'] ):
        VisDictionary = {'voi'    :  kwargs['voi'] ,
-                        'roisem' : vtkResample.GetOutput()   ,
-                        'roimrti': vtkVOIExtract.GetOutput() ,
+                        'roisem' : vtkResampleImage          ,
+                        'roimrti': vtkMRTIImage              ,
                     'roisemdose' : vtksemDose  ,
                     'roimrtidose': vtkmrtiDose ,
               'magnitudefilename':'%s/magnitude.%04d.vtk' % (kwargs['mrti'], MRTItimeID) ,
@@ -1117,36 +1654,167 @@ def ComputeObjective(**kwargs):
                        }
        WriteJPGOutputFiles(**VisDictionary)
 
-    # accumulate objective function
-    diff =  numpy.abs(mrti_array-fem_array)
-    diffsq =  diff**2
-    ObjectiveFunction = ObjectiveFunction + diff.sum()
-    
-    epsilonPenalty = 1.e-7
-    dicepenalty = 1./(dicevalue +epsilonPenalty )
-
-  return (ObjectiveFunction,dicepenalty,  dicevalue  , 1.-dicevalue)
+  # derivatives of each objective function by variable name
+  for (windowname,windowReducer) in windowReducers.items():
+    windowGradient = {}
+    if ( ComputeGradient and kwargs['opttype'] != 'cooling' ):
+      componentGradients = windowReducer.ComponentGradients()
+      for (idvar,varname) in enumerate(RegistrationVariableList):
+        windowGradient[varname] = [ componentgradient[idvar] for componentgradient in componentGradients ]
+    WindowResults[windowname] = {'functions'  : windowReducer.Components(),
+                                 'gradients'  : windowGradient,
+                                 'dicemaxheat': windowDiceMaxHeat[windowname] }
+  if ( objectiveWindow not in WindowResults ):
+    raise RuntimeError("no MRTI frames of the %s window %s in the solve interval %s" % (objectiveWindow,TimeWindows.get(objectiveWindow),kwargs['timeinterval']))
+
+  return (WindowResults[objectiveWindow]['functions'],WindowResults[objectiveWindow]['gradients'])
 # end def ComputeObjective:
 ##################################################################
+def SolveSEMConcurrent(ParameterList):
+  """
+  solve the SEM histories that are not stored, one process per GPU device
+  the children are forked before brainNek is initialized in this process
+  and the parameters (power history lambda) are not pickled. a solve that
+  exits w/ an error or stores no history fails the evaluation
+  """
+  import multiprocessing
+  # default to the device of this work directory
+  DeviceList = GPUDeviceList
+  if ( DeviceList == None ):
+    DeviceList = [ int(workDirectory.split('/').pop()) ]
+
+  # skip stored and duplicate histories
+  pendingList = []
+  pendingKeys = []
+  for fem_params in ParameterList:
+    semHistory = SEMHistoryStore(outputDirectory % fem_params['UID'],**fem_params)
+    if ( not semHistory.IsStored() and semHistory.HistoryKey not in pendingKeys ):
+      pendingList.append( fem_params )
+      pendingKeys.append( semHistory.HistoryKey )
+
+  # round robin over the devices, the oldest solve holds the next device
+  runningList = []
+  failedList  = []
+  def JoinSolve(semProcess,historykey):
+    semProcess.join()
+    if ( semProcess.exitcode != 0 ):
+      print "concurrent SEM solve", historykey, "exit code", semProcess.exitcode
+      failedList.append( historykey )
+  for (idtask,fem_params) in enumerate(pendingList):
+    if ( len(runningList) == len(DeviceList) ):
+      JoinSolve(*runningList.pop(0))
+    taskparams = dict(fem_params)
+    taskparams['gpudevice'] = DeviceList[idtask % len(DeviceList)]
+    taskparams['workdir']   = '%s/fd.%04d.%02d' % (workDirectory,fem_params['fileID'],idtask)
+    print 'solving', pendingKeys[idtask], 'on device', taskparams['gpudevice'], 'in', taskparams['workdir']
+    semProcess = multiprocessing.Process(target=SolveSEMHistory,kwargs=taskparams)
+    semProcess.start()
+    runningList.append( (semProcess,pendingKeys[idtask]) )
+  for (semProcess,historykey) in runningList:
+    JoinSolve(semProcess,historykey)
+  # a solve that died fails the evaluation
+  for (historykey,fem_params) in zip(pendingKeys,pendingList):
+    if ( historykey not in failedList and not SEMHistoryStore(outputDirectory % fem_params['UID'],**fem_params).IsStored() ):
+      failedList.append( historykey )
+  if ( len(failedList) > 0 ):
+    raise RuntimeError("%d of %d concurrent SEM solves failed: %s" % (len(failedList),len(pendingList),failedList))
+# end def SolveSEMConcurrent:
+##################################################################
+def ComputeObjectiveGradient(**kwargs):
+  """
+  objective functions and the full gradient w.r.t. the DVV in one process
+  registration derivatives are analytic (except w/ the MRTI initial
+  condition for cooling), the remaining variables use forward differences.
+  the base point and perturbations are solved concurrently then evaluated
+  w/ shared MRTI data, mesh, and interpolation weights
+  """
+  if ( kwargs['opttype'] == 'cooling' or kwargs.get('forwardmodel',ForwardModel) == 'pennesfd' ):
+    AnalyticVariableList = []
+  else:
+    AnalyticVariableList = RegistrationVariableList
+
+  # perturbed parameters, function values only
+  PerturbationList = []
+  for varname in kwargs['dvv']:
+    if ( varname in AnalyticVariableList ):
+      continue
+    if ( varname not in kwargs['cv'] ):
+      print "WARNING: %s is not a continuous variable" % varname
+      continue
+    varvalue = float(kwargs['cv'][varname])
+    fdstep   = FDStepSize * abs(varvalue)
+    if ( fdstep == 0.0 ):
+      fdstep = FDStepSize
+    fdparams = dict(kwargs)
+    fdparams['cv'] = dict(kwargs['cv'])
+    fdparams['cv'][varname] = '%.15e' % (varvalue + fdstep)
+    ConvertContinuousVariables(fdparams['cv'])
+    fdparams['asv'] = [1 for asvvalue in kwargs['asv']]
+    fdparams['VisualizeOutput'] = False
+    fdparams['debugobjective']  = False
+    # use the step actually taken
+    fdstep = float(fdparams['cv'][varname]) - varvalue
+    PerturbationList.append( (varname,fdstep,fdparams) )
+
+  # solve, the finite difference model is solved by ComputeObjective
+  if ( kwargs.get('forwardmodel',ForwardModel) != 'pennesfd' ):
+    SolveSEMConcurrent( [kwargs] + [fdparams for (varname,fdstep,fdparams) in PerturbationList] )
+
+  # the perturbations write no debug or visualization output, the output
+  # directory has the files of the base point only
+  SharedData = {}
+  fdFunctionList = []
+  for (varname,fdstep,fdparams) in PerturbationList:
+    fdparams['shareddata']    = SharedData
+    fdparams['windowresults'] = {}
+    ComputeObjective(**fdparams)
+    fdFunctionList.append( (varname,fdstep,fdparams['windowresults']) )
+  baseparams = dict(kwargs)
+  baseparams['shareddata']    = SharedData
+  baseparams['windowresults'] = kwargs.get('windowresults',{})
+  (objfunctionlist,objgradientdict) = ComputeObjective(**baseparams)
+
+  # forward differences of every time window, the gradients of the
+  # objective window are objgradientdict
+  for (varname,fdstep,fdWindowResults) in fdFunctionList:
+    for (windowname,windowresults) in baseparams['windowresults'].items():
+      windowresults['gradients'][varname] = [ (fdvalue - basevalue)/fdstep for (fdvalue,basevalue) in zip(fdWindowResults[windowname]['functions'],windowresults['functions']) ]
+  return (objfunctionlist,objgradientdict)
+# end def ComputeObjectiveGradient:
+##################################################################
+# Convenience Routine
+def WriteSetupCacheFile(filenameformat,filecontents):
+  """
+  write filecontents to the setup cache once, the file name is the sha1 of
+  the contents, ie filenameformat = 'case.%s.setup'
+  """
+  import hashlib
+  os.system('mkdir -p %s' % SetupCacheDirectory )
+  cachefilename = '%s/%s' % (SetupCacheDirectory, filenameformat % hashlib.sha1(filecontents).hexdigest())
+  if ( not os.path.isfile(cachefilename) ):
+    # concurrent evaluations may write the same file
+    tmpfilename = '%s.%d.tmp' % (cachefilename,os.getpid())
+    with file(tmpfilename, 'w') as fileHandle: fileHandle.write(filecontents)
+    os.rename(tmpfilename,cachefilename)
+    print 'writing', cachefilename
+  return cachefilename
+
 def brainNekWrapper(**kwargs):
   """
   call brainNek code 
+  the work directory and GPU device may be set for concurrent solves
   """
-  # occa case file
-  outputOccaCaseFile = '%s/casefunctions.%04d.occa' % (workDirectory,kwargs['fileID'])
-  print 'writing', outputOccaCaseFile 
-  with file(outputOccaCaseFile, 'w') as occaCaseFileName: occaCaseFileName.write(caseFunctionTemplate )
+  WorkDir = kwargs.get('workdir',workDirectory)
+  os.system('mkdir -p %s' % WorkDir )
 
-  # setuprc file
-  outputSetupRCFile = '%s/setuprc.%04d' % (workDirectory,kwargs['fileID'])
-  print 'writing', outputSetupRCFile 
-  fileHandle = file(outputSetupRCFile ,'w')
-  semfinaltime = kwargs['finaltime']
-  # make sure write directory exists
-  os.system('mkdir -p %s' % outputDirectory % kwargs['UID'] )
-  GPUDeviceID = int(workDirectory.split('/').pop())
-  fileHandle.write(setuprcTemplate % (workDirectory,kwargs['fileID'] ,semfinaltime ,GPUDeviceID  ,  outputDirectory % kwargs['UID'] ,semfinaltime ) )
-  fileHandle.flush(); fileHandle.close()
+  # compiled OCCA kernels are reused from disk, the default is the OCCA
+  # cache in the home directory
+  if ( OCCACacheDirectory != None ):
+    os.system('mkdir -p %s' % OCCACacheDirectory )
+    os.environ['OCCA_CACHE_DIR'] = OCCACacheDirectory
+
+  # occa case file, the same for every evaluation
+  outputOccaCaseFile = WriteSetupCacheFile('casefunctions.%s.occa',caseFunctionTemplate )
 
   # get variables
   variableDictionary = kwargs['cv']
@@ -1159,20 +1827,31 @@ def brainNekWrapper(**kwargs):
   anfact = variableDictionary['anfact' ]   
 
   # materials
-  outputMaterialFile = '%s/material_types.%04d.setup' % (workDirectory,kwargs['fileID'])
-  print 'writing', outputMaterialFile 
-  fileHandle = file(outputMaterialFile   ,'w')
-  fileHandle.write('[MATERIAL PROPERTIES]\n'  )
-  fileHandle.write('# Name,      Type index, Density, Specific Heat, Conductivity, Perfusion, Absorption, Scattering, Anisotropy\n'  )
-  fileHandle.write('Brain     0           %12.5f     %12.5f           %12.5f        %12.5f     %12.5f      %12.5f      %12.5f \n' % ( rho, c_p, k_0, w_0, mu_a, mu_s, anfact ))
-  fileHandle.write('Tumor     1           %12.5f     %12.5f           %12.5f        %12.5f     %12.5f      %12.5f      %12.5f \n' % ( rho, c_p, k_0, w_0, mu_a, mu_s, anfact ))
-  fileHandle.write('CSF      25           %12.5f     %12.5f           %12.5f        %12.5f     %12.5f      %12.5f      %12.5f \n' % ( rho, c_p, k_0, 100.*w_0, mu_a, mu_s, anfact ))
+  materialContents = '[MATERIAL PROPERTIES]\n'
+  materialContents = materialContents + '# Name,      Type index, Density, Specific Heat, Conductivity, Perfusion, Absorption, Scattering, Anisotropy\n'
+  materialContents = materialContents + 'Brain     0           %12.5f     %12.5f           %12.5f        %12.5f     %12.5f      %12.5f      %12.5f \n' % ( rho, c_p, k_0, w_0, mu_a, mu_s, anfact )
+  materialContents = materialContents + 'Tumor     1           %12.5f     %12.5f           %12.5f        %12.5f     %12.5f      %12.5f      %12.5f \n' % ( rho, c_p, k_0, w_0, mu_a, mu_s, anfact )
+  materialContents = materialContents + 'CSF      25           %12.5f     %12.5f           %12.5f        %12.5f     %12.5f      %12.5f      %12.5f \n' % ( rho, c_p, k_0, 100.*w_0, mu_a, mu_s, anfact )
+  outputMaterialFile = WriteSetupCacheFile('material_types.%s.setup',materialContents)
+
+  # case file, the temperatures are the per evaluation compile time
+  # definitions of the function file
+  outputCaseFile = WriteSetupCacheFile('case.%s.setup',
+                     caseFileTemplate % (outputOccaCaseFile,kwargs['target_landmarks'],variableDictionary['body_temp'],variableDictionary['body_temp'],variableDictionary['probe_init'],variableDictionary['c_blood'],kwargs['segment_file'],outputMaterialFile) )
+
+  # setuprc file
+  outputSetupRCFile = '%s/setuprc.%04d' % (WorkDir,kwargs['fileID'])
+  print 'writing', outputSetupRCFile 
+  fileHandle = file(outputSetupRCFile ,'w')
+  semfinaltime = kwargs['finaltime']
+  # make sure write directory exists
+  os.system('mkdir -p %s' % outputDirectory % kwargs['UID'] )
+  GPUDeviceID = kwargs.get('gpudevice',int(workDirectory.split('/').pop()))
+  fileHandle.write(setuprcTemplate % (outputCaseFile ,semfinaltime ,GPUDeviceID  ,  outputDirectory % kwargs['UID'] ,semfinaltime ) )
   fileHandle.flush(); fileHandle.close()
 
-  # case file
-  outputCaseFile = '%s/case.%04d.setup' % (workDirectory,kwargs['fileID'])
-  print 'writing', outputCaseFile 
-  with file(outputCaseFile , 'w') as fileHandle: fileHandle.write(caseFileTemplate % (workDirectory,kwargs['fileID'],kwargs['target_landmarks'],variableDictionary['body_temp'],variableDictionary['body_temp'],variableDictionary['probe_init'],variableDictionary['c_blood'],kwargs['segment_file'],workDirectory,kwargs['fileID'])  )
+  # the case file determines the mesh, operators, and kernels of the solver
+  return (outputSetupRCFile,(outputCaseFile,GPUDeviceID))
 
   ## # build command to run brainNek
   ## brainNekCommand = "%s/main %s -heattransfercoefficient %s -coolanttemperature  %s > %s/run.%04d.log 2>&1 " % (brainNekDIR , outputSetupRCFile ,variableDictionary['robin_coeff'  ], variableDictionary['probe_init'   ], workDirectory ,kwargs['fileID'])
@@ -1182,6 +1861,47 @@ def brainNekWrapper(**kwargs):
   ## os.system(brainNekCommand )
 # end def brainNekWrapper:
 ##################################################################
+def ConvertContinuousVariables(continuous_vars):
+  """
+  physical parameters derived from the dakota variables
+  """
+  ################################
+  # convert to uniform interface
+  ################################
+  #      mu_a_min               <      mu_a + (1-g) mu_s < mu_a_max + (1-g_min) mu_s_max
+  #         5.e-1               <          mu_tr         < 600. + .3 * 50000. 
+  #
+  #  sqrt( 3 * 5.e-1 * 5.e-1 )  <  sqrt( 3 mu_a  mu_tr ) < sqrt( 3 * 600. * (600. + .3 * 50000.) ) 
+  #  sqrt( 3 * 5.e-1 * 5.e-1 )  <        mu_eff          < sqrt( 3 * 600. * (600. + .3 * 50000.) ) 
+  #            8.e-1            <        mu_eff          <    5.3e3
+  import math
+  mu_s   = float(continuous_vars['mu_s_healthy'])
+  anfact = float(continuous_vars['anfact_healthy'])
+  mu_s_p = mu_s * (1.-anfact) 
+  # mu_tr  = mu_a + (1-g) mu_s 
+  # mu_eff = sqrt( 3 mu_a  mu_tr )
+  mu_eff = float(continuous_vars['mu_eff_healthy'])
+  mu_a   =  0.5*( -mu_s_p + math.sqrt( mu_s_p * mu_s_p  + 4. * mu_eff * mu_eff  /3. ) )
+  # alpha  == k / rho / c_p   W/m/K * m^3/kg * kg*K/W/s = m^2/s
+  alpha   = float(continuous_vars['alpha_healthy'])
+  rho     = float(continuous_vars['rho_healthy'])
+  c_p     = float(continuous_vars['c_p_healthy'])
+  c_blood = float(continuous_vars['c_blood_healthy'])
+  k_0    = alpha * c_p * rho 
+  w_0    = float(continuous_vars['w_0_healthy'])
+
+  # store dakota vars
+  continuous_vars['rho'    ]   =  rho   
+  continuous_vars['c_p'    ]   =  c_p   
+  continuous_vars['k_0'    ]   =  k_0   
+  continuous_vars['w_0'    ]   =  w_0   
+  continuous_vars['mu_a'   ]   =  mu_a  
+  continuous_vars['mu_s'   ]   =  mu_s  
+  continuous_vars['anfact' ]   =  anfact
+  continuous_vars['c_blood']   =  c_blood 
+  return continuous_vars
+# end def ConvertContinuousVariables:
+##################################################################
 def ParseInput(paramfilename,VisualizeOutput):
   # ----------------------------
   # Parse DAKOTA parameters file
@@ -1256,44 +1976,19 @@ def ParseInput(paramfilename,VisualizeOutput):
       active_set_vector = [ int(paramsdict['ASV_%d:obj_fn' % (i) ]) for i in range(1,num_fns+1)  ] 
     except KeyError:
       active_set_vector = [ int(paramsdict['ASV_%d:obj_fn_%d' % (i,i) ]) for i in range(1,num_fns+1)  ] 
-  
-  ################################
-  # convert to uniform interface
-  ################################
-  #      mu_a_min               <      mu_a + (1-g) mu_s < mu_a_max + (1-g_min) mu_s_max
-  #         5.e-1               <          mu_tr         < 600. + .3 * 50000. 
-  #
-  #  sqrt( 3 * 5.e-1 * 5.e-1 )  <  sqrt( 3 mu_a  mu_tr ) < sqrt( 3 * 600. * (600. + .3 * 50000.) ) 
-  #  sqrt( 3 * 5.e-1 * 5.e-1 )  <        mu_eff          < sqrt( 3 * 600. * (600. + .3 * 50000.) ) 
-  #            8.e-1            <        mu_eff          <    5.3e3
-  import math
-  mu_s   = float(continuous_vars['mu_s_healthy'])
-  anfact = float(continuous_vars['anfact_healthy'])
-  mu_s_p = mu_s * (1.-anfact) 
-  # mu_tr  = mu_a + (1-g) mu_s 
-  # mu_eff = sqrt( 3 mu_a  mu_tr )
-  mu_eff = float(continuous_vars['mu_eff_healthy'])
-  mu_a   =  0.5*( -mu_s_p + math.sqrt( mu_s_p * mu_s_p  + 4. * mu_eff * mu_eff  /3. ) )
-  # alpha  == k / rho / c_p   W/m/K * m^3/kg * kg*K/W/s = m^2/s
-  alpha   = float(continuous_vars['alpha_healthy'])
-  rho     = float(continuous_vars['rho_healthy'])
-  c_p     = float(continuous_vars['c_p_healthy'])
-  c_blood = float(continuous_vars['c_blood_healthy'])
-  k_0    = alpha * c_p * rho 
-  w_0    = float(continuous_vars['w_0_healthy'])
 
-  # store dakota vars
-  continuous_vars['rho'    ]   =  rho   
-  continuous_vars['c_p'    ]   =  c_p   
-  continuous_vars['k_0'    ]   =  k_0   
-  continuous_vars['w_0'    ]   =  w_0   
-  continuous_vars['mu_a'   ]   =  mu_a  
-  continuous_vars['mu_s'   ]   =  mu_s  
-  continuous_vars['anfact' ]   =  anfact
-  continuous_vars['c_blood']   =  c_blood 
-  fem_params['cv']         = continuous_vars
+  # derivative variables, DVV_i:descriptor
+  derivative_vars = {}
+  for paramtag in paramsdict.keys():
+    if ( paramtag.startswith('DVV_') ):
+      dvvtag = paramtag.split(':')
+      derivative_vars[int(dvvtag[0].split('_').pop())] = dvvtag.pop()
+  derivative_variable_vector = [ derivative_vars[i] for i in sorted(derivative_vars.keys()) ]
+  
+  fem_params['cv']         = ConvertContinuousVariables(continuous_vars)
 
   fem_params['asv']        = active_set_vector
+  fem_params['dvv']        = derivative_variable_vector
   fem_params['functions']  = num_fns
   fem_params['fileID']     = fileID 
   fem_params['UID']        = int(paramfilename.split('/').pop(3))
@@ -1310,12 +2005,9 @@ def ParseInput(paramfilename,VisualizeOutput):
   # get header info
   mrtifilename = '%s/temperature.%04d.vtk' % (fem_params['mrti'], 1) 
   print 'opening' , mrtifilename 
-  vtkSetupImageReader = vtk.vtkDataSetReader() 
-  vtkSetupImageReader.SetFileName(mrtifilename )
-  vtkSetupImageReader.Update() 
-  SetupImageData = vtkSetupImageReader.GetOutput() 
-  fem_params['spacing']        = SetupImageData.GetSpacing()
-  fem_params['dimensions']     = SetupImageData.GetDimensions()
+  (setuporigin,setupspacing,setupextent,setup_array) = mrtiio.ReadStructuredPoints(mrtifilename,'image_data')
+  fem_params['spacing']        = setupspacing
+  fem_params['dimensions']     = (setupextent[1]+1,setupextent[3]+1,setupextent[5]+1)
 
   # get power file name
   inisetupfile  = "/".join(locatemrti)+"/setup.ini"
@@ -1323,6 +2015,7 @@ def ParseInput(paramfilename,VisualizeOutput):
   config.read(inisetupfile)
   if (not MatlabDriver):
        fem_params['lambdacode']       = eval(config.get('power','lambdacode'))
+  fem_params['setupini']         = inisetupfile
   fem_params['segment_file']     = config.get('exec','segment_file')
   fem_params['target_landmarks'] = config.get('exec','target_landmarks')
   fem_params['powerhistory']     = config.get('power','history')
@@ -1337,6 +2030,13 @@ def ParseInput(paramfilename,VisualizeOutput):
   ## elif(fem_params['opttype'] == 'cooling'):
   ##   timeinterval = cooltimeinterval
   fem_params['timeinterval'] = timeinterval
+  # objective functions of every window are reduced from the same solve
+  fem_params['timewindows']  = {'fulltime':fulltimeinterval,'heating':heattimeinterval,'cooling':cooltimeinterval}
+  fem_params['objectivewindow'] = ObjectiveWindow
+  if ( ObjectiveWindow == 'opttype' ):
+    fem_params['objectivewindow'] = fem_params['opttype']
+  if ( fem_params['objectivewindow'] not in fem_params['timewindows'] ):
+    raise ValueError("unknown objectivewindow %s, expected one of %s or opttype" % (fem_params['objectivewindow'],fem_params['timewindows'].keys()))
   fem_params['mrtideltat']   = config.getfloat('mrti','deltat') 
   fem_params['initialtime']  = timeinterval[0] * config.getfloat('mrti','deltat') 
   fem_params['finaltime']    = timeinterval[1] * config.getfloat('mrti','deltat') 
@@ -1389,6 +2089,30 @@ def ParseInput(paramfilename,VisualizeOutput):
   #  #shutil.move('results.out.tmp.%d' % fileID, sys.argv[2])
 # end def ParseInput:
 ##################################################################
+def WriteDakotaResults(resultsfilename,fem_params,objfunctionlist,objgradientdict):
+  """
+  write the function values and gradients requested by the ASV
+  a requested gradient w/o a derivative w.r.t. every DVV variable is an
+  error, DAKOTA must difference that function (id_numerical_gradients)
+  """
+  for func_ind in range(len(objfunctionlist)):
+    if (fem_params['asv'][func_ind] & 2):
+      for varname in fem_params['dvv']:
+        if ( varname not in objgradientdict or objgradientdict[varname][func_ind] == None ):
+          raise RuntimeError("no derivative of function %d w.r.t. %s, list it in id_numerical_gradients" % (func_ind+1,varname))
+  fileHandle = file(resultsfilename,'w')
+  # write functions
+  for (func_ind,objfncvalue) in enumerate(objfunctionlist):
+    if (fem_params['asv'][func_ind] & 1):
+      fileHandle.write('%f\n' % objfncvalue )
+  # write gradients w.r.t. the derivative variables
+  for func_ind in range(len(objfunctionlist)):
+    if (fem_params['asv'][func_ind] & 2):
+      gradient = [ objgradientdict[varname][func_ind] for varname in fem_params['dvv'] ]
+      fileHandle.write('[ %s ]\n' % ' '.join(['%22.15e' % derivative for derivative in gradient]) )
+  fileHandle.flush(); fileHandle.close();
+# end def WriteDakotaResults:
+##################################################################
 
 # setup command line parser to control execution
 from optparse import OptionParser
@@ -1408,321 +2132,373 @@ parser.add_option( "--run_min",
 parser.add_option( "--ini", 
                   action="store", dest="config_ini", default=None,
                   help="ini FILE containing setup info", metavar="FILE")
-(options, args) = parser.parse_args()
-
-if (options.param_file != None):
-  # parse the dakota input file
-  fem_params = ParseInput(options.param_file,options.vis_out)
-
-  if(MatlabDriver):
-    print fem_params
-    import scipy.io as scipyio
-    # write out for debug
-    fem_params['patientID'] = options.param_file.split('/')[2]
-    fem_params['UID']       = options.param_file.split('/')[3]
-    #scipyio.savemat( '%s.mat' % options.param_file, MatlabDataDictionary )
-    scipyio.savemat( './TmpDataInput.mat' , fem_params )
-    # FIXME setup any needed paths
-    # FIXME this nees to have a clean matlab env for dakmatlab
-    # FIXME then setup ONCE
-    #os.system( './analytic/dakmatlab setup workspace ' )
-    matlabcommand  = './analytic/dakmatlab %s %s' %  (options.param_file,sys.argv[3])
-    print matlabcommand  
-    os.system( matlabcommand )
-  else:
-    # FIXME link needed directories
-    linkDirectoryList = ['occa','libocca','meshes']
-    for targetDirectory in linkDirectoryList:
-      linkcommand = 'ln -sf %s/%s .' % (brainNekDIR,targetDirectory )
-      print linkcommand 
-      os.system(linkcommand )
-
-    # execute the rosenbrock analysis as a separate Python module
-    print "Running BrainNek..."
-    brainNekWrapper(**fem_params)
+# the functions are imported w/o running a command, ie benchbrainsearch.py
+if ( __name__ == "__main__" ):
+  (options, args) = parser.parse_args()
+
+  if (options.param_file != None):
+    LoadGlobalConfig()
+    # parse the dakota input file
+    fem_params = ParseInput(options.param_file,options.vis_out)
+
+    if(MatlabDriver):
+      print fem_params
+      import scipy.io as scipyio
+      # write out for debug
+      fem_params['patientID'] = options.param_file.split('/')[2]
+      fem_params['UID']       = options.param_file.split('/')[3]
+      #scipyio.savemat( '%s.mat' % options.param_file, MatlabDataDictionary )
+      scipyio.savemat( './TmpDataInput.mat' , fem_params )
+      # FIXME setup any needed paths
+      # FIXME this nees to have a clean matlab env for dakmatlab
+      # FIXME then setup ONCE
+      #os.system( './analytic/dakmatlab setup workspace ' )
+      matlabcommand  = './analytic/dakmatlab %s %s' %  (options.param_file,sys.argv[3])
+      print matlabcommand  
+      os.system( matlabcommand )
+    else:
+      # FIXME link needed directories
+      linkDirectoryList = ['occa','libocca','meshes']
+      for targetDirectory in linkDirectoryList:
+        linkcommand = 'ln -sf %s/%s .' % (brainNekDIR,targetDirectory )
+        print linkcommand 
+        os.system(linkcommand )
+
+      # execute the rosenbrock analysis as a separate Python module
+      # brainNek is only run when the SEM history is not stored
+      print "Running BrainNek..."
+      if ( len(ObjectiveComponents) != fem_params['functions'] ):
+        raise RuntimeError("%d objective components %s, DAKOTA expects %d functions" % (len(ObjectiveComponents),ObjectiveComponents,fem_params['functions']))
     
-    # write objective function back to Dakota
-    objfunctionlist = ComputeObjective(**fem_params)
-
-    print "current objective function: ",objfunctionlist 
-    fileHandle = file(sys.argv[3],'w')
-    for objfncvalue in objfunctionlist:
-      fileHandle.write('%f\n' % objfncvalue )
-    fileHandle.flush(); fileHandle.close();
-
-# find the best point for each run
-elif (options.accum_history ):
-  resultfileList = [
-  #'./workdir/Study0035/0530/',
-  #'./workdir/Study0023/0433/',
-  #'./workdir/Study0023/0428/',
-  ##'./workdir/Study0023/0425/',
-  './workdir/Study0030/0495/',
-  './workdir/Study0030/0497/',
-  './workdir/Study0030/0488/',
-  './workdir/Study0030/0491/',
-  './workdir/Study0030/0496/',
-  './workdir/Study0030/0490/',
-  './workdir/Study0017/0378/',
-  ##'./workdir/Study0018/0388/',
-  './workdir/Study0018/0402/',
-  './workdir/Study0018/0389/',
-  './workdir/Study0018/0385/',
-  './workdir/Study0029/0476/',
-  './workdir/Study0029/0477/',
-  './workdir/Study0025/0438/',
-  './workdir/Study0025/0435/',
-  './workdir/Study0025/0440/',
-  './workdir/Study0025/0436/',
-  './workdir/Study0028/0466/',
-  './workdir/Study0028/0468/',
-  './workdir/Study0028/0471/',
-  #'./workdir/Study0052/0725/',
-  #'./workdir/Study0052/0720/',
-  './workdir/Study0026/0447/',
-  './workdir/Study0026/0457/',
-  './workdir/Study0026/0455/',
-  './workdir/Study0026/0453/',
-  './workdir/Study0026/0450/',
-  './workdir/Study0026/0451/',
-  ##'./workdir/Study0057/0772/',
-  ##'./workdir/Study0057/0769/',
-  './workdir/Study0022/0418/',
-  './workdir/Study0022/0417/',
-  './workdir/Study0021/0409/',
-  './workdir/Study0021/0414/',
-  './workdir/Study0021/0415/',
-  ##'./workdir/Study0054/0753/',
-  ##'./workdir/Study0054/0756/',
-  ##'./workdir/Study0053/0755/',
-  ##'./workdir/Study0006/0183/',
-  ]
-  resultfileList = [
-  #'./workdir/Study0023/0428/',
-  './workdir/Study0030/0495/',
-  './workdir/Study0030/0497/',
-  './workdir/Study0030/0488/',
-  './workdir/Study0030/0491/',
-  './workdir/Study0030/0496/',
-  './workdir/Study0030/0490/',
-  './workdir/Study0017/0378/',
-  './workdir/Study0018/0402/',
-  './workdir/Study0018/0389/',
-  './workdir/Study0018/0385/',
-  './workdir/Study0029/0476/',
-  './workdir/Study0029/0477/',
-  './workdir/Study0025/0438/',
-  './workdir/Study0025/0435/',
-  './workdir/Study0025/0440/',
-  './workdir/Study0025/0436/',
-  './workdir/Study0028/0466/',
-  './workdir/Study0028/0468/',
-  './workdir/Study0028/0471/',
-  './workdir/Study0026/0447/',
-  './workdir/Study0026/0457/',
-  './workdir/Study0026/0455/',
-  './workdir/Study0026/0453/',
-  './workdir/Study0026/0450/',
-  './workdir/Study0026/0451/',
-  './workdir/Study0022/0418/',
-  './workdir/Study0022/0417/',
-  './workdir/Study0021/0409/',
-  './workdir/Study0021/0414/',
-  './workdir/Study0021/0415/',
-  ]
-  ## resultfileList = [
-  ## ## './workdir/Study0030/0491/',
-  ## './workdir/Study0028/0466/',
-  ## ]
+      # reuse a stored evaluation of the same study inputs
+      cachedresults = None
+      if ( EvalCacheFile != None ):
+        import evalcache
+        evaluationCache = evalcache.EvaluationCache(EvalCacheFile,EvalCacheTolerance,EvalCacheMaxEntries)
+        studyinputs  = [ os.path.abspath(__file__), fem_params['setupini'], fem_params['segment_file'],
+                         '%s/pennesfd.py' % os.path.dirname(os.path.abspath(__file__)),
+                         '%s/temperature.*.vtk' % fem_params['mrti'], 'meshes/cooledConformMesh.inp',
+                         fem_params['target_landmarks'] ]
+        # MRTI series container written by tmap.py
+        if ( os.path.isfile('%s/temperature.series.json' % fem_params['mrti']) ):
+          studyinputs.append( '%s/temperature.series.*' % fem_params['mrti'] )
+        # the opttype only changes the solve w/ the MRTI initial condition
+        # for cooling, studies w/ the same window share the evaluations
+        # the landmarks are a study input, their contents are hashed
+        studyoptions = { 'icfrommrti'      : fem_params['opttype'] == 'cooling' ,
+                         'objectivewindow' : fem_params['objectivewindow'] ,
+                         'fdstepsize'      : FDStepSize ,
+                         'objectives'      : ' '.join(ObjectiveComponents) ,
+                         'forwardmodel'    : ForwardModel }
+        studykey      = evaluationCache.StudyKey(studyinputs,studyoptions)
+        cachedresults = evaluationCache.Lookup(studykey,fem_params['cv'],fem_params['asv'],fem_params['dvv'])
+
+      # write objective function back to Dakota
+      fem_params['windowresults'] = {}
+      if ( cachedresults != None ):
+        objfunctionlist = cachedresults['functions']
+        objgradientdict = cachedresults['gradients']
+      elif ( len(filter(lambda asvvalue: asvvalue & 2, fem_params['asv'])) > 0 ):
+        (objfunctionlist,objgradientdict) = ComputeObjectiveGradient(**fem_params)
+      else:
+        (objfunctionlist,objgradientdict) = ComputeObjective(**fem_params)
+
+      # objective functions of every time window and the dice at the end
+      # of heating
+      if ( cachedresults == None ):
+        windowfilename = '%s/objectivewindows.%s.%04d.json' % (outputDirectory % fem_params['UID'],fem_params['opttype'],fem_params['fileID'])
+        print 'writing', windowfilename
+        import json
+        with file(windowfilename,'w') as windowHandle:
+          json.dump( {'components' : ObjectiveComponents,
+                      'timewindows': fem_params['timewindows'],
+                      'windows'    : fem_params['windowresults'] }, windowHandle, indent=2 )
+      if ( EvalCacheFile != None and cachedresults == None ):
+        for (windowname,windowresults) in fem_params['windowresults'].items():
+          studyoptions['objectivewindow'] = windowname
+          evaluationCache.Store(evaluationCache.StudyKey(studyinputs,studyoptions),fem_params['cv'],
+                                evalcache.ActiveSetResults(fem_params['asv'],fem_params['dvv'],windowresults['functions'],windowresults['gradients']))
+
+      print "current objective function: ",objfunctionlist 
+      WriteDakotaResults(sys.argv[3],fem_params,objfunctionlist,objgradientdict)
+
+  # find the best point for each run
+  elif (options.accum_history ):
+    LoadGlobalConfig()
+    resultfileList = [
+    #'./workdir/Study0035/0530/',
+    #'./workdir/Study0023/0433/',
+    #'./workdir/Study0023/0428/',
+    ##'./workdir/Study0023/0425/',
+    './workdir/Study0030/0495/',
+    './workdir/Study0030/0497/',
+    './workdir/Study0030/0488/',
+    './workdir/Study0030/0491/',
+    './workdir/Study0030/0496/',
+    './workdir/Study0030/0490/',
+    './workdir/Study0017/0378/',
+    ##'./workdir/Study0018/0388/',
+    './workdir/Study0018/0402/',
+    './workdir/Study0018/0389/',
+    './workdir/Study0018/0385/',
+    './workdir/Study0029/0476/',
+    './workdir/Study0029/0477/',
+    './workdir/Study0025/0438/',
+    './workdir/Study0025/0435/',
+    './workdir/Study0025/0440/',
+    './workdir/Study0025/0436/',
+    './workdir/Study0028/0466/',
+    './workdir/Study0028/0468/',
+    './workdir/Study0028/0471/',
+    #'./workdir/Study0052/0725/',
+    #'./workdir/Study0052/0720/',
+    './workdir/Study0026/0447/',
+    './workdir/Study0026/0457/',
+    './workdir/Study0026/0455/',
+    './workdir/Study0026/0453/',
+    './workdir/Study0026/0450/',
+    './workdir/Study0026/0451/',
+    ##'./workdir/Study0057/0772/',
+    ##'./workdir/Study0057/0769/',
+    './workdir/Study0022/0418/',
+    './workdir/Study0022/0417/',
+    './workdir/Study0021/0409/',
+    './workdir/Study0021/0414/',
+    './workdir/Study0021/0415/',
+    ##'./workdir/Study0054/0753/',
+    ##'./workdir/Study0054/0756/',
+    ##'./workdir/Study0053/0755/',
+    ##'./workdir/Study0006/0183/',
+    ]
+    resultfileList = [
+    #'./workdir/Study0023/0428/',
+    './workdir/Study0030/0495/',
+    './workdir/Study0030/0497/',
+    './workdir/Study0030/0488/',
+    './workdir/Study0030/0491/',
+    './workdir/Study0030/0496/',
+    './workdir/Study0030/0490/',
+    './workdir/Study0017/0378/',
+    './workdir/Study0018/0402/',
+    './workdir/Study0018/0389/',
+    './workdir/Study0018/0385/',
+    './workdir/Study0029/0476/',
+    './workdir/Study0029/0477/',
+    './workdir/Study0025/0438/',
+    './workdir/Study0025/0435/',
+    './workdir/Study0025/0440/',
+    './workdir/Study0025/0436/',
+    './workdir/Study0028/0466/',
+    './workdir/Study0028/0468/',
+    './workdir/Study0028/0471/',
+    './workdir/Study0026/0447/',
+    './workdir/Study0026/0457/',
+    './workdir/Study0026/0455/',
+    './workdir/Study0026/0453/',
+    './workdir/Study0026/0450/',
+    './workdir/Study0026/0451/',
+    './workdir/Study0022/0418/',
+    './workdir/Study0022/0417/',
+    './workdir/Study0021/0409/',
+    './workdir/Study0021/0414/',
+    './workdir/Study0021/0415/',
+    ]
+    ## resultfileList = [
+    ## ## './workdir/Study0030/0491/',
+    ## './workdir/Study0028/0466/',
+    ## ]
   
-  texHandle  = open('datasummaryL2_10sourceNewton50.tex' , 'w') 
-  fileHandle = open('datasummaryL2_10sourceNewton50.txt' , 'w')
-  # write header
-  fileHandle.write("idstudy,iddata,idopt,mu_eff,alpha,robin,dice,obj,dicepenalty,oneminusdice\n")
-  # loop over files and extract optimal value
-  opttype = options.accum_history 
-  for filenamebase in resultfileList:
-    try: 
-      # get latex command
-      config = ConfigParser.SafeConfigParser({})
-      inisetupfile = '%s/opt/setup.ini' % (filenamebase)
-      config.read(inisetupfile)
+    texHandle  = open('datasummaryL2_10sourceNewton50.tex' , 'w') 
+    fileHandle = open('datasummaryL2_10sourceNewton50.txt' , 'w')
+    # write header
+    fileHandle.write("idstudy,iddata,idopt,mu_eff,alpha,robin,dice,obj,dicepenalty,oneminusdice\n")
+    # loop over files and extract optimal value
+    opttype = options.accum_history 
+    for filenamebase in resultfileList:
+      try: 
+        # get latex command
+        config = ConfigParser.SafeConfigParser({})
+        inisetupfile = '%s/opt/setup.ini' % (filenamebase)
+        config.read(inisetupfile)
   
-      grepcmd = "grep '^heating' %s" %  inisetupfile 
-      print grepcmd 
-      os.system(grepcmd )
-      # get min value
-      (idopt,minobjval,penaltydice,dicevalue,onemindice ) = GetMinJobID( '%s/opt/optpp_pds.%s' % (filenamebase,opttype))
-      print (idopt,minobjval,penaltydice,dicevalue,onemindice ) 
+        grepcmd = "grep '^heating' %s" %  inisetupfile 
+        print grepcmd 
+        os.system(grepcmd )
+        # get min value
+        (idopt,minobjval,penaltydice,dicevalue,onemindice ) = GetMinJobID( '%s/opt/optpp_pds.%s' % (filenamebase,opttype))
+        print (idopt,minobjval,penaltydice,dicevalue,onemindice ) 
       
-      studyid= int(filenamebase.split('/')[2].replace('Study',''))
-      dataid = int(filenamebase.split('/')[3])
-      # count the file lines
-      dakotafilename = '%s/opt/optpp_pds.%s.in.%d' % (filenamebase,opttype,idopt)
-      opt_fem_params = ParseInput(dakotafilename,False)
-      simvariable = opt_fem_params['cv']     
-      # get arrhenius dice value
-      heattimeinterval               = eval(config.get('mrti','heating')  )
-      SEMDataDirectory               = outputDirectory % int(filenamebase.split('/')[-2]) 
-      #dataarray = numpy.loadtxt(filename,skiprows=1,usecols=(0,1,2,3,4,6)
-      fileHandle.write("%05d,%05d,%05d,%s,%s,%s,%12.5e,%12.5e,%12.5e,%12.5e\n" %( studyid, dataid, idopt     ,
-                                                                      simvariable['mu_eff_healthy'],
-                                                                      simvariable['alpha_healthy'],
-                                                                      simvariable['robin_coeff'],
-                                                                      dicevalue,
-                                                                      minobjval,
-                                                                      penaltydice,
-                                                                      onemindice
-                                                                     ))
-      # format latex ouput
-      outputformat                   = config.get('latex','opttype')
-      texFormat = outputformat % (opttype,heattimeinterval[1],opttype,heattimeinterval[1],opttype,heattimeinterval[1],opttype,heattimeinterval[1],opttype,heattimeinterval[1],minobjval,dicevalue)
-      #print texFormat 
-      texHandle.write("%s\n" %(texFormat))
-    except IOError as inst: 
-      print inst
-
-  texHandle.close() 
-  fileHandle.close()
-
-# rerun the optimizer at the minimum
-elif (options.run_min != None):
-
-  templatefilename = options.run_min
-  # get min value
-  (idopt,minobjval,penaltydice,dicevalue,onemindice ) = GetMinJobID( templatefilename )
-  print (idopt,minobjval,dicevalue,onemindice ) 
-
-  # build execution command
-  runcmd = "vglrun python ./brainsearch.py --param_file  %s.in.%d %s.out.%d --vis_out" % (templatefilename,idopt,templatefilename,idopt)
-  print runcmd
-  #FIXME not running ???
-  os.system( runcmd )
+        studyid= int(filenamebase.split('/')[2].replace('Study',''))
+        dataid = int(filenamebase.split('/')[3])
+        # count the file lines
+        dakotafilename = '%s/opt/optpp_pds.%s.in.%d' % (filenamebase,opttype,idopt)
+        opt_fem_params = ParseInput(dakotafilename,False)
+        simvariable = opt_fem_params['cv']     
+        # get arrhenius dice value
+        heattimeinterval               = eval(config.get('mrti','heating')  )
+        SEMDataDirectory               = outputDirectory % int(filenamebase.split('/')[-2]) 
+        #dataarray = numpy.loadtxt(filename,skiprows=1,usecols=(0,1,2,3,4,6)
+        fileHandle.write("%05d,%05d,%05d,%s,%s,%s,%12.5e,%12.5e,%12.5e,%12.5e\n" %( studyid, dataid, idopt     ,
+                                                                        simvariable['mu_eff_healthy'],
+                                                                        simvariable['alpha_healthy'],
+                                                                        simvariable['robin_coeff'],
+                                                                        dicevalue,
+                                                                        minobjval,
+                                                                        penaltydice,
+                                                                        onemindice
+                                                                       ))
+        # format latex ouput
+        outputformat                   = config.get('latex','opttype')
+        texFormat = outputformat % (opttype,heattimeinterval[1],opttype,heattimeinterval[1],opttype,heattimeinterval[1],opttype,heattimeinterval[1],opttype,heattimeinterval[1],minobjval,dicevalue)
+        #print texFormat 
+        texHandle.write("%s\n" %(texFormat))
+      except IOError as inst: 
+        print inst
+
+    texHandle.close() 
+    fileHandle.close()
+
+  # rerun the optimizer at the minimum
+  elif (options.run_min != None):
+
+    templatefilename = options.run_min
+    # the positions of the objective components, the rest of global.ini
+    # is read by the evaluation
+    ObjectiveComponents = ConfiguredObjectiveComponents()
+    # get min value
+    (idopt,minobjval,penaltydice,dicevalue,onemindice ) = GetMinJobID( templatefilename )
+    print (idopt,minobjval,dicevalue,onemindice ) 
+
+    # build execution command
+    # the default renderer needs no display, VISRUN sets a launcher, ie vglrun
+    runcmd = "%s python ./brainsearch.py --param_file  %s.in.%d %s.out.%d --vis_out" % (os.getenv('VISRUN',''),templatefilename,idopt,templatefilename,idopt)
+    print runcmd
+    #FIXME not running ???
+    os.system( runcmd )
   
 
-# run planning solver w/ default options from ini file
-elif (options.config_ini != None):
+  # run planning solver w/ default options from ini file
+  elif (options.config_ini != None):
+    LoadGlobalConfig()
 
-  # read config file
-  config = ConfigParser.SafeConfigParser({})
-  config.read(options.config_ini)
+    # read config file
+    config = ConfigParser.SafeConfigParser({})
+    config.read(options.config_ini)
   
-  fem_params = {}
-  fem_params['UID']           =  0000
-  fem_params['fileID']        = 0
-  fem_params['segment_file']  = config.get('exec','segment_file')
-  # store the entire configuration file for convienence
-  fem_params['config_parser'] = config
+    fem_params = {}
+    fem_params['UID']           =  0000
+    fem_params['fileID']        = 0
+    fem_params['segment_file']  = config.get('exec','segment_file')
+    # store the entire configuration file for convienence
+    fem_params['config_parser'] = config
   
-  # write initial slicer.ini
-  SlicerIniFilename = "./slicer.ini"
-  initialconfig = ConfigParser.SafeConfigParser({})
-  initialconfig.add_section("timestep")
-  initialconfig.add_section("exec")
-  initialconfig.set("timestep","power",config.get('timestep','power'))
-  initialconfig.set("timestep","finaltime","10.0")
-  initialconfig.set("exec","target_landmarks"  ,"./TargetLandmarksvtk.vtk")
-  initialconfig.set("exec","transformlandmarks","./TargetLandmarksras.vtk")
-
-  with open(SlicerIniFilename , 'w') as configfile:
-    initialconfig.write(configfile)
+    # write initial slicer.ini
+    SlicerIniFilename = "./slicer.ini"
+    initialconfig = ConfigParser.SafeConfigParser({})
+    initialconfig.add_section("timestep")
+    initialconfig.add_section("exec")
+    initialconfig.set("timestep","power",config.get('timestep','power'))
+    initialconfig.set("timestep","finaltime","10.0")
+    initialconfig.set("exec","target_landmarks"  ,"./TargetLandmarksvtk.vtk")
+    initialconfig.set("exec","transformlandmarks","./TargetLandmarksras.vtk")
+
+    with open(SlicerIniFilename , 'w') as configfile:
+      initialconfig.write(configfile)
   
-  # time stamp
-  import time
-  timeStamp =0 
-  while(True):
-    if(os.path.getmtime( SlicerIniFilename ) > timeStamp):
-        timeStamp = os.path.getmtime(SlicerIniFilename ) 
-        slicerconfig = ConfigParser.SafeConfigParser({})
-        slicerconfig.read( SlicerIniFilename )
-        fem_params['deltat']        =  5.0
-        fem_params['finaltime']     =  slicerconfig.getfloat('timestep','finaltime')
-        # build lambda funtion for power history
-        fem_params['lambdacode']    =  lambda time:  0.0 if time < fem_params['deltat'] else slicerconfig.getfloat('timestep','power') if time < fem_params['finaltime'] else 0.0
-        fem_params['target_landmarks']   = slicerconfig.get('exec','target_landmarks'  )
-        fem_params['transformlandmarks'] = slicerconfig.get('exec','transformlandmarks')
-        # set tissue lookup tables
-        k_0Table  = {"default":config.getfloat("thermal_conductivity","k_0_healthy")  ,
-                     "vessel" :config.getfloat("thermal_conductivity","k_0_healthy")  ,
-                     "grey"   :config.getfloat("thermal_conductivity","k_0_grey"   )  ,
-                     "white"  :config.getfloat("thermal_conductivity","k_0_white"  )  ,
-                     "csf"    :config.getfloat("thermal_conductivity","k_0_csf"    )  ,
-                     "tumor"  :config.getfloat("thermal_conductivity","k_0_tumor"  )  }
-        w_0Table  = {"default":config.getfloat("perfusion","w_0_healthy")  ,
-                     "vessel" :config.getfloat("perfusion","w_0_healthy")  ,
-                     "grey"   :config.getfloat("perfusion","w_0_grey"   )  ,
-                     "white"  :config.getfloat("perfusion","w_0_white"  )  ,
-                     "csf"    :config.getfloat("perfusion","w_0_csf"    )  ,
-                     "tumor"  :config.getfloat("perfusion","w_0_tumor"  )  }
-        mu_aTable = {"default":config.getfloat("optical","mu_a_healthy")  ,
-                     "vessel" :config.getfloat("optical","mu_a_healthy")  ,
-                     "grey"   :config.getfloat("optical","mu_a_grey"   )  ,
-                     "white"  :config.getfloat("optical","mu_a_white"  )  ,
-                     "csf"    :config.getfloat("optical","mu_a_csf"    )  ,
-                     "tumor"  :config.getfloat("optical","mu_a_tumor"  )  }
-        mu_sTable = {"default":config.getfloat("optical","mu_s_healthy")  ,
-                     "vessel" :config.getfloat("optical","mu_s_healthy")  ,
-                     "grey"   :config.getfloat("optical","mu_s_grey"   )  ,
-                     "white"  :config.getfloat("optical","mu_s_white"  )  ,
-                     "csf"    :config.getfloat("optical","mu_s_csf"    )  ,
-                     "tumor"  :config.getfloat("optical","mu_s_tumor"  )  }
-        anfactTable={"default":config.getfloat("optical","anfact_healthy")  ,
-                     "vessel" :config.getfloat("optical","anfact_healthy")  ,
-                     "grey"   :config.getfloat("optical","anfact_grey"   )  ,
-                     "white"  :config.getfloat("optical","anfact_white"  )  ,
-                     "csf"    :config.getfloat("optical","anfact_csf"    )  ,
-                     "tumor"  :config.getfloat("optical","anfact_tumor"  )  }
-        labelTable= {config.get("labels","greymatter" ):"grey" , 
-                     config.get("labels","whitematter"):"white", 
-                     config.get("labels","csf"        ):"csf"  , 
-                     config.get("labels","tumor"      ):"tumor", 
-                     config.get("labels","vessel"     ):"vessel"}
-        labelCount= {"default":0,
-                     "grey"   :0, 
-                     "white"  :0, 
-                     "csf"    :0, 
-                     "tumor"  :0, 
-                     "vessel" :0}
-        # store constitutive data
-        continuous_vars  = {}
-        continuous_vars['rho'    ]   =  1045.
-        continuous_vars['c_p'    ]   =  3640.
-        continuous_vars['c_blood']   =  3840.
-        continuous_vars['k_0'    ]   =  k_0Table["default"]
-        continuous_vars['w_0'    ]   =  w_0Table["default"]
-        continuous_vars['mu_a'   ]   =  mu_aTable["default"] 
-        continuous_vars['mu_s'   ]   =  mu_sTable["default"]
-        continuous_vars['anfact' ]   =  anfactTable["default"]
-        continuous_vars['body_temp'] = config.getfloat("initial_condition","u_init"  ) 
-        continuous_vars['probe_init'] = 21.0
-        continuous_vars['x_displace'] = 0.0
-        continuous_vars['y_displace'] = 0.0
-        continuous_vars['z_displace'] = 0.0
-        continuous_vars['x_rotate']   = 0.0
-        continuous_vars['y_rotate']   = 0.0
-        continuous_vars['z_rotate']   = 0.0
-        fem_params['cv']         = continuous_vars
-        # execute 
-        print "Running BrainNek..."
-        brainNekWrapper(**fem_params)
+    # time stamp
+    import time
+    timeStamp =0 
+    while(True):
+      if(os.path.getmtime( SlicerIniFilename ) > timeStamp):
+          timeStamp = os.path.getmtime(SlicerIniFilename ) 
+          slicerconfig = ConfigParser.SafeConfigParser({})
+          slicerconfig.read( SlicerIniFilename )
+          fem_params['deltat']        =  5.0
+          fem_params['finaltime']     =  slicerconfig.getfloat('timestep','finaltime')
+          # build lambda funtion for power history
+          fem_params['lambdacode']    =  lambda time:  0.0 if time < fem_params['deltat'] else slicerconfig.getfloat('timestep','power') if time < fem_params['finaltime'] else 0.0
+          fem_params['target_landmarks']   = slicerconfig.get('exec','target_landmarks'  )
+          fem_params['transformlandmarks'] = slicerconfig.get('exec','transformlandmarks')
+          # set tissue lookup tables
+          k_0Table  = {"default":config.getfloat("thermal_conductivity","k_0_healthy")  ,
+                       "vessel" :config.getfloat("thermal_conductivity","k_0_healthy")  ,
+                       "grey"   :config.getfloat("thermal_conductivity","k_0_grey"   )  ,
+                       "white"  :config.getfloat("thermal_conductivity","k_0_white"  )  ,
+                       "csf"    :config.getfloat("thermal_conductivity","k_0_csf"    )  ,
+                       "tumor"  :config.getfloat("thermal_conductivity","k_0_tumor"  )  }
+          w_0Table  = {"default":config.getfloat("perfusion","w_0_healthy")  ,
+                       "vessel" :config.getfloat("perfusion","w_0_healthy")  ,
+                       "grey"   :config.getfloat("perfusion","w_0_grey"   )  ,
+                       "white"  :config.getfloat("perfusion","w_0_white"  )  ,
+                       "csf"    :config.getfloat("perfusion","w_0_csf"    )  ,
+                       "tumor"  :config.getfloat("perfusion","w_0_tumor"  )  }
+          mu_aTable = {"default":config.getfloat("optical","mu_a_healthy")  ,
+                       "vessel" :config.getfloat("optical","mu_a_healthy")  ,
+                       "grey"   :config.getfloat("optical","mu_a_grey"   )  ,
+                       "white"  :config.getfloat("optical","mu_a_white"  )  ,
+                       "csf"    :config.getfloat("optical","mu_a_csf"    )  ,
+                       "tumor"  :config.getfloat("optical","mu_a_tumor"  )  }
+          mu_sTable = {"default":config.getfloat("optical","mu_s_healthy")  ,
+                       "vessel" :config.getfloat("optical","mu_s_healthy")  ,
+                       "grey"   :config.getfloat("optical","mu_s_grey"   )  ,
+                       "white"  :config.getfloat("optical","mu_s_white"  )  ,
+                       "csf"    :config.getfloat("optical","mu_s_csf"    )  ,
+                       "tumor"  :config.getfloat("optical","mu_s_tumor"  )  }
+          anfactTable={"default":config.getfloat("optical","anfact_healthy")  ,
+                       "vessel" :config.getfloat("optical","anfact_healthy")  ,
+                       "grey"   :config.getfloat("optical","anfact_grey"   )  ,
+                       "white"  :config.getfloat("optical","anfact_white"  )  ,
+                       "csf"    :config.getfloat("optical","anfact_csf"    )  ,
+                       "tumor"  :config.getfloat("optical","anfact_tumor"  )  }
+          labelTable= {config.get("labels","greymatter" ):"grey" , 
+                       config.get("labels","whitematter"):"white", 
+                       config.get("labels","csf"        ):"csf"  , 
+                       config.get("labels","tumor"      ):"tumor", 
+                       config.get("labels","vessel"     ):"vessel"}
+          labelCount= {"default":0,
+                       "grey"   :0, 
+                       "white"  :0, 
+                       "csf"    :0, 
+                       "tumor"  :0, 
+                       "vessel" :0}
+          # store constitutive data
+          continuous_vars  = {}
+          continuous_vars['rho'    ]   =  1045.
+          continuous_vars['c_p'    ]   =  3640.
+          continuous_vars['c_blood']   =  3840.
+          continuous_vars['k_0'    ]   =  k_0Table["default"]
+          continuous_vars['w_0'    ]   =  w_0Table["default"]
+          continuous_vars['mu_a'   ]   =  mu_aTable["default"] 
+          continuous_vars['mu_s'   ]   =  mu_sTable["default"]
+          continuous_vars['anfact' ]   =  anfactTable["default"]
+          continuous_vars['body_temp'] = config.getfloat("initial_condition","u_init"  ) 
+          continuous_vars['probe_init'] = 21.0
+          continuous_vars['x_displace'] = 0.0
+          continuous_vars['y_displace'] = 0.0
+          continuous_vars['z_displace'] = 0.0
+          continuous_vars['x_rotate']   = 0.0
+          continuous_vars['y_rotate']   = 0.0
+          continuous_vars['z_rotate']   = 0.0
+          fem_params['cv']         = continuous_vars
+          # execute 
+          print "Running BrainNek..."
+          brainNekWrapper(**fem_params)
         
-        # write objective function 
-        objfunction = ForwardSolve(**fem_params)
-    else:
-      print "waiting on user input..",SlicerIniFilename 
-      # echo lookup table
-      print "lookup tables"
-      #print "labeled %d voxels" % len(imageLabel)
-      print "labels"      , labelTable
-      print "counts"      , labelCount
-      print "conductivity", k_0Table  
-      print "perfusion"   , w_0Table  
-      print "absorption"  , mu_aTable  
-      print "scattering"  , mu_sTable  
-      print "anfact"      , anfactTable  
-      time.sleep(2)
-else:
-  parser.print_help()
-  print options
-
-print DiceTxtFileParse('/tmp/outputs/dakota/0450/dice.heating.0061.txt')
+          # write objective function 
+          objfunction = ForwardSolve(**fem_params)
+      else:
+        print "waiting on user input..",SlicerIniFilename 
+        # echo lookup table
+        print "lookup tables"
+        #print "labeled %d voxels" % len(imageLabel)
+        print "labels"      , labelTable
+        print "counts"      , labelCount
+        print "conductivity", k_0Table  
+        print "perfusion"   , w_0Table  
+        print "absorption"  , mu_aTable  
+        print "scattering"  , mu_sTable  
+        print "anfact"      , anfactTable  
+        time.sleep(2)
+  else:
+    parser.print_help()
+    print options
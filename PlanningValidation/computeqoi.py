@@ -12,6 +12,7 @@ import time
 import pyopencl as cl
 import numpy
 import numpy.linalg as la
+import mrtiio
 
 brainNekDIR     = '/workarea/fuentes/braincode/tym1' 
 workDirectory   = 'optpp_pds'
@@ -108,25 +109,22 @@ class BrainNekWrapper:
         import vtk.util.numpy_support as vtkNumPy 
         print "using vtk version", vtk.vtkVersion.GetVTKVersion()
         print "read SEM data"
-        vtkImageReader = vtk.vtkDataSetReader() 
-        vtkImageReader.SetFileName(mrtifilename )
-        vtkImageReader.Update() 
-        ## image_cells = vtkImageReader.GetOutput().GetPointData() 
-        ## data_array = vtkNumPy.vtk_to_numpy(image_cells.GetArray('scalars')) 
-        
-        # extract voi for QOI
-        vtkVOIExtract = vtk.vtkExtractVOI() 
-        vtkVOIExtract.SetInput( vtkImageReader.GetOutput() ) 
-        vtkVOIExtract.SetVOI( VolumeOfInterest  ) 
-        vtkVOIExtract.Update()
-        mrti_point_data= vtkVOIExtract.GetOutput().GetPointData() 
-        mrti_array = vtkNumPy.vtk_to_numpy(mrti_point_data.GetArray('image_data')) 
+        # read the voi for QOI
+        (mrtiorigin,mrtispacing,voiextent,mrti_array) = mrtiio.ReadStructuredPoints(mrtifilename,'image_data',VolumeOfInterest)
+        vtkMRTIImage = vtk.vtkImageData()
+        vtkMRTIImage.SetOrigin( mrtiorigin )
+        vtkMRTIImage.SetSpacing( mrtispacing )
+        vtkMRTIImage.SetExtent( voiextent )
+        vtkMRTIImage.SetWholeExtent( voiextent )
+        vtkMRTIArray = vtkNumPy.numpy_to_vtk( mrti_array, 1 ) 
+        vtkMRTIArray.SetName("image_data") 
+        vtkMRTIImage.GetPointData().SetScalars( vtkMRTIArray )
         #print mrti_array
         #print type(mrti_array)
   
         print "project SEM onto MRTI for comparison"
         vtkResample = vtk.vtkCompositeDataProbeFilter()
-        vtkResample.SetSource( vtkVOIExtract.GetOutput() )
+        vtkResample.SetSource( vtkMRTIImage )
         vtkResample.SetInput( self.SEMRegister.GetOutput() ) 
         vtkResample.Update()
   
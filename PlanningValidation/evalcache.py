@@ -0,0 +1,387 @@
+# persistent memoization of DAKOTA function evaluations
+#
+# pattern searches and restarted studies resubmit parameter points that were
+# already evaluated. the results are stored in an sqlite database keyed by
+#   1. a hash of the study inputs (setup files, MRTI series, mesh, options)
+#   2. the canonicalized parameter vector
+# sqlite locking makes the database safe to share between the concurrent
+# evaluations of a study (NOTE locking is unreliable on some network file
+# systems, keep the database on a local or lustre w/ flock file system)
+#
+# brainsearch.py uses the EvaluationCache class directly. other analysis
+# drivers call this file from the driver script, see ../NanoMouseJune12/ibrun_par_driver
+#
+#   python evalcache.py --database=cache.sqlite --lookup params.in results.out --input='mesh.e' ...
+#      exit status 0 and results.out written on a hit, 1 on a miss
+#   python evalcache.py --database=cache.sqlite --store  params.in results.out --input='mesh.e' ...
+
+import os
+import sys
+import re
+import time
+import glob
+import json
+import sqlite3
+import hashlib
+
+# Convenience Routine
+def CanonicalVariables(variables):
+  """
+  sorted (name,value) w/ values rounded to 12 significant digits
+  non numeric values are kept as strings
+  """
+  canonical = []
+  for (varname,varvalue) in variables.items():
+    try:
+      canonical.append( (varname,'%.12e' % float(varvalue)) )
+    except (TypeError,ValueError):
+      canonical.append( (varname,str(varvalue)) )
+  return sorted(canonical)
+
+# Convenience Routine
+def VariablesWithinTolerance(variables,candidate,tolerance):
+  """
+  |x - y| <= tolerance * max(1,|x|,|y|) for every variable
+  relative for large values, absolute near zero
+  """
+  if ( sorted(variables.keys()) != sorted(candidate.keys()) ):
+    return False
+  for (varname,varvalue) in variables.items():
+    try:
+      x = float(varvalue); y = float(candidate[varname])
+    except (TypeError,ValueError):
+      if ( str(varvalue) != str(candidate[varname]) ):
+        return False
+      continue
+    if ( abs(x-y) > tolerance * max(1.,abs(x),abs(y)) ):
+      return False
+  return True
+
+# Convenience Routine
+def LeadingValue(variables):
+  """ value of the first numeric variable in name order, None if none is numeric """
+  for (varname,varvalue) in sorted(variables.items()):
+    try:
+      return float(varvalue)
+    except (TypeError,ValueError):
+      continue
+  return None
+
+# Convenience Routine
+def LeadingValueBounds(leadingvalue,tolerance):
+  """
+  range of the leading value of the points within tolerance, a superset of
+  VariablesWithinTolerance: |x-y| <= tol*(1+|x|+|y|) <= tol*(1+2|x|+|x-y|)
+  None for tolerance >= 1
+  """
+  if ( tolerance >= 1.0 ):
+    return None
+  radius = tolerance * (1. + 2.*abs(leadingvalue)) / (1. - tolerance)
+  return (leadingvalue - radius,leadingvalue + radius)
+
+##################################################################
+class EvaluationCache:
+  """ Class for persistent memoization of function evaluations...  """
+  def __init__(self,databasefile,tolerance=0.0,maxentries=None):
+    # tolerance  match nearby points, 0.0 requires the canonical values to agree
+    # maxentries least recently used evaluations are removed above this size
+    self.DatabaseFile = databasefile
+    self.Tolerance    = tolerance
+    self.MaxEntries   = maxentries
+    databasedir = os.path.dirname(os.path.abspath(databasefile))
+    if ( not os.path.isdir(databasedir) ):
+      os.system('mkdir -p %s' % databasedir )
+    connection = self.Connect()
+    connection.execute('''create table if not exists evaluations (
+                            evalkey   text primary key,
+                            studykey  text,
+                            variables text,
+                            results   text,
+                            lastused  real)''')
+    connection.execute('create index if not exists evaluationsstudy on evaluations (studykey)')
+    # the tolerance search is restricted by the leading value of the
+    # parameters, added to databases of previous versions
+    columnnames = [ column[1] for column in connection.execute('pragma table_info(evaluations)') ]
+    if ( 'leadingvalue' not in columnnames ):
+      connection.execute('alter table evaluations add column leadingvalue real')
+      for (evalkey,storedvariables) in connection.execute('select evalkey,variables from evaluations').fetchall():
+        connection.execute('update evaluations set leadingvalue=? where evalkey=?',
+                           (LeadingValue(json.loads(storedvariables)),evalkey))
+    connection.execute('create index if not exists evaluationsleading on evaluations (studykey,leadingvalue)')
+    # input file digests, rehashed when the file size or time stamp changes
+    connection.execute('''create table if not exists inputs (
+                            filename  text primary key,
+                            stamp     text,
+                            digest    text)''')
+    connection.commit()
+    connection.close()
+
+  def Connect(self):
+    # wait on concurrent writers instead of failing
+    return sqlite3.connect(self.DatabaseFile,timeout=600.)
+
+  def FileDigest(self,connection,filename):
+    """ sha1 of the file contents, stored by size and time stamp """
+    filestat = os.stat(filename)
+    stamp = '%d %.6f' % (filestat.st_size,filestat.st_mtime)
+    row = connection.execute('select stamp,digest from inputs where filename=?',(filename,)).fetchone()
+    if ( row != None and row[0] == stamp ):
+      return row[1]
+    filehash = hashlib.sha1()
+    with open(filename,'rb') as fileHandle:
+      for block in iter(lambda: fileHandle.read(1048576), ''):
+        filehash.update(block)
+    digest = filehash.hexdigest()
+    connection.execute('insert or replace into inputs values (?,?,?)',(filename,stamp,digest))
+    return digest
+
+  def StudyKey(self,inputpatterns,options={}):
+    """
+    hash of the study input files and options, the file patterns are
+    expanded w/ glob. directories are included recursively
+    """
+    filelist = []
+    for pattern in inputpatterns:
+      for filename in sorted(glob.glob(pattern)):
+        if ( os.path.isdir(filename) ):
+          for (dirpath,dirnames,filenames) in sorted(os.walk(filename)):
+            dirnames.sort()
+            filelist = filelist + [os.path.join(dirpath,name) for name in sorted(filenames)]
+        else:
+          filelist.append(filename)
+      if ( len(glob.glob(pattern)) == 0 ):
+        print "WARNING: no study input matches", pattern
+    connection = self.Connect()
+    digestlist = [ (os.path.abspath(filename),self.FileDigest(connection,os.path.abspath(filename))) for filename in filelist ]
+    connection.commit()
+    connection.close()
+    return hashlib.sha1(repr( (digestlist,sorted(options.items())) )).hexdigest()
+
+  def EvaluationKey(self,studykey,variables):
+    return hashlib.sha1(repr( (studykey,CanonicalVariables(variables)) )).hexdigest()
+
+  def Lookup(self,studykey,variables,asv,dvv=[]):
+    """
+    stored results covering the active set, None on a miss
+    results are {'functions':[...],'gradients':{varname:[...]}} w/ one
+    entry per function, None where not evaluated
+    """
+    connection = self.Connect()
+    # exact key first (primary key), the tolerance search runs on a miss
+    # and only over the points w/ a leading value in range (index)
+    row = connection.execute('select evalkey,results from evaluations where evalkey=?',
+                             (self.EvaluationKey(studykey,variables),)).fetchone()
+    candidates = []
+    if ( row != None ):
+      candidates.append(row)
+    elif ( self.Tolerance > 0.0 ):
+      leadingvalue = LeadingValue(variables)
+      leadingbounds = None
+      if ( leadingvalue != None ):
+        leadingbounds = LeadingValueBounds(leadingvalue,self.Tolerance)
+      if ( leadingbounds != None ):
+        rows = connection.execute('select evalkey,variables,results from evaluations where studykey=? and leadingvalue between ? and ?',
+                                  (studykey,leadingbounds[0],leadingbounds[1]))
+      else:
+        rows = connection.execute('select evalkey,variables,results from evaluations where studykey=?',(studykey,))
+      for (evalkey,storedvariables,results) in rows:
+        if ( VariablesWithinTolerance(variables,json.loads(storedvariables),self.Tolerance) ):
+          candidates.append( (evalkey,results) )
+    hit = None
+    for (evalkey,results) in candidates:
+      results = json.loads(results)
+      if ( ResultsCoverActiveSet(results,asv,dvv) ):
+        hit = (evalkey,results)
+        break
+    if ( hit != None ):
+      connection.execute('update evaluations set lastused=? where evalkey=?',(time.time(),hit[0]))
+      connection.commit()
+    connection.close()
+    if ( hit != None ):
+      print 'evaluation cache hit', hit[0]
+      return hit[1]
+    return None
+
+  def Store(self,studykey,variables,results):
+    """ merge w/ previously stored values at the same point """
+    evalkey = self.EvaluationKey(studykey,variables)
+    connection = self.Connect()
+    # hold the write lock for the read-merge-write
+    connection.execute('begin immediate')
+    row = connection.execute('select results from evaluations where evalkey=?',(evalkey,)).fetchone()
+    if ( row != None ):
+      results = MergeResults(json.loads(row[0]),results)
+    connection.execute('insert or replace into evaluations (evalkey,studykey,variables,results,lastused,leadingvalue) values (?,?,?,?,?,?)',
+                       (evalkey,studykey,json.dumps(dict(variables)),json.dumps(results),time.time(),LeadingValue(variables)))
+    # least recently used
+    if ( self.MaxEntries != None ):
+      connection.execute('''delete from evaluations where evalkey in
+                              (select evalkey from evaluations order by lastused desc limit -1 offset ?)''',
+                         (self.MaxEntries,))
+    connection.commit()
+    connection.close()
+
+# Convenience Routine
+def ResultsCoverActiveSet(results,asv,dvv):
+  """ all values and gradients requested by the ASV are stored """
+  functions = results['functions']
+  gradients = results['gradients']
+  if ( len(functions) != len(asv) ):
+    return False
+  for (func_ind,asvvalue) in enumerate(asv):
+    if ( asvvalue & 1 and functions[func_ind] == None ):
+      return False
+    if ( asvvalue & 2 ):
+      for varname in dvv:
+        if ( varname not in gradients or gradients[varname][func_ind] == None ):
+          return False
+    # hessians are not stored
+    if ( asvvalue & 4 ):
+      return False
+  return True
+
+# Convenience Routine
+def MergeResults(storedresults,results):
+  """ new values replace stored values where available """
+  merged = {'functions':list(storedresults['functions']),
+            'gradients':dict(storedresults['gradients'])}
+  if ( len(merged['functions']) != len(results['functions']) ):
+    return results
+  for (func_ind,fncvalue) in enumerate(results['functions']):
+    if ( fncvalue != None ):
+      merged['functions'][func_ind] = fncvalue
+  for (varname,gradient) in results['gradients'].items():
+    storedgradient = list(merged['gradients'].get(varname,[None for fncvalue in gradient]))
+    for (func_ind,derivative) in enumerate(gradient):
+      if ( derivative != None ):
+        storedgradient[func_ind] = derivative
+    merged['gradients'][varname] = storedgradient
+  return merged
+
+# Convenience Routine
+def ActiveSetResults(asv,dvv,objfunctionlist,objgradientdict):
+  """ results dictionary from the values and gradients requested by the ASV """
+  functions = [None for asvvalue in asv]
+  gradients = dict([ (varname,[None for asvvalue in asv]) for varname in dvv ])
+  for (func_ind,asvvalue) in enumerate(asv):
+    if ( asvvalue & 1 ):
+      functions[func_ind] = float(objfunctionlist[func_ind])
+    if ( asvvalue & 2 ):
+      for varname in dvv:
+        if ( varname in objgradientdict ):
+          gradients[varname][func_ind] = float(objgradientdict[varname][func_ind])
+  return {'functions':functions,'gradients':gradients}
+
+##################################################################
+# command line interface for analysis drivers
+##################################################################
+def ParseParametersFile(paramfilename):
+  """
+  variables, ASV, and DVV from a DAKOTA parameters file, standard or aprepro
+  """
+  # same matching as the analysis codes
+  e = '-?(?:\\d+\\.?\\d*|\\.\\d+)[eEdD](?:\\+|-)?\\d+' # exponential notation
+  f = '-?\\d+\\.\\d*|-?\\.\\d+'                        # floating point
+  i = '-?\\d+'                                         # integer
+  value = e+'|'+f+'|'+i                                # numeric field
+  tag = '\\w+(?::\\w+)*'                               # text tag field
+  aprepro_regex = re.compile('^\s*\{\s*(' + tag + ')\s*=\s*(' + value +')\s*\}$')
+  standard_regex = re.compile('^\s*(' + value +')\s+(' + tag + ')$')
+
+  # keep the file order, the variables follow the variable count
+  paramslist = []
+  for line in open(paramfilename, 'r'):
+    m = aprepro_regex.match(line)
+    if m:
+      paramslist.append( (m.group(1),m.group(2)) )
+    else:
+      m = standard_regex.match(line)
+      if m:
+        paramslist.append( (m.group(2),m.group(1)) )
+  paramsdict = dict(paramslist)
+  paramnames = [paramname for (paramname,paramvalue) in paramslist]
+
+  variables = {}
+  for countname in ['variables','DAKOTA_VARS']:
+    if ( countname in paramsdict ):
+      idcount = paramnames.index(countname)
+      variables = dict( paramslist[idcount+1:idcount+1+int(paramsdict[countname])] )
+  asvlist = []
+  dvvlist = []
+  for (paramname,paramvalue) in paramslist:
+    if ( paramname.startswith('ASV_') ):
+      asvlist.append( (int(paramname.split(':')[0].split('_').pop()),int(paramvalue)) )
+    if ( paramname.startswith('DVV_') ):
+      dvvlist.append( (int(paramname.split(':')[0].split('_').pop()),paramname.split(':').pop()) )
+  asv = [asvvalue for (asvid,asvvalue) in sorted(asvlist)]
+  # DVV_i:descriptor
+  dvv = [dvvname for (dvvid,dvvname) in sorted(dvvlist)]
+  return (variables,asv,dvv)
+
+def ReadResultsFile(resultsfilename,asv,dvv):
+  """ function values and gradients in DAKOTA results format """
+  lines = [line.strip() for line in open(resultsfilename,'r') if len(line.strip()) > 0]
+  valuelines    = [line for line in lines if not line.startswith('[')]
+  gradientlines = [line.strip('[]').split() for line in lines if line.startswith('[') and not line.startswith('[[')]
+  objfunctionlist = [0.0 for asvvalue in asv]
+  objgradientdict = dict([ (varname,[0.0 for asvvalue in asv]) for varname in dvv ])
+  for func_ind in [func_ind for (func_ind,asvvalue) in enumerate(asv) if asvvalue & 1]:
+    objfunctionlist[func_ind] = float(valuelines.pop(0).split()[0])
+  for func_ind in [func_ind for (func_ind,asvvalue) in enumerate(asv) if asvvalue & 2]:
+    for (varname,derivative) in zip(dvv,gradientlines.pop(0)):
+      objgradientdict[varname][func_ind] = float(derivative)
+  return ActiveSetResults(asv,dvv,objfunctionlist,objgradientdict)
+
+def WriteResultsFile(resultsfilename,asv,dvv,results):
+  """ write to a temporary file and move, DAKOTA may poll for the file """
+  tmpfilename = '%s.%d.tmp' % (resultsfilename,os.getpid())
+  fileHandle = open(tmpfilename,'w')
+  for (func_ind,asvvalue) in enumerate(asv):
+    if ( asvvalue & 1 ):
+      fileHandle.write('%22.15e f%d\n' % (results['functions'][func_ind],func_ind) )
+  for (func_ind,asvvalue) in enumerate(asv):
+    if ( asvvalue & 2 ):
+      fileHandle.write('[ %s ]\n' % ' '.join(['%22.15e' % results['gradients'][varname][func_ind] for varname in dvv]) )
+  fileHandle.flush(); fileHandle.close()
+  os.rename(tmpfilename,resultsfilename)
+
+if __name__ == "__main__":
+  from optparse import OptionParser
+  parser = OptionParser(usage="usage: %prog --database=FILE (--lookup|--store) params.in results.out [--input=PATTERN ...]")
+  parser.add_option( "--database",
+                    action="store", dest="database", default="evalcache.sqlite",
+                    help="sqlite cache FILE", metavar="FILE")
+  parser.add_option( "--lookup",
+                    action="store_true", dest="lookup", default=False,
+                    help="write results file from the cache, exit status 1 on a miss")
+  parser.add_option( "--store",
+                    action="store_true", dest="store", default=False,
+                    help="store results file in the cache")
+  parser.add_option( "--input",
+                    action="append", dest="inputs", default=[],
+                    help="study input files, glob PATTERN", metavar="PATTERN")
+  parser.add_option( "--option",
+                    action="append", dest="options", default=[],
+                    help="study option included in the key", metavar="NAME=VALUE")
+  parser.add_option( "--tolerance",
+                    action="store", dest="tolerance", type="float", default=0.0,
+                    help="match parameters within TOL", metavar="TOL")
+  parser.add_option( "--max_entries",
+                    action="store", dest="maxentries", type="int", default=None,
+                    help="least recently used evaluations above N are removed", metavar="N")
+  (options, args) = parser.parse_args()
+  if ( len(args) != 2 or options.lookup == options.store ):
+    parser.print_help()
+    sys.exit(2)
+  (paramfilename,resultsfilename) = args
+
+  evaluationCache = EvaluationCache(options.database,options.tolerance,options.maxentries)
+  studykey = evaluationCache.StudyKey(options.inputs,dict([option.split('=',1) for option in options.options]))
+  (variables,asv,dvv) = ParseParametersFile(paramfilename)
+  if ( options.lookup ):
+    results = evaluationCache.Lookup(studykey,variables,asv,dvv)
+    if ( results == None ):
+      sys.exit(1)
+    WriteResultsFile(resultsfilename,asv,dvv,results)
+  else:
+    evaluationCache.Store(studykey,variables,ReadResultsFile(resultsfilename,asv,dvv))
@@ -0,0 +1,267 @@
+# queue of DAKOTA evaluations served by a single long lived MPI job
+#
+# the analysis drivers launched a separate `ibrun -n APPLIC_PROCS` per
+# evaluation and paid the MPI startup and the petsc/libMesh initialization
+# every time. here one MPI job splits COMM_WORLD into sub-communicators of
+# --procs ranks. each sub-communicator initializes the model once and pulls
+# params files from a queue directory shared w/ the driver script
+#
+#   ibrun python evalqueue.py --serve  --queue=DIR --procs=4 --model=./deltapModeling.py -- [petsc options]
+#   python evalqueue.py --submit --queue=DIR params.in.N results.out.N     (analysis driver)
+#   touch DIR/stop                                                        (end of the study)
+#
+# the model module provides
+#   InitializeLibraries(comm)      petsc on the sub-communicator, libMesh
+#   RunEvaluation(params,results)  DAKOTA evaluation
+#
+# a job is claimed atomically by renaming it from DIR/pending to
+# DIR/running. each evaluation runs in the directory of its params file
+# (ie the DAKOTA work_directory), relative paths of the model (mesh,
+# caches, exodus output) are the same as w/ the driver script
+#
+# the output of an evaluation (every rank, petsc included) is appended to
+# results.out.N.log as w/ the `ibrun ... > $2.log` of the driver script
+#
+# an exception on some ranks of a worker would leave the others blocked in
+# a petsc/libMesh collective. the abort takes down every worker, so the
+# failing rank moves the running and pending jobs to DIR/failed and aborts
+# the MPI job. a restarted server returns the jobs left in DIR/running to
+# DIR/pending
+#
+# rank 0 of the server touches DIR/heartbeat every --poll seconds, a
+# submitted job fails when the heartbeat has not changed for --timeout
+# seconds (the server was killed, crashed, or stopped). the heartbeat is a
+# python thread, --timeout must exceed the longest petsc/libMesh call of an
+# evaluation that holds the interpreter
+
+import os
+import sys
+import time
+import imp
+import threading
+import traceback
+
+# Convenience Routine
+def QueueDirectories(queuedirectory):
+  """ pending, running, done, and failed jobs """
+  directories = dict([ (state,'%s/%s' % (queuedirectory,state)) for state in ['pending','running','done','failed'] ])
+  for directory in directories.values():
+    if ( not os.path.isdir(directory) ):
+      os.system('mkdir -p %s' % directory)
+  return directories
+
+# Convenience Routine
+def HeartbeatTime(queuedirectory):
+  """ modification time of the server heartbeat, None before the server starts """
+  try:
+    return os.stat('%s/heartbeat' % queuedirectory).st_mtime
+  except OSError:
+    return None
+
+# Convenience Routine
+def Heartbeat(queuedirectory,polltime):
+  """ touch the heartbeat file every polltime seconds """
+  heartbeatfilename = '%s/heartbeat' % queuedirectory
+  while ( True ):
+    heartbeatHandle = open(heartbeatfilename,'w')
+    heartbeatHandle.write('%d %f\n' % (os.getpid(),time.time()))
+    heartbeatHandle.close()
+    time.sleep(polltime)
+
+# Convenience Routine
+def SubmitEvaluation(queuedirectory,paramsfilename,resultsfilename,polltime=1.0,timeout=1800.):
+  """
+  add a job to the queue and wait for the results file
+  returns 0 when the results are written, 1 if the evaluation failed or
+  the server heartbeat did not change for timeout seconds. the heartbeat
+  is compared to its previous value on this host, the clocks of the
+  server and the driver may differ
+  """
+  directories = QueueDirectories(queuedirectory)
+  jobname = 'job.%s.%d' % (os.path.basename(paramsfilename),os.getpid())
+  tmpfile = '%s/%s.tmp' % (queuedirectory,jobname)
+  jobHandle = open(tmpfile,'w')
+  jobHandle.write('%s\n%s\n' % (os.path.abspath(paramsfilename),os.path.abspath(resultsfilename)))
+  jobHandle.close()
+  os.rename(tmpfile,'%s/%s' % (directories['pending'],jobname))
+  heartbeat = HeartbeatTime(queuedirectory)
+  lastbeat  = time.time()
+  while ( True ):
+    if ( os.path.isfile('%s/%s' % (directories['done'],jobname)) ):
+      return 0
+    if ( os.path.isfile('%s/%s' % (directories['failed'],jobname)) ):
+      return 1
+    if ( HeartbeatTime(queuedirectory) != heartbeat ):
+      heartbeat = HeartbeatTime(queuedirectory)
+      lastbeat  = time.time()
+    elif ( time.time() - lastbeat > timeout ):
+      print "no heartbeat from the server in %s for %f seconds" % (queuedirectory,timeout)
+      return 1
+    time.sleep(polltime)
+
+# Convenience Routine
+def RequeueEvaluations(directories):
+  """ jobs running when a previous server stopped are pending again """
+  for runningname in sorted(os.listdir(directories['running'])):
+    jobname = runningname.rsplit('.worker',1)[0]
+    print "requeue", jobname
+    os.rename('%s/%s' % (directories['running'],runningname),'%s/%s' % (directories['pending'],jobname))
+
+# Convenience Routine
+def FailEvaluations(directories):
+  """ running and pending jobs moved to failed before the MPI job is aborted """
+  for state in ['running','pending']:
+    for statename in sorted(os.listdir(directories[state])):
+      jobname = statename.rsplit('.worker',1)[0]
+      try:
+        os.rename('%s/%s' % (directories[state],statename),'%s/%s' % (directories['failed'],jobname))
+      except OSError:
+        # moved by another rank
+        pass
+
+# Convenience Routine
+def RedirectOutput(logfilename):
+  """
+  append stdout and stderr of the process (petsc included) to logfilename
+  returns the saved descriptors for RestoreOutput
+  """
+  sys.stdout.flush(); sys.stderr.flush()
+  savedDescriptors = (os.dup(1),os.dup(2))
+  logDescriptor = os.open(logfilename,os.O_WRONLY|os.O_CREAT|os.O_APPEND,0644)
+  os.dup2(logDescriptor,1)
+  os.dup2(logDescriptor,2)
+  os.close(logDescriptor)
+  return savedDescriptors
+
+# Convenience Routine
+def RestoreOutput(savedDescriptors):
+  sys.stdout.flush(); sys.stderr.flush()
+  os.dup2(savedDescriptors[0],1)
+  os.dup2(savedDescriptors[1],2)
+  os.close(savedDescriptors[0])
+  os.close(savedDescriptors[1])
+
+# Convenience Routine
+def ClaimEvaluation(directories,workerid):
+  """ first pending job renamed to running, None if the queue is empty """
+  for jobname in sorted(os.listdir(directories['pending'])):
+    runningfile = '%s/%s.worker%d' % (directories['running'],jobname,workerid)
+    try:
+      os.rename('%s/%s' % (directories['pending'],jobname),runningfile)
+    except OSError:
+      # claimed by another sub-communicator
+      continue
+    jobHandle = open(runningfile,'r')
+    (paramsfilename,resultsfilename) = [ line.strip() for line in jobHandle.readlines()[:2] ]
+    jobHandle.close()
+    # every rank of the worker appends to the evaluation log
+    open('%s.log' % resultsfilename,'w').close()
+    return (jobname,runningfile,paramsfilename,resultsfilename)
+  return None
+
+##################################################################
+def ServeEvaluations(queuedirectory,modelfilename,procs,polltime=1.0):
+  """
+  split COMM_WORLD into sub-communicators of procs ranks and run the
+  queued evaluations until DIR/stop exists and the queue is empty
+  """
+  from mpi4py import MPI
+  worldsize = MPI.COMM_WORLD.Get_size()
+  worldrank = MPI.COMM_WORLD.Get_rank()
+  if ( worldsize % procs != 0 ):
+    raise RuntimeError("%d ranks are not a multiple of --procs=%d" % (worldsize,procs))
+  workerid = worldrank / procs
+  subComm = MPI.COMM_WORLD.Split(workerid,worldrank)
+  print "rank %d of %d, worker %d of %d" % (worldrank,worldsize,workerid,worldsize/procs)
+
+  # petsc and libMesh are initialized once per worker
+  model = imp.load_source('evaluationmodel',modelfilename)
+  model.InitializeLibraries(subComm)
+
+  directories = QueueDirectories(queuedirectory)
+  if ( worldrank == 0 ):
+    RequeueEvaluations(directories)
+    heartbeatThread = threading.Thread(target=Heartbeat,args=(queuedirectory,polltime))
+    heartbeatThread.setDaemon(True)
+    heartbeatThread.start()
+  MPI.COMM_WORLD.Barrier()
+  stopfile = '%s/stop' % queuedirectory
+  numevaluations = 0
+  while ( True ):
+    # rank 0 of the worker claims the job, the others follow
+    job = None
+    if ( subComm.Get_rank() == 0 ):
+      job = ClaimEvaluation(directories,workerid)
+      if ( job == None and os.path.isfile(stopfile) ):
+        job = 'stop'
+    job = subComm.bcast(job,root=0)
+    if ( job == 'stop' ):
+      break
+    if ( job == None ):
+      time.sleep(polltime)
+      continue
+    (jobname,runningfile,paramsfilename,resultsfilename) = job
+    # the evaluation runs in the directory of the params file
+    launchdirectory = os.getcwd()
+    os.chdir(os.path.dirname(paramsfilename))
+    savedDescriptors = RedirectOutput('%s.log' % resultsfilename)
+    failure = None
+    try:
+      model.RunEvaluation(paramsfilename,resultsfilename,subComm)
+    except Exception, exception:
+      traceback.print_exc()
+      failure = exception
+    finally:
+      RestoreOutput(savedDescriptors)
+      os.chdir(launchdirectory)
+    if ( failure != None ):
+      # the other ranks may be waiting in a collective, the abort ends
+      # every worker. fail the queued jobs so that no driver waits
+      print "worker %d evaluation %s failed: %s" % (workerid,paramsfilename,failure)
+      FailEvaluations(directories)
+      sys.stdout.flush()
+      MPI.COMM_WORLD.Abort(1)
+    # the job is done when every rank is
+    subComm.Barrier()
+    if ( subComm.Get_rank() == 0 ):
+      os.rename(runningfile,'%s/%s' % (directories['done'],jobname))
+    numevaluations = numevaluations + 1
+  print "worker %d ran %d evaluations" % (workerid,numevaluations)
+# end def ServeEvaluations
+
+if __name__ == "__main__":
+  from optparse import OptionParser
+  parser = OptionParser(usage="usage: %prog --queue=DIR (--serve --model=FILE --procs=N | --submit params.in results.out)")
+  parser.add_option( "--queue",
+                    action="store", dest="queue", default="evalqueue",
+                    help="shared queue DIR", metavar="DIR")
+  parser.add_option( "--serve",
+                    action="store_true", dest="serve", default=False,
+                    help="run the queued evaluations, launched w/ mpirun/ibrun")
+  parser.add_option( "--submit",
+                    action="store_true", dest="submit", default=False,
+                    help="queue an evaluation and wait for the results")
+  parser.add_option( "--model",
+                    action="store", dest="model", default="./deltapModeling.py",
+                    help="model FILE w/ InitializeLibraries and RunEvaluation", metavar="FILE")
+  parser.add_option( "--procs",
+                    action="store", dest="procs", type="int", default=1,
+                    help="N ranks per evaluation", metavar="N")
+  parser.add_option( "--poll",
+                    action="store", dest="poll", type="float", default=1.0,
+                    help="poll the queue every SEC seconds", metavar="SEC")
+  parser.add_option( "--timeout",
+                    action="store", dest="timeout", type="float", default=1800.,
+                    help="fail a submitted job after SEC seconds w/o a server heartbeat", metavar="SEC")
+  (options, args) = parser.parse_args()
+  if ( options.serve == options.submit ):
+    parser.print_help()
+    sys.exit(2)
+  if ( options.submit ):
+    if ( len(args) != 2 ):
+      parser.print_help()
+      sys.exit(2)
+    sys.exit( SubmitEvaluation(options.queue,args[0],args[1],options.poll,options.timeout) )
+  # the queue options are not petsc options, petsc options follow --
+  sys.argv = sys.argv[:1] + args
+  ServeEvaluations(options.queue,options.model,options.procs,options.poll)
@@ -0,0 +1,421 @@
+# projection of the libMesh solution of the deltap models onto the MRTI grid
+#
+# the transient loop of deltapModeling.py wrote every time step to exodus,
+# read it back w/ vtkExodusIIReader, reflected it about the symmetry plane,
+# and probed the image. the mesh does not move, the geometry is used once:
+#
+#   1. ExodusDofMap       the dof of each exodus node, calibrated w/ a single
+#                         write of the dof indices
+#   2. ReflectedImageProjection
+#                         cell weights of each image point in the mesh and
+#                         its mirror image, the mirrored nodes are mapped
+#                         back to the nodes of the half mesh (symmetric
+#                         index map)
+#
+# every time step is then a gather and a weighted sum of the solution
+# vector, ie
+#
+#   dofmap = femprojection.ExodusDofMap(eqnSystems,"StateSystem",deltapSystem,"u0","dofmap.e")
+#   projection = femprojection.ReflectedImageProjection(dofmap,imageorigin,imagespacing,imagedimensions)
+#   fem_array  = projection.Interpolate( deltapSystem.GetSolutionVector().getArray() )
+#
+# the dof map gathers the whole solution, ExodusDofMap raises on more than
+# one rank. the calibration overwrites the time step 0 state of the system,
+# the projection is built before the initial condition is set and only for
+# image output, evaluations of the same process reuse it
+#
+#   projection = femprojection.CachedImageProjection(eqnSystems,"StateSystem",deltapSystem,"u0",meshfile,
+#                                                    imageorigin,imagespacing,imagedimensions,"dofmap.e")
+#
+# the same weights interpolate the nodal results of an exodus file onto an
+# image, the geometry is read and transformed once and every time step
+# reads the nodal arrays only (netcdf, vtk w/ netcdf4 files)
+#
+#   projection = femprojection.ExodusImageProjection(exodusfile,['u0','u1'],imageorigin,imagespacing,imagedimensions,RotationMatrix,Translation)
+#   image_arrays = projection.InterpolateTimeStep(timestep)
+#
+# the imaging projected onto the FEM mesh is the same for every evaluation
+# of a study, the projected MRTI series and image mask are cached as numpy
+# binaries keyed by the mesh, the image series, and the transform. the
+# series is written and read one time step at a time through a memory map
+#
+#   imagingKey = femprojection.ImagingCacheKey(meshFile,imageFileNames,RotationMatrix,Translation,...)
+#   projectedImaging = femprojection.LoadProjectedImaging(cachedirectory,imagingKey,rank,size,localsize)
+#   if ( not femprojection.AllRanks(projectedImaging != None) ):
+#     projectedImaging = None
+#   femprojection.SetSystemSolution(eqnSystems,"MRTI",mrtiSystem,projectedImaging['mrti'][idtime],timeID % storageWindow)
+#
+# each rank caches the dofs it owns, the files are keyed by the rank and
+# the number of ranks. the projection is collective, the cache is used only
+# when every rank has its part
+
+import os
+
+# numerical support
+import numpy
+import meshprojection
+import pennesfd
+
+# vtk cell types
+VTK_TETRA      = 10
+VTK_HEXAHEDRON = 12
+
+# Convenience Routine
+def ReadExodusNodalData(exodusfilename,arrayname,timestep=0):
+  """
+  nodes (nnode,3) in exodus order, cells {vtk cell type: (ncell,npts)} in
+  exodus node indices, and the nodal array at the time step
+  """
+  import vtk
+  import vtk.util.numpy_support as vtkNumPy
+  vtkExodusIIReader = vtk.vtkExodusIIReader()
+  vtkExodusIIReader.SetFileName(exodusfilename )
+  vtkExodusIIReader.SetPointResultArrayStatus(arrayname,1)
+  vtkExodusIIReader.GenerateGlobalNodeIdArrayOn()
+  vtkExodusIIReader.SetTimeStep(timestep)
+  vtkExodusIIReader.Update()
+  globalidname = vtkExodusIIReader.GetGlobalNodeIdArrayName()
+
+  # element blocks share the exodus nodes through the global node ids
+  nodeList = {}
+  cellList = {}
+  blockIterator = vtkExodusIIReader.GetOutput().NewIterator()
+  blockIterator.InitTraversal()
+  while ( not blockIterator.IsDoneWithTraversal() ):
+    block = blockIterator.GetCurrentDataObject()
+    blockIterator.GoToNextItem()
+    if ( block.GetNumberOfCells() == 0 ):
+      continue
+    globalids = vtkNumPy.vtk_to_numpy(block.GetPointData().GetArray(globalidname)).astype(numpy.int64) - 1
+    points    = vtkNumPy.vtk_to_numpy(block.GetPoints().GetData()).astype(numpy.float64)
+    values    = vtkNumPy.vtk_to_numpy(block.GetPointData().GetArray(arrayname)).astype(numpy.float64)
+    nodeList[tuple(globalids)] = (globalids,points,values)
+    celltypes = vtkNumPy.vtk_to_numpy(block.GetCellTypesArray())
+    if ( (celltypes != celltypes[0]).any() ):
+      raise RuntimeError("mixed cell types in an element block of %s" % exodusfilename)
+    connectivity = vtkNumPy.vtk_to_numpy(block.GetCells().GetData()).astype(numpy.int64)
+    connectivity = connectivity.reshape(block.GetNumberOfCells(),-1)[:,1:]
+    cellList.setdefault(int(celltypes[0]),[]).append( globalids[connectivity] )
+
+  numnodes = max([ globalids.max() for (globalids,points,values) in nodeList.values() ]) + 1
+  nodes      = numpy.zeros((numnodes,3))
+  nodalarray = numpy.zeros(numnodes)
+  for (globalids,points,values) in nodeList.values():
+    nodes[globalids]      = points
+    nodalarray[globalids] = values
+  cells = dict([ (celltype,numpy.vstack(blockcells)) for (celltype,blockcells) in cellList.items() ])
+  return (nodes,cells,nodalarray)
+
+##################################################################
+class ExodusDofMap:
+  """ Class for the dof of each exodus node of a libMesh system...  """
+  def __init__(self,eqnSystems,systemname,system,variablename,calibrationfilename):
+    # the dof index of each node is written as the solution and read back,
+    # the solution is then restored. the nodes and cells of the exodus
+    # file are kept for the projection
+    import femLibrary
+    solution = system.GetSolutionVector()
+    if ( solution.getComm().getSize() > 1 ):
+      raise RuntimeError("ExodusDofMap needs every dof on one rank, the solution is distributed on %d ranks" % solution.getComm().getSize())
+    savedsolution = solution.copy()
+    calibration   = solution.duplicate()
+    (ownedstart,ownedend) = calibration.getOwnershipRange()
+    calibration.setArray( numpy.arange(ownedstart,ownedend,dtype=numpy.float64) )
+    eqnSystems.SetPetscFEMSystemSolnSubVector(systemname,calibration,0)
+    eqnSystems.UpdatePetscFEMSystemTimeStep(systemname,0)
+    calibrationIO = femLibrary.PylibMeshExodusII_IO(eqnSystems.GetMesh())
+    calibrationIO.WriteTimeStep(calibrationfilename,eqnSystems, 1, 0.0 )
+    eqnSystems.SetPetscFEMSystemSolnSubVector(systemname,savedsolution,0)
+    eqnSystems.UpdatePetscFEMSystemTimeStep(systemname,0)
+
+    (self.Nodes,self.Cells,dofindex) = ReadExodusNodalData(calibrationfilename,variablename)
+    os.remove(calibrationfilename)
+    self.NodeDofs = numpy.rint(dofindex).astype(numpy.int64)
+
+  def NodalValues(self,solutionarray):
+    """ solution in exodus node order """
+    return solutionarray[self.NodeDofs]
+
+##################################################################
+class ReflectedImageProjection:
+  """ Class for interpolation of the reflected solution onto image points...  """
+  def __init__(self,dofMap,origin,spacing,dimensions,reflectaxis=1):
+    # the mesh is mirrored about the maximum of reflectaxis as
+    # vtkReflectionFilter.SetPlaneToYMax. the image points (x fastest)
+    # outside the mesh are zero as in vtkProbeFilter
+    self.DofMap = dofMap
+    nodes = dofMap.Nodes
+    mirrornodes = nodes.copy()
+    mirrornodes[:,reflectaxis] = 2.*nodes[:,reflectaxis].max() - nodes[:,reflectaxis]
+    points = pennesfd.GridPointCoordinates(origin,spacing,dimensions)
+    # symmetric index map: the nodes of the mirrored cells are the nodes of
+    # the half mesh, only the coordinates differ
+    (self.NodeIds,self.Weights) = ImageInterpolationWeights([nodes,mirrornodes],dofMap.Cells,
+                                                            origin,spacing,dimensions)
+
+  def Interpolate(self,solutionarray):
+    """ image values (x fastest) of the solution in dof order """
+    nodalvalues = self.DofMap.NodalValues(solutionarray)
+    return (self.Weights * nodalvalues[self.NodeIds]).sum(axis=1)
+
+# projections of this process, keyed by the mesh and the image geometry
+ProjectionCache = {}
+
+# Convenience Routine
+def CachedImageProjection(eqnSystems,systemname,system,variablename,meshfilename,
+                          origin,spacing,dimensions,calibrationfilename):
+  """
+  reflected image projection, built on first use. the dof map calibration
+  overwrites time step 0 of the system, call it before the initial condition
+  """
+  projectionkey = (os.path.abspath(meshfilename),systemname,variablename,
+                   tuple(origin),tuple(spacing),tuple(dimensions))
+  if ( projectionkey not in ProjectionCache ):
+    dofMap = ExodusDofMap(eqnSystems,systemname,system,variablename,calibrationfilename)
+    ProjectionCache[projectionkey] = ReflectedImageProjection(dofMap,origin,spacing,dimensions)
+  return ProjectionCache[projectionkey]
+
+##################################################################
+class ExodusImageProjection:
+  """ Class for interpolation of the nodal results of an exodus file onto image points...  """
+  def __init__(self,exodusfilename,arraynames,origin,spacing,dimensions,rotation=numpy.identity(3),translation=(0.,0.,0.)):
+    # the nodes are transformed as vtkTransformFilter, x' = rotation x + translation
+    # the image points (x fastest) outside the mesh are zero as in vtkProbeFilter
+    self.ExodusFile = exodusfilename
+    self.ArrayNames = list(arraynames)
+    (nodes,self.Cells,nodalarray) = ReadExodusNodalData(exodusfilename,self.ArrayNames[0])
+    nodes = numpy.dot(nodes,numpy.array(rotation,dtype=numpy.float64).transpose()) \
+          + numpy.array(translation,dtype=numpy.float64)
+    self.NumNodes = nodes.shape[0]
+    (self.NodeIds,self.Weights) = ImageInterpolationWeights([nodes],self.Cells,origin,spacing,dimensions)
+
+  def NodalArrays(self,timestep):
+    """ nodal arrays of the time step in exodus node order """
+    try:
+      return ReadExodusNodalArrays(self.ExodusFile,self.ArrayNames,timestep)
+    except (TypeError,ValueError,KeyError):
+      # not a netcdf3 file
+      return dict([ (arrayname,ReadExodusNodalData(self.ExodusFile,arrayname,timestep)[2])
+                    for arrayname in self.ArrayNames ])
+
+  def Interpolate(self,nodalvalues):
+    """ image values (x fastest) of the nodal values """
+    return (self.Weights * nodalvalues[self.NodeIds]).sum(axis=1)
+
+  def InterpolateTimeStep(self,timestep):
+    """ image values of each nodal array at the time step """
+    nodalArrays = self.NodalArrays(timestep)
+    return dict([ (arrayname,self.Interpolate(nodalArrays[arrayname])) for arrayname in self.ArrayNames ])
+
+# Convenience Routine
+def ReadExodusNodalArrays(exodusfilename,arraynames,timestep):
+  """
+  nodal result arrays of the time step read w/ scipy.io.netcdf, no vtk
+  pipeline. the nodes are ordered by the node number map as the global node
+  ids of ReadExodusNodalData. netcdf3 exodus files only
+  """
+  from scipy.io import netcdf
+  exodusFile = netcdf.netcdf_file(exodusfilename,'r',mmap=False)
+  variables = exodusFile.variables
+  names = [ name.tostring().split('\x00')[0].strip() for name in variables['name_nod_var'][:] ]
+  if ( 'node_num_map' in variables ):
+    globalids = numpy.array(variables['node_num_map'][:],dtype=numpy.int64) - 1
+  else:
+    globalids = numpy.arange(exodusFile.dimensions['num_nodes'])
+  nodalArrays = {}
+  for arrayname in arraynames:
+    idvar = names.index(arrayname)
+    if ( 'vals_nod_var%d' % (idvar+1) in variables ):
+      values = variables['vals_nod_var%d' % (idvar+1)][timestep]
+    else:
+      values = variables['vals_nod_var'][timestep,idvar]
+    nodalArrays[arrayname] = numpy.zeros(globalids.max()+1)
+    nodalArrays[arrayname][globalids] = values
+  exodusFile.close()
+  return nodalArrays
+
+# Convenience Routine
+def ImageInterpolationWeights(nodeslist,cells,origin,spacing,dimensions):
+  """
+  node ids and linear interpolation weights (npoints,maxcellpts) of the
+  image points (x fastest) in the cells, the mesh is searched w/ each set of
+  node coordinates in order. points outside the mesh have zero weights
+  """
+  points = pennesfd.GridPointCoordinates(origin,spacing,dimensions)
+  maxcellpts = max([ cellnodes.shape[1] for cellnodes in cells.values() ])
+  nodeids = numpy.zeros((points.shape[0],maxcellpts),dtype=numpy.int64)
+  weights = numpy.zeros((points.shape[0],maxcellpts))
+  located = numpy.zeros(points.shape[0],dtype=bool)
+  for meshnodes in nodeslist:
+    for (celltype,cellnodes) in cells.items():
+      (cellids,cellweights) = LocatePoints(celltype,meshnodes,cellnodes,points,located,
+                                           origin,spacing,dimensions)
+      found = numpy.nonzero(cellids >= 0)[0]
+      nodeids[found,:cellnodes.shape[1]] = cellnodes[cellids[found]]
+      weights[found,:cellnodes.shape[1]] = cellweights[found]
+      located[found] = True
+  print "located %d of %d image points in the mesh" % (located.sum(),located.size)
+  return (nodeids,weights)
+
+# Convenience Routine
+def LocatePoints(celltype,nodes,cellnodes,points,located,origin,spacing,dimensions,tol=1.e-8,chunksize=4096):
+  """
+  cell containing each grid point not yet located (-1 otherwise) and the
+  linear interpolation weights. the candidate points of a cell are the
+  grid points in its bounding box, the (cell,point) candidate pairs of
+  chunksize cells are expanded and tested at once. the first cell found
+  holds the point
+  """
+  cellids = -numpy.ones(points.shape[0],dtype=numpy.int64)
+  weights = numpy.zeros((points.shape[0],cellnodes.shape[1]))
+  cellcoords = nodes[cellnodes]
+  origin  = numpy.array(origin,dtype=numpy.float64)
+  spacing = numpy.array(spacing,dtype=numpy.float64)
+  lower = numpy.maximum(numpy.ceil( (cellcoords.min(axis=1) - tol - origin)/spacing ).astype(numpy.int64),0)
+  upper = numpy.minimum(numpy.floor((cellcoords.max(axis=1) + tol - origin)/spacing ).astype(numpy.int64),
+                        numpy.array(dimensions) - 1)
+  boxsize = numpy.maximum(upper - lower + 1,0)
+  numcandidates = boxsize.prod(axis=1)
+  if ( celltype not in [VTK_TETRA,VTK_HEXAHEDRON] ):
+    raise RuntimeError("cell type %d not supported, tetrahedra and hexahedra only" % celltype)
+  for chunkstart in range(0,cellnodes.shape[0],chunksize):
+    chunk  = numpy.arange(chunkstart,min(chunkstart+chunksize,cellnodes.shape[0]))
+    counts = numcandidates[chunk]
+    if ( counts.sum() == 0 ):
+      continue
+    # grid index of the candidates, x fastest in the box of each cell
+    paircells = numpy.repeat(chunk,counts)
+    offsets   = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts,counts)
+    pairsize  = boxsize[paircells]
+    ii = lower[paircells,0] +  offsets %  pairsize[:,0]
+    jj = lower[paircells,1] + (offsets // pairsize[:,0]) % pairsize[:,1]
+    kk = lower[paircells,2] +  offsets // (pairsize[:,0] * pairsize[:,1])
+    candidates = ii + dimensions[0] * ( jj + dimensions[1] * kk )
+    pending = (~located[candidates]) & (cellids[candidates] < 0)
+    (paircells,candidates) = (paircells[pending],candidates[pending])
+    if ( len(candidates) == 0 ):
+      continue
+    paircoords = cellcoords[paircells]
+    if ( celltype == VTK_TETRA ):
+      # barycentric coordinates, inverse jacobian of each cell of the chunk
+      inversejacobian = numpy.linalg.inv( (cellcoords[chunk,1:] - cellcoords[chunk,:1]).transpose(0,2,1) )
+      barycentric = numpy.einsum('pij,pj->pi',inversejacobian[paircells-chunkstart],
+                                 points[candidates] - paircoords[:,0])
+      cellweights = numpy.hstack( (1. - barycentric.sum(axis=1)[:,numpy.newaxis],barycentric) )
+      inside = (cellweights >= -tol).all(axis=1)
+    else:
+      pcoords = meshprojection.HexahedronParametricCoordinates(paircoords,points[candidates])
+      (cellweights,shapederiv) = meshprojection.HexahedronShapeFunctions(pcoords)
+      inside = ( (pcoords >= -tol) & (pcoords <= 1.+tol) ).all(axis=1)
+    # the pairs are in cell order, the first occurrence of a point is its first cell
+    (foundpoints,firstpair) = numpy.unique(candidates[inside],return_index=True)
+    cellids[foundpoints] = paircells[inside][firstpair]
+    weights[foundpoints] = cellweights[inside][firstpair]
+  return (cellids,weights)
+
+# Convenience Routine
+def ImagingCacheKey(meshfilename,imagefilenames,*parameters):
+  """
+  sha1 of the mesh contents, the size and modification time of each image,
+  and the projection parameters (transform, image geometry, mask, ...)
+  """
+  import hashlib
+  sha = hashlib.sha1()
+  meshHandle = open(meshfilename,'rb')
+  sha.update(meshHandle.read())
+  meshHandle.close()
+  for imagefilename in imagefilenames:
+    imagestat = os.stat(imagefilename)
+    sha.update('%s %d %d\n' % (os.path.abspath(imagefilename),imagestat.st_size,int(imagestat.st_mtime)))
+  sha.update(repr(parameters))
+  return sha.hexdigest()
+
+# Convenience Routine
+def PartitionKey(key,rank,size):
+  """ cache key of the dofs owned by a rank """
+  return '%s.%dof%d' % (key,rank,size)
+
+# Convenience Routine
+def AllRanks(flag):
+  """ flag is true on every rank of PETSc.COMM_WORLD """
+  from petsc4py import PETSc
+  if ( PETSc.COMM_WORLD.getSize() == 1 ):
+    return bool(flag)
+  from mpi4py import MPI
+  return PETSc.COMM_WORLD.tompi4py().allreduce(bool(flag),op=MPI.LAND)
+
+# Convenience Routine
+def SetSystemSolution(eqnSystems,systemname,system,values,storageslot):
+  """
+  local values of the solution of a system, libMesh updates the ghosted
+  copy of the solution as for the projected imaging. storageslot is the
+  storage vector of the time step, ie timeID % storage window
+  """
+  solution = system.GetSolutionVector().duplicate()
+  solution.setArray( values )
+  eqnSystems.SetPetscFEMSystemSolnSubVector(systemname,solution,0)
+  eqnSystems.UpdatePetscFEMSystemTimeStep(systemname,storageslot)
+
+# Convenience Routine
+def LoadProjectedImaging(cachedirectory,key,rank=0,size=1,localsize=None):
+  """
+  projected imaging of a previous evaluation, None if not cached or if the
+  dofs owned by the rank differ (localsize)
+  returns dictionary w/ mrti (ntime,ndof) memory mapped, and mask (ndof,)
+  only the pages of the time steps used are read
+  """
+  mrtifile = '%s/imaging.%s.mrti.npy' % (cachedirectory,PartitionKey(key,rank,size))
+  maskfile = '%s/imaging.%s.mask.npy' % (cachedirectory,PartitionKey(key,rank,size))
+  if ( not os.path.isfile(mrtifile) or not os.path.isfile(maskfile) ):
+    return None
+  projectedImaging = {'mrti':numpy.load(mrtifile,mmap_mode='r'),'mask':numpy.load(maskfile)}
+  if ( localsize != None and len(projectedImaging['mask']) != localsize ):
+    print "projected imaging", mrtifile, "has %d dofs, %d owned" % (len(projectedImaging['mask']),localsize)
+    return None
+  print "loaded projected imaging", mrtifile
+  return projectedImaging
+
+##################################################################
+class ProjectedImagingWriter:
+  """ Class for caching the projected imaging one time step at a time...  """
+  def __init__(self,cachedirectory,key,numtimes,rank=0,size=1):
+    # the time steps are written to a memory mapped temporary file, the
+    # files are renamed when every time step and the mask are stored.
+    # each rank writes the dofs it owns
+    self.Directory = cachedirectory
+    self.Key       = PartitionKey(key,rank,size)
+    self.NumTimes  = numtimes
+    self.NumDofs   = None
+    self.MRTI      = None
+    self.Mask      = numpy.zeros(0)
+    self.Stored    = numpy.zeros(numtimes,dtype=bool)
+    self.TmpFile   = '%s/imaging.%s.%d.tmp.npy' % (cachedirectory,self.Key,os.getpid())
+
+  def StoreMRTI(self,idtime,mrti):
+    """ projected MRTI of the idtime-th time step """
+    if ( self.NumDofs == None ):
+      os.system('mkdir -p %s' % self.Directory)
+      self.NumDofs = len(mrti)
+      self.MRTI = numpy.lib.format.open_memmap(self.TmpFile,mode='w+',dtype=numpy.float64,
+                                               shape=(self.NumTimes,self.NumDofs))
+    self.MRTI[idtime] = mrti
+    self.Stored[idtime] = True
+
+  def StoreMask(self,mask):
+    """ projected image mask, the same every time step """
+    self.Mask = numpy.array(mask,dtype=numpy.float64)
+
+  def Close(self):
+    """ rename the complete cache, an incomplete one is removed """
+    if ( self.NumDofs == None ):
+      return
+    self.MRTI.flush()
+    self.MRTI = None
+    if ( self.Stored.all() and len(self.Mask) == self.NumDofs ):
+      masktmpfile = '%s/imaging.%s.%d.tmp.mask.npy' % (self.Directory,self.Key,os.getpid())
+      numpy.save(masktmpfile,self.Mask)
+      # the mrti file is checked last by LoadProjectedImaging
+      os.rename(masktmpfile,'%s/imaging.%s.mask.npy' % (self.Directory,self.Key))
+      os.rename(self.TmpFile,'%s/imaging.%s.mrti.npy' % (self.Directory,self.Key))
+    else:
+      os.remove(self.TmpFile)
@@ -0,0 +1,157 @@
+# interpolation of SEM nodal data onto image voxels
+#
+# the voxels are located in the hexahedral subcells of the SEM mesh once
+# (see brainsearch.py, a vtkProbeFilter returns the cell id), the trilinear
+# weights and their spatial derivatives are then stored so that every time
+# step is a gather and a weighted sum. images are interpolated onto the mesh
+# nodes w/ trilinear weights from the image samples
+
+# numerical support
+import numpy
+
+# vtk hexahedron node ordering in parametric coordinates
+HexahedronParametricNodes = numpy.array([[0.,0.,0.],
+                                         [1.,0.,0.],
+                                         [1.,1.,0.],
+                                         [0.,1.,0.],
+                                         [0.,0.,1.],
+                                         [1.,0.,1.],
+                                         [1.,1.,1.],
+                                         [0.,1.,1.]])
+
+def HexahedronShapeFunctions(pcoords):
+  """
+  trilinear shape functions and parametric derivatives
+  pcoords (npts,3) --> N (npts,8), dN/dxi (npts,8,3)
+  """
+  xi  = pcoords[:,numpy.newaxis,:]
+  ref = HexahedronParametricNodes[numpy.newaxis,:,:]
+  # 1-D factors  xi for node at 1, 1-xi for node at 0
+  factors = ref * xi + (1.-ref) * (1.-xi)
+  dfactors = 2.*ref - 1.
+  shape = factors.prod(axis=2)
+  shapederiv = numpy.empty(shape.shape + (3,))
+  shapederiv[:,:,0] = dfactors[:,:,0] * factors[:,:,1] * factors[:,:,2]
+  shapederiv[:,:,1] = factors[:,:,0] * dfactors[:,:,1] * factors[:,:,2]
+  shapederiv[:,:,2] = factors[:,:,0] * factors[:,:,1] * dfactors[:,:,2]
+  return (shape,shapederiv)
+
+def HexahedronParametricCoordinates(hexnodes,points,maxiter=20,tol=1.e-10):
+  """
+  invert the trilinear map w/ newton iterations (vectorized over points)
+  hexnodes (npts,8,3) points (npts,3) --> pcoords (npts,3)
+  """
+  pcoords = 0.5 * numpy.ones(points.shape)
+  for iteration in range(maxiter):
+    (shape,shapederiv) = HexahedronShapeFunctions(pcoords)
+    residual = numpy.einsum('pn,pni->pi',shape,hexnodes) - points
+    jacobian = numpy.einsum('pnj,pni->pij',shapederiv,hexnodes)
+    update   = numpy.linalg.solve(jacobian,residual[:,:,numpy.newaxis])[:,:,0]
+    pcoords  = pcoords - update
+    if ( numpy.abs(update).max() < tol ):
+      break
+  return pcoords
+
+##################################################################
+class HexahedronProjection:
+  """ Class for stored interpolation from a hex mesh to points...  """
+  def __init__(self,nodes,connectivity,cellids,points):
+    # nodes         (nnodes,3)  nodal coordinates in the frame of the points
+    # connectivity  (ncells,8)  vtk hex ordering
+    # cellids       (npts,)     containing cell, negative if not found
+    # points        (npts,3)    coordinates of the points
+    self.NumberOfPoints = points.shape[0]
+    self.ValidPoints    = numpy.flatnonzero( cellids >= 0 )
+    self.NodeIds  = connectivity[ cellids[self.ValidPoints] ]
+    hexnodes = nodes[ self.NodeIds ].astype(numpy.float64)
+    validcoords = points[self.ValidPoints].astype(numpy.float64)
+    pcoords = HexahedronParametricCoordinates( hexnodes , validcoords )
+    (self.Weights,shapederiv) = HexahedronShapeFunctions(pcoords)
+    # spatial derivatives of the shape functions  dN/dx = dN/dxi J^{-1}
+    jacobian = numpy.einsum('pnj,pni->pij',shapederiv,hexnodes)
+    self.WeightDerivatives = numpy.einsum('pnj,pji->pni',shapederiv,numpy.linalg.inv(jacobian))
+
+  def Interpolate(self,nodalvalues):
+    """ interpolated values, zero at points outside the mesh """
+    pointvalues = numpy.zeros(self.NumberOfPoints,dtype=nodalvalues.dtype)
+    pointvalues[self.ValidPoints] = (self.Weights * nodalvalues[self.NodeIds]).sum(axis=1)
+    return pointvalues
+
+  def Gradient(self,nodalvalues):
+    """ spatial gradient (npts,3), zero at points outside the mesh """
+    pointgradient = numpy.zeros((self.NumberOfPoints,3))
+    pointgradient[self.ValidPoints] = numpy.einsum('pni,pn->pi',self.WeightDerivatives,nodalvalues[self.NodeIds])
+    return pointgradient
+
+# Convenience Routine
+def RotationMatrices(rotate):
+  """
+  rotation matrices and their derivatives w.r.t. the angles (degrees)
+  for the  RotateZ -> RotateY -> RotateX  order of vtkTransform
+  """
+  (alpha,beta,gamma) = numpy.radians(rotate)
+  def RotX(a):
+    return (numpy.array([[1.,0.,0.],[0.,numpy.cos(a),-numpy.sin(a)],[0.,numpy.sin(a),numpy.cos(a)]]),
+            numpy.array([[0.,0.,0.],[0.,-numpy.sin(a),-numpy.cos(a)],[0.,numpy.cos(a),-numpy.sin(a)]]))
+  def RotY(a):
+    return (numpy.array([[numpy.cos(a),0.,numpy.sin(a)],[0.,1.,0.],[-numpy.sin(a),0.,numpy.cos(a)]]),
+            numpy.array([[-numpy.sin(a),0.,numpy.cos(a)],[0.,0.,0.],[-numpy.cos(a),0.,-numpy.sin(a)]]))
+  def RotZ(a):
+    return (numpy.array([[numpy.cos(a),-numpy.sin(a),0.],[numpy.sin(a),numpy.cos(a),0.],[0.,0.,1.]]),
+            numpy.array([[-numpy.sin(a),-numpy.cos(a),0.],[numpy.cos(a),-numpy.sin(a),0.],[0.,0.,0.]]))
+  (Rx,dRx) = RotX(alpha)
+  (Ry,dRy) = RotY(beta )
+  (Rz,dRz) = RotZ(gamma)
+  degree = numpy.pi/180.
+  rotation = numpy.dot(Rz,numpy.dot(Ry,Rx))
+  # derivatives ordered as x_rotate, y_rotate, z_rotate
+  derivatives = [ degree*numpy.dot(Rz,numpy.dot(Ry,dRx)),
+                  degree*numpy.dot(Rz,numpy.dot(dRy,Rx)),
+                  degree*numpy.dot(dRz,numpy.dot(Ry,Rx)) ]
+  return (rotation,derivatives)
+
+# Convenience Routine
+def RigidRegistrationDerivatives(displace,rotate,points):
+  """
+  the registered field at a fixed image point p is  f(p) = v( R^T (p - t) )
+  where v is the field before the affine transform. then
+
+     df/dtheta = grad_p f . R (dR/dtheta)^T (p - t)     (rotation)
+     df/dt_i   = - df/dp_i                              (translation)
+
+  returns (npts,6,3) directions ordered as
+     x_displace,y_displace,z_displace,x_rotate,y_rotate,z_rotate
+  so that df/dtheta_k = sum_i  grad_p f_i  directions[:,k,i]
+  """
+  (rotation,derivatives) = RotationMatrices(rotate)
+  relative = points - numpy.array(displace)[numpy.newaxis,:]
+  directions = numpy.zeros((points.shape[0],6,3))
+  for idtranslate in range(3):
+    directions[:,idtranslate,idtranslate] = -1.
+  for (idrotate,dR) in enumerate(derivatives):
+    directions[:,3+idrotate,:] = numpy.dot(relative,numpy.dot(rotation,dR.T).T)
+  return directions
+
+# Convenience Routine
+def ImageTrilinearInterpolation(origin,spacing,image,points):
+  """
+  trilinear interpolation of image (nz,ny,nx) at points (npts,3)
+  origin is the location of image[0,0,0]. points outside the image
+  bounds are zero as w/ vtkProbeFilter
+  """
+  dimensions = numpy.array(image.shape[::-1])
+  index = (points - numpy.array(origin)[numpy.newaxis,:]) / numpy.array(spacing)[numpy.newaxis,:]
+  tolerance = 1.e-6
+  valid = numpy.all( (index >= -tolerance) & (index <= dimensions - 1 + tolerance), axis=1)
+  index = numpy.clip(index,0,dimensions-1)
+  # a single sample along an axis has a zero fraction
+  lower = numpy.minimum(numpy.floor(index).astype(numpy.int64),numpy.maximum(dimensions-2,0))
+  upper = numpy.minimum(lower+1,dimensions-1)
+  fraction = index - lower
+  values = numpy.zeros(points.shape[0])
+  for corner in HexahedronParametricNodes:
+    ijk    = numpy.where(corner > 0., upper, lower)
+    weight = numpy.where(corner > 0., fraction, 1.-fraction).prod(axis=1)
+    values = values + weight * image[ijk[:,2],ijk[:,1],ijk[:,0]]
+  values[numpy.logical_not(valid)] = 0.
+  return values
@@ -0,0 +1,342 @@
+# reader for the legacy vtk structured points files of the MRTI data
+#
+# the header (dimensions, spacing, origin, arrays) is parsed directly and
+# the binary payload is memory mapped so that only the pages of a VOI slab
+# are read, w/o building a vtk object. other formats (xml, unstructured,
+# ...) fall back to the vtk readers
+#
+#   (origin,spacing,extent,image_array) = mrtiio.ReadStructuredPoints(filename,'image_data',voi)
+#
+# image_array is x fastest as the vtk point arrays
+#
+# a time series may also be a single container appended one frame at a time
+# (SeriesWriter), a raw stack of frames w/ a json geometry sidecar
+#   temperature.series.json   dimensions, spacing, origin, dtype, frames
+#   temperature.series.raw    frames (nz,ny,nx) back to back
+# the per frame names are resolved in the container when the file does not
+# exist, ie temperature.0012.vtk is frame 12 of temperature.series.json
+#
+# during an acquisition the container grows, a consumer waits for a frame
+#   mrtiio.WaitForImage('temperature.0012.vtk',timeout)
+
+import os
+import re
+import json
+import time
+
+# numerical support
+import numpy
+
+# per frame file names of a series
+SeriesFrameRegex = re.compile('^(.*)\\.(\\d+)\\.(vtk|vti)$')
+
+# legacy vtk type names, binary data are big endian
+LegacyTypes = {'bit'           : None,
+               'unsigned_char' : '>u1', 'char'           : '>i1',
+               'unsigned_short': '>u2', 'short'          : '>i2',
+               'unsigned_int'  : '>u4', 'int'            : '>i4',
+               'unsigned_long' : '>u8', 'long'           : '>i8',
+               'vtktypeint64'  : '>i8', 'vtktypeuint64'  : '>u8',
+               'float'         : '>f4', 'double'         : '>f8'}
+
+##################################################################
+class LegacyTokenReader:
+  """ Class for the tokens of a legacy vtk file...  """
+  def __init__(self,fileHandle,fileformat):
+    self.FileHandle = fileHandle
+    self.Format     = fileformat
+    self.Tokens     = []
+    if ( fileformat == 'ASCII' ):
+      # ascii payloads are read as tokens
+      self.Tokens.extend( fileHandle.read().split() )
+      self.Tokens.reverse()
+
+  def NextToken(self):
+    """ next token, None at the end of the file """
+    while ( len(self.Tokens) == 0 and self.Format == 'BINARY' ):
+      line = self.FileHandle.readline()
+      if ( line == '' ):
+        return None
+      self.Tokens = line.split()
+      self.Tokens.reverse()
+    if ( len(self.Tokens) == 0 ):
+      return None
+    return self.Tokens.pop()
+
+  def Payload(self,arraytype,numvalues):
+    """
+    skip the values of an array, returns the offset of a binary payload
+    or the ascii values. a binary payload starts after the current line
+    """
+    if ( self.Format == 'BINARY' ):
+      offset = self.FileHandle.tell()
+      self.FileHandle.seek( offset + numvalues * numpy.dtype(arraytype).itemsize )
+      return offset
+    values = [ self.Tokens.pop() for idvalue in range(numvalues) ]
+    return numpy.array(values,dtype=numpy.dtype(arraytype).newbyteorder('='))
+
+# Convenience Routine
+def ReadStructuredPointsHeader(filename):
+  """
+  header of a legacy vtk structured points file, None for other formats
+  returns dictionary w/ dimensions, spacing, origin, format, and arrays
+  arrays[name] = (dtype, ncomp, offset of a binary payload or ascii values)
+  only point data is read
+  """
+  fileHandle = open(filename,'rb')
+  try:
+    if ( not fileHandle.readline().startswith('# vtk DataFile') ):
+      return None
+    fileHandle.readline() # title
+    fileformat = fileHandle.readline().strip().upper()
+    if ( fileformat not in ['BINARY','ASCII'] ):
+      return None
+    header = {'format':fileformat,'dimensions':None,'spacing':(1.,1.,1.),'origin':(0.,0.,0.),
+              'arrays':{},'arraynames':[]}
+    tokenReader = LegacyTokenReader(fileHandle,fileformat)
+    numberofpoints = None
+    keyword = tokenReader.NextToken()
+    while ( keyword != None ):
+      keyword = keyword.upper()
+      if ( keyword == 'DATASET' ):
+        if ( tokenReader.NextToken().upper() != 'STRUCTURED_POINTS' ):
+          return None
+      elif ( keyword == 'DIMENSIONS' ):
+        header['dimensions'] = tuple([int(tokenReader.NextToken()) for idaxis in range(3)])
+      elif ( keyword in ['SPACING','ASPECT_RATIO'] ):
+        header['spacing'] = tuple([float(tokenReader.NextToken()) for idaxis in range(3)])
+      elif ( keyword == 'ORIGIN' ):
+        header['origin'] = tuple([float(tokenReader.NextToken()) for idaxis in range(3)])
+      elif ( keyword == 'POINT_DATA' ):
+        numberofpoints = int(tokenReader.NextToken())
+      elif ( keyword == 'SCALARS' and numberofpoints != None ):
+        arrayname = tokenReader.NextToken()
+        arraytype = LegacyTypes.get(tokenReader.NextToken().lower())
+        # the number of components is optional
+        numcomp = 1
+        nexttoken = tokenReader.NextToken()
+        if ( nexttoken.isdigit() ):
+          numcomp = int(nexttoken)
+          nexttoken = tokenReader.NextToken()
+        if ( arraytype == None or nexttoken != 'LOOKUP_TABLE' ):
+          break
+        tokenReader.NextToken() # table name
+        header['arrays'][arrayname] = (arraytype,numcomp,tokenReader.Payload(arraytype,numcomp*numberofpoints))
+        header['arraynames'].append(arrayname)
+      elif ( keyword == 'FIELD' and numberofpoints != None ):
+        tokenReader.NextToken() # field name
+        for idarray in range(int(tokenReader.NextToken())):
+          arrayname = tokenReader.NextToken()
+          numcomp   = int(tokenReader.NextToken())
+          numtuples = int(tokenReader.NextToken())
+          arraytype = LegacyTypes.get(tokenReader.NextToken().lower())
+          if ( arraytype == None ):
+            return header
+          offset = tokenReader.Payload(arraytype,numcomp*numtuples)
+          if ( numtuples == numberofpoints ):
+            header['arrays'][arrayname] = (arraytype,numcomp,offset)
+            header['arraynames'].append(arrayname)
+      else:
+        # cell data, metadata, ...  the point arrays are complete
+        break
+      keyword = tokenReader.NextToken()
+    return header
+  finally:
+    fileHandle.close()
+
+##################################################################
+def ReadStructuredPoints(filename,arrayname=None,voi=None):
+  """
+  point array of a structured points file restricted to the voi
+  [xmin,xmax,ymin,ymax,zmin,zmax], the first array by default
+  returns origin, spacing, extent of the voi (clipped to the image), and
+  the array (npts,) or (npts,ncomp) in native byte order
+  """
+  if ( not os.path.isfile(filename) ):
+    seriesframe = SeriesFrame(filename)
+    if ( seriesframe != None ):
+      return ReadSeriesFrame(seriesframe[0],seriesframe[1],arrayname,voi)
+  header = ReadStructuredPointsHeader(filename)
+  if ( header == None or header['dimensions'] == None or len(header['arraynames']) == 0 ):
+    return ReadVTKImage(filename,arrayname,voi)
+  if ( arrayname == None ):
+    arrayname = header['arraynames'][0]
+  if ( arrayname not in header['arrays'] ):
+    return ReadVTKImage(filename,arrayname,voi)
+
+  dimensions = header['dimensions']
+  extent = VOIExtent(dimensions,voi)
+  (arraytype,numcomp,offset) = header['arrays'][arrayname]
+  shape = (dimensions[2],dimensions[1],dimensions[0],numcomp)
+  if ( header['format'] == 'BINARY' ):
+    # only the pages of the slab are read
+    image = numpy.memmap(filename,dtype=arraytype,mode='r',offset=offset,shape=shape)
+  else:
+    image = offset.reshape(shape)
+  image_array = numpy.array(image[extent[4]:extent[5]+1,extent[2]:extent[3]+1,extent[0]:extent[1]+1],
+                            dtype=numpy.dtype(arraytype).newbyteorder('='))
+  del image
+  if ( numcomp == 1 ):
+    image_array = image_array.ravel()
+  else:
+    image_array = image_array.reshape(-1,numcomp)
+  return (header['origin'],header['spacing'],extent,image_array)
+
+# Convenience Routine
+def ReadVTKImage(filename,arrayname=None,voi=None):
+  """ same as ReadStructuredPoints w/ the vtk readers """
+  import vtk
+  import vtk.util.numpy_support as vtkNumPy
+  if ( filename.split('.').pop() == 'vti' ):
+    vtkImageReader = vtk.vtkXMLImageDataReader()
+  else:
+    vtkImageReader = vtk.vtkDataSetReader()
+  vtkImageReader.SetFileName(filename)
+  vtkImageReader.Update()
+  vtkImage = vtkImageReader.GetOutput()
+  if ( voi != None ):
+    vtkVOIExtract = vtk.vtkExtractVOI()
+    vtkVOIExtract.SetInput( vtkImage )
+    vtkVOIExtract.SetVOI( voi )
+    vtkVOIExtract.Update()
+    vtkImage = vtkVOIExtract.GetOutput()
+  if ( arrayname == None ):
+    vtkArray = vtkImage.GetPointData().GetArray(0)
+  else:
+    vtkArray = vtkImage.GetPointData().GetArray(arrayname)
+  image_array = vtkNumPy.vtk_to_numpy(vtkArray).copy()
+  return (vtkImage.GetOrigin(),vtkImage.GetSpacing(),list(vtkImage.GetExtent()),image_array)
+
+# Convenience Routine
+def VOIExtent(dimensions,voi):
+  """ extent of the voi [xmin,xmax,ymin,ymax,zmin,zmax] clipped to the image """
+  extent = [0,dimensions[0]-1,0,dimensions[1]-1,0,dimensions[2]-1]
+  if ( voi != None ):
+    for idaxis in range(3):
+      extent[2*idaxis  ] = max(extent[2*idaxis  ],voi[2*idaxis  ])
+      extent[2*idaxis+1] = min(extent[2*idaxis+1],voi[2*idaxis+1])
+  return extent
+
+# Convenience Routine
+def SeriesFrame(filename):
+  """
+  (series sidecar, frame) of a per frame file name stored in a series
+  container, None if there is no container or the frame is not written
+  """
+  match = SeriesFrameRegex.match(filename)
+  if ( match == None ):
+    return None
+  sidecarfile = '%s.series.json' % match.group(1)
+  if ( not os.path.isfile(sidecarfile) ):
+    return None
+  idframe = int(match.group(2))
+  if ( idframe >= ReadSeriesHeader(sidecarfile)['frames'] ):
+    return None
+  return (sidecarfile,idframe)
+
+# Convenience Routine
+def ImageExists(filename):
+  """ per frame file or frame of a series container """
+  return os.path.isfile(filename) or SeriesFrame(filename) != None
+
+# Convenience Routine
+def WaitForImage(filename,timeout,polltime=0.1):
+  """
+  poll until the per frame file or the frame of a growing series container
+  exists, False after timeout seconds
+  """
+  starttime = time.time()
+  while ( not ImageExists(filename) ):
+    if ( time.time() - starttime > timeout ):
+      return False
+    time.sleep(polltime)
+  return True
+
+# Convenience Routine
+def ImageModificationTime(filename):
+  """ modification time of the per frame file or of the series container """
+  if ( os.path.isfile(filename) ):
+    return os.path.getmtime(filename)
+  return os.path.getmtime(SeriesFrame(filename)[0])
+
+# Convenience Routine
+def ReadSeriesHeader(sidecarfile):
+  """ geometry and number of frames of a series container """
+  sidecarHandle = open(sidecarfile,'r')
+  header = json.load(sidecarHandle)
+  sidecarHandle.close()
+  return header
+
+##################################################################
+def ReadSeriesFrame(sidecarfile,idframe,arrayname=None,voi=None):
+  """
+  same as ReadStructuredPoints for a frame of a series container, only the
+  pages of the voi slab are read
+  """
+  header = ReadSeriesHeader(sidecarfile)
+  if ( arrayname != None and arrayname not in [header['arrayname'],'scalars'] ):
+    raise KeyError("%s not in %s" % (arrayname,sidecarfile))
+  dimensions = header['dimensions']
+  framesize = dimensions[0]*dimensions[1]*dimensions[2]
+  rawfile = os.path.join(os.path.dirname(sidecarfile),header['rawfile'])
+  image = numpy.memmap(rawfile,dtype=header['dtype'],mode='r',
+                       offset=idframe*framesize*numpy.dtype(header['dtype']).itemsize,
+                       shape=(dimensions[2],dimensions[1],dimensions[0]))
+  extent = VOIExtent(dimensions,voi)
+  image_array = numpy.array(image[extent[4]:extent[5]+1,extent[2]:extent[3]+1,extent[0]:extent[1]+1],
+                            dtype=numpy.dtype(header['dtype']).newbyteorder('=')).ravel()
+  del image
+  return (tuple(header['origin']),tuple(header['spacing']),extent,image_array)
+
+##################################################################
+class SeriesWriter:
+  """ Class for appending the frames of a time series to a container...  """
+  def __init__(self,prefix,origin,spacing,dimensions,arrayname='image_data',dtype='<f4',append=False,**metadata):
+    # the sidecar is rewritten after every frame, readers only see complete
+    # frames. append=True continues an existing container
+    self.SidecarFile = '%s.series.json' % prefix
+    self.RawFile     = '%s.series.raw'  % prefix
+    if ( append and os.path.isfile(self.SidecarFile) ):
+      self.Header = ReadSeriesHeader(self.SidecarFile)
+    else:
+      self.Header = {'dimensions':[int(dimension) for dimension in dimensions],
+                     'origin'    :[float(x) for x in origin],
+                     'spacing'   :[float(dx) for dx in spacing],
+                     'arrayname' :arrayname,
+                     'dtype'     :dtype,
+                     'rawfile'   :os.path.basename(self.RawFile),
+                     'frames'    :0}
+      self.Header.update(metadata)
+    # truncate frames not recorded in the sidecar
+    rawHandle = open(self.RawFile,'ab')
+    rawHandle.truncate(self.Header['frames'] * self.FrameSize())
+    rawHandle.close()
+    self.RawHandle = open(self.RawFile,'ab')
+    self.WriteSidecar()
+
+  def FrameSize(self):
+    """ bytes per frame """
+    dimensions = self.Header['dimensions']
+    return dimensions[0]*dimensions[1]*dimensions[2] * numpy.dtype(self.Header['dtype']).itemsize
+
+  def WriteSidecar(self):
+    """ written to a temporary file then renamed """
+    tmpfile = '%s.%d.tmp' % (self.SidecarFile,os.getpid())
+    sidecarHandle = open(tmpfile,'w')
+    json.dump(self.Header,sidecarHandle,indent=1,sort_keys=True)
+    sidecarHandle.close()
+    os.rename(tmpfile,self.SidecarFile)
+
+  def AppendFrame(self,image_array):
+    """ append a frame (x fastest), returns the frame number """
+    frame = numpy.asarray(image_array,dtype=self.Header['dtype'])
+    if ( frame.nbytes != self.FrameSize() ):
+      raise ValueError("frame of %d bytes, %d expected" % (frame.nbytes,self.FrameSize()))
+    self.RawHandle.write(frame.tostring())
+    self.RawHandle.flush()
+    self.Header['frames'] = self.Header['frames'] + 1
+    self.WriteSidecar()
+    return self.Header['frames'] - 1
+
+  def Close(self):
+    self.RawHandle.close()
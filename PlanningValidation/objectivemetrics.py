@@ -0,0 +1,136 @@
+# objective function components comparing the SEM prediction to MRTI
+#
+# every frame is reduced w/ preallocated buffers and in place numpy
+# operations, the components are then selected by name so that a DAKOTA
+# study can switch metrics w/o another pass or another run
+#
+#   l1            sum over frames of |mrti - sem|
+#   l2            sum over frames of (mrti - sem)^2
+#   linf          max over frames of |mrti - sem|
+#   l1dose        l1 restricted to the MRTI dose region (dose >= 1)
+#   dice          dice similarity of the dose regions of the last frame
+#   dicepenalty   1/(dice + 1.e-7)
+#   oneminusdice  1 - dice
+#
+# dice, dicepenalty, and oneminusdice take an optional dose threshold,
+# ie dice:0.5 , the default threshold 1 is the arrhenius damage
+
+# numerical support
+import numpy
+
+# components returned to DAKOTA unless the study selects others
+DefaultObjectiveComponents = ['l1','dicepenalty','dice','oneminusdice']
+
+# dose threshold for the damage region
+DamageDoseThreshold = 1.0
+
+# Convenience Routine
+def ParseComponent(componentname):
+  """ component name and dose threshold """
+  componentinfo = componentname.split(':')
+  if ( componentinfo[0] not in ['l1','l2','linf','l1dose','dice','dicepenalty','oneminusdice'] ):
+    raise ValueError("unknown objective component %s" % componentname)
+  if ( len(componentinfo) > 1 ):
+    return (componentinfo[0],float(componentinfo[1]))
+  return (componentinfo[0],DamageDoseThreshold)
+
+# Convenience Routine
+def DoseDice(mrtidose,semdose,threshold=DamageDoseThreshold):
+  """ dice similarity of the thresholded dose regions """
+  mrtimask = mrtidose >= threshold
+  semmask  = semdose  >= threshold
+  regionsize = mrtimask.sum() + semmask.sum()
+  if ( regionsize > 0 ):
+    return 2. * numpy.logical_and(mrtimask,semmask).sum() / regionsize
+  return 0.0
+
+##################################################################
+class ObjectiveReducer:
+  """ Class for accumulation of the objective function components...  """
+  def __init__(self,ComponentNames,NumberOfPoints,NumberOfVariables=0):
+    self.ComponentNames = ComponentNames
+    self.DiceThresholds = sorted(set([ParseComponent(componentname)[1] for componentname in ComponentNames] + [DamageDoseThreshold]))
+    self.ThresholdColumn = numpy.array(self.DiceThresholds)[:,numpy.newaxis]
+    # buffers reused every frame
+    self.Residual = numpy.empty(NumberOfPoints)
+    self.Work     = numpy.empty(NumberOfPoints)
+    # 1 inside the MRTI dose region, 0 outside
+    self.DoseMask = numpy.empty(NumberOfPoints)
+    # dose regions of every dice threshold (nthreshold,npts)
+    self.MRTIMask = numpy.empty((len(self.DiceThresholds),NumberOfPoints),dtype=bool)
+    self.SEMMask  = numpy.empty((len(self.DiceThresholds),NumberOfPoints),dtype=bool)
+    # accumulated metrics
+    self.Metrics  = {'l1':0.0,'l2':0.0,'linf':0.0,'l1dose':0.0}
+    self.Dice     = dict([ (threshold,0.0) for threshold in self.DiceThresholds ])
+    # point and sign of the max error, set when the frame has a new max
+    self.LinfPoint = None
+    self.LinfSign  = 0.0
+    # derivatives of the differentiable metrics, linf is a subgradient
+    self.Gradient = dict([ (metricname,numpy.zeros(NumberOfVariables)) for metricname in ['l1','l2','linf','l1dose'] ])
+
+  def UpdateFrame(self,mrti_array,fem_array,mrtidose,semdose):
+    """
+    reduce a frame of temperature and accumulated dose. the temperature
+    metrics are reductions of one residual and its absolute value
+    """
+    numpy.subtract(mrti_array,fem_array,out=self.Residual)
+    numpy.absolute(self.Residual,out=self.Work)
+    numpy.greater_equal(mrtidose,DamageDoseThreshold,out=self.DoseMask)
+    self.Metrics['l1']     = self.Metrics['l1']     + self.Work.sum()
+    self.Metrics['l1dose'] = self.Metrics['l1dose'] + numpy.dot(self.Work,self.DoseMask)
+    self.Metrics['l2']     = self.Metrics['l2']     + numpy.dot(self.Residual,self.Residual)
+    maxpoint = self.Work.argmax()
+    self.LinfPoint = None
+    if ( self.Work[maxpoint] > self.Metrics['linf'] ):
+      self.Metrics['linf'] = self.Work[maxpoint]
+      self.LinfPoint = maxpoint
+      self.LinfSign  = numpy.sign(self.Residual[maxpoint])
+    # dice of the thresholded dose, same as c3d -thresh t inf 1 0 -overlap 1
+    #  every threshold is compared at once
+    numpy.greater_equal(mrtidose[numpy.newaxis,:],self.ThresholdColumn,out=self.MRTIMask)
+    numpy.greater_equal(semdose[numpy.newaxis,:] ,self.ThresholdColumn,out=self.SEMMask )
+    regionsize = self.MRTIMask.sum(axis=1) + self.SEMMask.sum(axis=1)
+    numpy.logical_and(self.MRTIMask,self.SEMMask,out=self.SEMMask)
+    overlapsize = self.SEMMask.sum(axis=1)
+    for (idthreshold,threshold) in enumerate(self.DiceThresholds):
+      if ( regionsize[idthreshold] > 0 ):
+        self.Dice[threshold] = 2. * overlapsize[idthreshold] / regionsize[idthreshold]
+      else:
+        self.Dice[threshold] = 0.0
+
+  def UpdateGradient(self,femderivatives):
+    """
+    femderivatives (npts,nvar) derivatives of the SEM prediction, called
+    after UpdateFrame.  d/dtheta (mrti - sem) = - dsem/dtheta
+    """
+    self.Gradient['l2'] = self.Gradient['l2'] - 2. * numpy.dot(self.Residual,femderivatives)
+    numpy.sign(self.Residual,out=self.Work)
+    self.Gradient['l1'] = self.Gradient['l1'] - numpy.dot(self.Work,femderivatives)
+    numpy.multiply(self.Work,self.DoseMask,out=self.Work)
+    self.Gradient['l1dose'] = self.Gradient['l1dose'] - numpy.dot(self.Work,femderivatives)
+    # subgradient of the max error, sign of the residual at the max
+    if ( self.LinfPoint != None ):
+      self.Gradient['linf'] = - self.LinfSign * femderivatives[self.LinfPoint]
+
+  def ComponentValue(self,componentname):
+    (metricname,threshold) = ParseComponent(componentname)
+    if ( metricname == 'dice' ):
+      return self.Dice[threshold]
+    elif ( metricname == 'dicepenalty' ):
+      return 1./(self.Dice[threshold] + 1.e-7)
+    elif ( metricname == 'oneminusdice' ):
+      return 1. - self.Dice[threshold]
+    return self.Metrics[metricname]
+
+  def Components(self):
+    """ values of the named components """
+    return tuple([self.ComponentValue(componentname) for componentname in self.ComponentNames])
+
+  def ComponentGradients(self):
+    """
+    derivative of each named component, the max error is a subgradient.
+    dice is piecewise constant and its derivative is zero, DAKOTA should
+    difference the dice components (id_numerical_gradients)
+    """
+    zerogradient = numpy.zeros(len(self.Gradient['l1']))
+    return [ self.Gradient.get(ParseComponent(componentname)[0],zerogradient) for componentname in self.ComponentNames ]
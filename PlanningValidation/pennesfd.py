@@ -0,0 +1,128 @@
+# pennes bioheat equation w/ explicit finite differences on the MRTI grid
+#
+#   rho c_p dT/dt = k_0 lap T - w_0 c_blood (T - T_body) + P(t) q(x)
+#
+# q is the diffusion approximation of the laser source in the brainNek case
+# functions (sourceFunction in brainsearch.py) summed over regions of the
+# laser tip. the grid is the MRTI VOI padded in and out of plane w/ body
+# temperature on the boundary. the tissue is uniform and the probe is not
+# cooled, a low fidelity model for screening, testing, and CPU only runs
+
+# numerical support
+import numpy
+
+# laser tip regions centered at the probe position
+LaserTipLength    = 0.01   # m
+NumberOfTipPoints = 10
+
+# same time step as brainNek unless the explicit update is unstable
+MaximumTimeStep   = 0.25
+
+# Convenience Routine
+def VOIGrid(origin,spacing,extent,padding):
+  """
+  uniform grid containing the VOI of an image w/ padding points on each side
+  a single slice is padded out of plane w/ the in plane spacing
+  returns origin of grid[0,0,0], spacing, dimensions (nx,ny,nz), and the
+  slices of the VOI in the (nz,ny,nx) grid
+  """
+  voidimensions = [extent[1]-extent[0]+1,extent[3]-extent[2]+1,extent[5]-extent[4]+1]
+  gridspacing = numpy.array(spacing,dtype=numpy.float64)
+  if ( voidimensions[2] == 1 ):
+    gridspacing[2] = gridspacing[0]
+  voiorigin  = numpy.array(origin) + numpy.array(spacing) * numpy.array([extent[0],extent[2],extent[4]])
+  gridorigin = voiorigin - padding * gridspacing
+  griddimensions = [ voidimension + 2*padding for voidimension in voidimensions ]
+  voislices = (slice(padding,padding+voidimensions[2]),
+               slice(padding,padding+voidimensions[1]),
+               slice(padding,padding+voidimensions[0]))
+  return (gridorigin,gridspacing,griddimensions,voislices)
+
+# Convenience Routine
+def GridPointCoordinates(origin,spacing,dimensions):
+  """ coordinates (npts,3) of the grid points, x fastest """
+  (kk,jj,ii) = numpy.mgrid[0:dimensions[2],0:dimensions[1],0:dimensions[0]]
+  return numpy.vstack( (origin[0] + spacing[0] * ii.ravel(),
+                        origin[1] + spacing[1] * jj.ravel(),
+                        origin[2] + spacing[2] * kk.ravel()) ).transpose()
+
+# Convenience Routine
+def LaserTipPoints(center,direction):
+  """ centroids of equal regions of the laser tip """
+  unitdirection = numpy.array(direction,dtype=numpy.float64)
+  unitdirection = unitdirection / numpy.sqrt((unitdirection**2).sum())
+  offsets = ( (numpy.arange(NumberOfTipPoints)+0.5)/NumberOfTipPoints - 0.5 ) * LaserTipLength
+  return numpy.array(center)[numpy.newaxis,:] + offsets[:,numpy.newaxis] * unitdirection[numpy.newaxis,:]
+
+# Convenience Routine
+def LaserSource(points,tippoints,mu_a,mu_s,anfact,mindistance):
+  """
+  heating per unit power (W/m^3/W) at points (npts,3)
+
+     q = sum_i  3/(4 pi) mu_a mu_tr / n  exp(-mu_eff r_i) / r_i
+
+  the grid does not resolve 1/r, the distance is bounded below by
+  mindistance instead of dropping the contribution near a tip point
+  """
+  mu_tr  = mu_a + mu_s * (1. - anfact)
+  mu_eff = numpy.sqrt( 3. * mu_a * mu_tr )
+  source = numpy.zeros(points.shape[0])
+  for tippoint in tippoints:
+    distance = numpy.sqrt( ((points - tippoint[numpy.newaxis,:])**2).sum(axis=1) )
+    distance = numpy.maximum(distance,mindistance)
+    source = source + 0.75/numpy.pi * mu_a * mu_tr / len(tippoints) * numpy.exp(-mu_eff * distance) / distance
+  return source
+
+##################################################################
+class PennesFiniteDifference:
+  """ Class for the explicit pennes solve on a uniform grid...  """
+  def __init__(self,spacing,dimensions,materials,source):
+    # spacing     (3,)  grid spacing
+    # dimensions  (nx,ny,nz)
+    # materials   rho, c_p, k_0, w_0, c_blood, body_temp  as in brainNekWrapper
+    # source      heating per unit power at the grid points, x fastest
+    rhoc = float(materials['rho']) * float(materials['c_p'])
+    self.BodyTemperature = float(materials['body_temp'])
+    self.Temperature = self.BodyTemperature * numpy.ones( (dimensions[2],dimensions[1],dimensions[0]) )
+    self.Diffusion   = float(materials['k_0']) / rhoc / numpy.array(spacing,dtype=numpy.float64)**2
+    self.Perfusion   = float(materials['w_0']) * float(materials['c_blood']) / rhoc
+    self.Source      = source.reshape(self.Temperature.shape)[1:-1,1:-1,1:-1] / rhoc
+    self.TimeStep    = min(MaximumTimeStep, 0.9 / (2.*self.Diffusion.sum() + self.Perfusion))
+    # buffers reused every step
+    self.Update = numpy.empty(self.Source.shape)
+    self.Work   = numpy.empty(self.Source.shape)
+
+  def SetTemperature(self,temperature):
+    """ interior temperature at the grid points, x fastest """
+    self.Temperature[1:-1,1:-1,1:-1] = temperature.reshape(self.Temperature.shape)[1:-1,1:-1,1:-1]
+
+  def Step(self,deltat,power):
+    """ forward euler w/ the 7 point laplacian, the boundary is fixed """
+    temperature = self.Temperature
+    interior = temperature[1:-1,1:-1,1:-1]
+    neighbors = [ (temperature[1:-1,1:-1,2:],temperature[1:-1,1:-1,:-2]),
+                  (temperature[1:-1,2:,1:-1],temperature[1:-1,:-2,1:-1]),
+                  (temperature[2:,1:-1,1:-1],temperature[:-2,1:-1,1:-1]) ]
+    # perfusion and source
+    numpy.subtract(interior,self.BodyTemperature,out=self.Update)
+    numpy.multiply(self.Update,-self.Perfusion,out=self.Update)
+    numpy.multiply(self.Source,power,out=self.Work)
+    numpy.add(self.Update,self.Work,out=self.Update)
+    # diffusion
+    for (idaxis,(upper,lower)) in enumerate(neighbors):
+      numpy.add(upper,lower,out=self.Work)
+      self.Work -= 2. * interior
+      self.Work *= self.Diffusion[idaxis]
+      self.Update += self.Work
+    self.Update *= deltat
+    interior += self.Update
+
+  def Advance(self,currenttime,finaltime,powerfunction):
+    """
+    step until finaltime w/ the power at the end of each step as in
+    SolveSEMHistory. returns the time reached
+    """
+    while( currenttime < finaltime ):
+      currenttime = currenttime + self.TimeStep
+      self.Step(self.TimeStep,powerfunction(currenttime))
+    return currenttime
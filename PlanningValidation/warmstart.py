@@ -0,0 +1,162 @@
+# warm start of the transient deltap solves from neighbouring DAKOTA evaluations
+#
+# pattern search evaluates nearby parameter points w/ nearly identical
+# temperature histories. the solution vector of every time step is saved
+# keyed by the parameter vector, the solution of the nearest cached
+# parameter point at the same time step is the initial guess of the Krylov
+# solve (-ksp_initial_guess_nonzero)
+#
+#   warmStart = warmstart.WarmStartCache(cachedirectory,studykey,kwargs['cv'],timeids,rank,size,localsize)
+#   ...
+#   if ( warmStart.HasInitialGuess(timeID) ):
+#     deltapSystem.GetSolutionVector().setArray( warmStart.InitialGuess(timeID) )
+#   deltapSystem.SystemSolve()
+#   warmStart.Store(timeID,deltapSystem.GetSolutionVector().getArray())
+#   ...
+#   warmStart.Save()
+#
+# the solution history is written and read one time step at a time through
+# a memory map (.npy), the parameters are in a small index file (.npz)
+# written last. the Krylov work of an evaluation is the MatMult count of
+# the PETSc log, an evaluation w/o a neighbour is the cold start reference
+#
+# each rank caches the dofs it owns, the files are keyed by the rank and the
+# number of ranks. the warm start is enabled w/ -warmstart_cache <dir>, the
+# drivers then add -ksp_initial_guess_nonzero
+
+import os
+import glob
+import hashlib
+
+# numerical support
+import numpy
+
+# Convenience Routine
+def MatMultCount():
+  """ MatMult calls logged by PETSc, None if the event log is not available """
+  from petsc4py import PETSc
+  try:
+    return int(PETSc.Log.Event('MatMult').getPerfInfo()['count'])
+  except (AttributeError,KeyError):
+    return None
+
+##################################################################
+class WarmStartCache:
+  """ Class for the solution history of neighbouring parameter points...  """
+  def __init__(self,cachedirectory,studykey,parameters,timeids,rank=0,size=1,localsize=None):
+    # parameters  dictionary of the continuous variables, values that are
+    #             not numbers are not part of the parameter vector
+    # timeids     time steps of the solution history
+    # localsize   dofs owned by the rank, a neighbour of another size is not used
+    self.Directory = cachedirectory
+    self.StudyKey  = studykey
+    self.Partition = '%dof%d' % (rank,size)
+    self.LocalSize = localsize
+    self.Names = []
+    for name in sorted(parameters.keys()):
+      try:
+        float(parameters[name])
+        self.Names.append(name)
+      except (TypeError,ValueError):
+        pass
+    self.Parameters = numpy.array([ float(parameters[name]) for name in self.Names ])
+    parameterkey = hashlib.sha1(repr(zip(self.Names,self.Parameters.tolist()))).hexdigest()
+    self.CacheFile = '%s/warmstart.%s.%s.%s' % (cachedirectory,studykey,parameterkey,self.Partition)
+    self.TimeIDs   = list(timeids)
+    self.TimeIndex = dict([ (timeID,idtime) for (idtime,timeID) in enumerate(self.TimeIDs) ])
+    # solution history of this evaluation, mapped on the first time step
+    self.NumDofs   = None
+    self.Solutions = None
+    self.Stored    = numpy.zeros(len(self.TimeIDs),dtype=bool)
+    self.TmpFile   = '%s.%d.tmp.npy' % (self.CacheFile,os.getpid())
+    # neighbour solutions
+    self.NeighborFile      = None
+    self.NeighborSolutions = None
+    self.NeighborIndex     = {}
+    self.ColdMatMult       = None
+    self.InitialMatMult    = MatMultCount()
+    self.FindNeighbor()
+
+  def FindNeighbor(self):
+    """ nearest cached parameter point, relative distance of each parameter """
+    mindistance = None
+    for indexfile in glob.glob('%s/warmstart.%s.*.%s.npz' % (self.Directory,self.StudyKey,self.Partition)):
+      if ( indexfile.endswith('.tmp.npz') ):
+        continue
+      try:
+        cacheData = numpy.load(indexfile)
+        names      = cacheData['names'].tolist()
+        parameters = cacheData['parameters']
+        cacheData.close()
+      except (IOError,ValueError,KeyError):
+        # partially written or stale format
+        continue
+      if ( names != self.Names ):
+        continue
+      scale = numpy.maximum(numpy.maximum(abs(parameters),abs(self.Parameters)),1.e-12)
+      distance = numpy.sqrt( (((parameters - self.Parameters)/scale)**2).sum() )
+      if ( mindistance == None or distance < mindistance ):
+        (mindistance,self.NeighborFile) = (distance,indexfile[:-len('.npz')])
+    if ( self.NeighborFile == None ):
+      print "warm start: no cached neighbour, cold start"
+      return
+    cacheData = numpy.load('%s.npz' % self.NeighborFile)
+    self.NeighborIndex = dict([ (timeID,idtime) for (idtime,timeID) in enumerate(cacheData['timeids'].tolist()) ])
+    self.ColdMatMult = int(cacheData['coldmatmult'])
+    cacheData.close()
+    # only the pages of the time steps used are read
+    self.NeighborSolutions = numpy.load('%s.npy' % self.NeighborFile,mmap_mode='r')
+    if ( self.LocalSize != None and self.NeighborSolutions.shape[1] != self.LocalSize ):
+      print "warm start: %s has %d dofs, %d owned, cold start" % (self.NeighborFile,self.NeighborSolutions.shape[1],self.LocalSize)
+      (self.NeighborFile,self.NeighborSolutions,self.NeighborIndex) = (None,None,{})
+      return
+    print "warm start from %s relative distance %12.5e" % (self.NeighborFile,mindistance)
+
+  def HasInitialGuess(self,timeID):
+    """ neighbour solution available at the time step """
+    return self.NeighborIndex.has_key(timeID)
+
+  def InitialGuess(self,timeID):
+    """ neighbour solution at the time step """
+    return numpy.array(self.NeighborSolutions[self.NeighborIndex[timeID]],dtype=numpy.float64)
+
+  def Store(self,timeID,solution):
+    """ solution of the time step, single precision suffices for a guess """
+    if ( self.NumDofs == None ):
+      os.system('mkdir -p %s' % self.Directory)
+      self.NumDofs = len(solution)
+      self.Solutions = numpy.lib.format.open_memmap(self.TmpFile,mode='w+',dtype=numpy.float32,
+                                                    shape=(len(self.TimeIDs),self.NumDofs))
+    self.Solutions[self.TimeIndex[timeID]] = solution
+    self.Stored[self.TimeIndex[timeID]] = True
+
+  def Save(self):
+    """
+    report the Krylov work and cache the solution history, the index file
+    is written last. an incomplete history is removed
+    """
+    matmult = None
+    if ( self.InitialMatMult != None ):
+      matmult = MatMultCount() - self.InitialMatMult
+    if ( self.NeighborFile == None ):
+      # this evaluation is the cold start reference
+      self.ColdMatMult = matmult
+      print "warm start: cold start %s MatMult" % matmult
+    elif ( matmult != None and self.ColdMatMult != None and self.ColdMatMult > 0 ):
+      print "warm start: %d MatMult, cold start %d, %5.1f%% saved" % (matmult,self.ColdMatMult,
+                             100. * (self.ColdMatMult - matmult) / self.ColdMatMult)
+    if ( self.NumDofs == None ):
+      return
+    self.Solutions.flush()
+    self.Solutions = None
+    if ( not self.Stored.all() ):
+      os.remove(self.TmpFile)
+      return
+    coldmatmult = self.ColdMatMult
+    if ( coldmatmult == None ):
+      coldmatmult = -1
+    os.rename(self.TmpFile,'%s.npy' % self.CacheFile)
+    tmpindexfile = '%s.%d.tmp.npz' % (self.CacheFile,os.getpid())
+    numpy.savez(tmpindexfile,names=numpy.array(self.Names),parameters=self.Parameters,
+                timeids=numpy.array(self.TimeIDs),coldmatmult=numpy.array(coldmatmult))
+    os.rename(tmpindexfile,'%s.npz' % self.CacheFile)
@@ -62,6 +62,17 @@ public:
     assert (sz == brain_forcing.size);
     brain_forcing.toDevice(sz, dest);
   }
+  /// reuse the mesh, operators, and kernels for another evaluation w/ the
+  /// same mesh, materials, and case file. the time is passed to each step,
+  /// only the temperature, forcing, and screenshot count are reset
+  void resetState(size_t tsz, void *temperature, size_t fsz, void *forcing){
+    setDeviceTemperature(tsz, temperature);
+    setDeviceForcing(    fsz, forcing);
+    frameCount = 0;
+  }
+  void setFinalTime(double time){
+    finalTime = time;
+  }
   intptr_t getTemperaturePointer() {
     return reinterpret_cast<intptr_t>(brain_u.clMem);
   }
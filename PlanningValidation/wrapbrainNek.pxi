@@ -43,6 +43,8 @@ cdef extern from "wrapbrainNek.h":
         void setDeviceTemperature(size_t , void *)
         void getHostForcing(  size_t , void *)
         void setDeviceForcing(size_t , void *)
+        void resetState(size_t , void *, size_t , void *)
+        void setFinalTime(double)
         void PrintSelf( )
 #        # http://documen.tician.de/pyopencl/misc.html#interoperability-with-other-opencl-software
 #        intptr_t getTemperaturePointer()
@@ -83,6 +83,22 @@ cdef class PyBrain3d:
         assert Forcing.dtype == np.float32 
         cdef size_t databyte = Forcing.shape[0] * 4
         self.thisptr.setDeviceForcing(databyte,&Forcing[0])
+    def ResetState(self,np.ndarray[float, ndim=1, mode="c"] Temperature not None,
+                        np.ndarray[float, ndim=1, mode="c"] Forcing     not None):
+        """
+        reset temperature and forcing to reuse the solver for another
+        evaluation, the mesh, operators, and kernels are kept
+        """
+        assert Temperature.dtype == np.float32 
+        assert Forcing.dtype     == np.float32 
+        cdef size_t temperaturebyte = Temperature.shape[0] * 4
+        cdef size_t forcingbyte     = Forcing.shape[0] * 4
+        self.thisptr.resetState(temperaturebyte,&Temperature[0],forcingbyte,&Forcing[0])
+    def SetFinalTime(self, double FinalTime):
+        """
+        final time used by timeStep
+        """
+        self.thisptr.setFinalTime(FinalTime)
     def GetNodes(self,np.ndarray[float, ndim=1, mode="c"] nodesarray not None):
         """
         transfer nodes array as 1-d array
@@ -4,6 +4,9 @@ import re
 import os
 import scipy
 import numpy
+# fem to image interpolation weights
+sys.path.append( '%s/../PlanningValidation' % os.path.dirname(os.path.abspath(__file__)) )
+import femprojection
 
 # FIXME global vars are prob bad idea...
 ntime = 60
@@ -89,95 +92,50 @@ def ProjectImagingMesh(fem_mesh_file):
   # #print type(mrti_array)
 
   # Interpolate FEM onto imaging data structures
-  vtkExodusIIReader = vtk.vtkExodusIIReader()
-  vtkExodusIIReader.SetFileName( fem_mesh_file )
-  vtkExodusIIReader.SetPointResultArrayStatus("u0",1)
-  vtkExodusIIReader.SetPointResultArrayStatus("u0*",1)
-  vtkExodusIIReader.SetPointResultArrayStatus("u1",1)
+  #  the mesh geometry and the transform are the same for every time step,
+  #  the blocks are merged, transformed, and the interpolation weights of
+  #  the image points computed once. each time step reads the nodal arrays
+  femProjection = femprojection.ExodusImageProjection(fem_mesh_file,["u0","u0*","u1"],
+                                  origin,spacing,dimensions,RotationMatrix,Translation)
 
-  matsize = int(dimensions[1])#get matrix size
+  # the probed arrays are x fastest, image row ny of nx pixels. the
+  # reorientation fliplr(rot90(.,k=3)) of the ny x nx image is its
+  # transpose, ie the probed array viewed (nx,ny) in fortran order. the
+  # stacks are fortran ordered so that each time step is one contiguous
+  # copy in the final orientation (and savemat writes them w/o a transpose)
+  imagesize = (int(dimensions[0]),int(dimensions[1]))
   #preallocate size of arrays
-  u0_array_1 = scipy.zeros((matsize,matsize))
-  u0_array_2 = scipy.zeros((matsize,matsize,ntime*nsubstep))
-  u1_array_1 = scipy.zeros((matsize,matsize))
-  u1_array_2 = scipy.zeros((matsize,matsize,ntime*nsubstep))
-  u0star_array_1 = scipy.zeros((matsize,matsize))
-  u0star_array_2 = scipy.zeros((matsize,matsize,ntime*nsubstep))
+  u0_array_2 = numpy.zeros(imagesize+(ntime*nsubstep,),order='F')
+  u1_array_2 = numpy.zeros(imagesize+(ntime*nsubstep,),order='F')
+  u0star_array_2 = numpy.zeros(imagesize+(ntime*nsubstep,),order='F')
 
   #for timeID in range(1,2):
   for timeID in range(1,ntime*nsubstep):
-    vtkExodusIIReader.SetTimeStep(timeID-1)
-    vtkExodusIIReader.Update()
-    
-    # apply the transform
-    TransformedFEMMesh = None
-    if vtkExodusIIReader.GetOutput().IsA("vtkMultiBlockDataSet"):
-      AppendBlocks = vtk.vtkAppendFilter()
-      iter = vtkExodusIIReader.GetOutput().NewIterator()
-      iter.UnRegister(None)
-      iter.InitTraversal()
-      # loop over blocks...
-      while not iter.IsDoneWithTraversal():
-          curInput = iter.GetCurrentDataObject()
-          vtkTransformFEMMesh = vtk.vtkTransformFilter()
-          vtkTransformFEMMesh.SetTransform( AffineTransform )
-          vtkTransformFEMMesh.SetInput( curInput )
-          vtkTransformFEMMesh.Update()
-          AppendBlocks.AddInput( vtkTransformFEMMesh.GetOutput() )
-          AppendBlocks.Update( )
-          iter.GoToNextItem();
-      TransformedFEMMesh = AppendBlocks.GetOutput()
-    else:
-      vtkTransformFEMMesh = vtk.vtkTransformFilter()
-      vtkTransformFEMMesh.SetTransform( AffineTransform )
-      vtkTransformFEMMesh.SetInput( vtkExodusIIReader.GetOutput() )
-      vtkTransformFEMMesh.Update()
-      TransformedFEMMesh = vtkTransformFEMMesh.GetOutput()
-
-    # reflect
-    #vtkReflectX = vtk.vtkReflectionFilter()
-    #vtkReflectX.SetPlaneToXMin()
-    #vtkReflectX.SetInput( TransformedFEMMesh )
-    #vtkReflectX.Update()
+    femArrays = femProjection.InterpolateTimeStep(timeID-1)
+    u0_array = femArrays['u0']
+    u0star_array = femArrays['u0*']
+    u1_array = femArrays['u1']
 
-    # reflect
-    #vtkReflectZ = vtk.vtkReflectionFilter()
-    #vtkReflectZ.SetPlaneToZMax()
-    #vtkReflectZ.SetInput( vtkReflectX.GetOutput() )
-    #vtkReflectZ.Update()
-
-    # reuse ShiftScale Geometry
-    vtkResample = vtk.vtkCompositeDataProbeFilter()
-    vtkResample.SetInput( templateImage )
-    vtkResample.SetSource( TransformedFEMMesh )
-    #vtkResample.SetSource( vtkReflectZ.GetOutput() )
-    vtkResample.Update()
-    fem_point_data= vtkResample.GetOutput().GetPointData()
-    u0_array = vtkNumPy.vtk_to_numpy(fem_point_data.GetArray('u0'))
-    u0star_array = vtkNumPy.vtk_to_numpy(fem_point_data.GetArray('u0*'))
-    u1_array = vtkNumPy.vtk_to_numpy(fem_point_data.GetArray('u1'))
- 
-    
-    #go from 1x256^2 array to 256X256 array for each timestep
-    for nn in range(0,matsize):
-     u0_array_1[nn,:]=u0_array[nn*matsize:(nn+1)*matsize]
-     u0star_array_1[nn,:]=u0star_array[nn*matsize:(nn+1)*matsize]
-     u1_array_1[nn,:]=u1_array[nn*matsize:(nn+1)*matsize]
-   
-    #apply proper rotations/reflections and combine 2D arrays into 3D array 
-    u0_array_2[:,:,timeID-1]=numpy.fliplr(numpy.rot90(u0_array_1,k=3))
-    u0star_array_2[:,:,timeID-1]=numpy.fliplr(numpy.rot90(u0star_array_1,k=3))
-    u1_array_2[:,:,timeID-1]=numpy.fliplr(numpy.rot90(u1_array_1,k=3))
+    #reoriented 2D view of the 1D array (no copy) stored in the 3D array
+    u0_array_2[:,:,timeID-1]=u0_array[:imagesize[0]*imagesize[1]].reshape(imagesize,order='F')
+    u0star_array_2[:,:,timeID-1]=u0star_array[:imagesize[0]*imagesize[1]].reshape(imagesize,order='F')
+    u1_array_2[:,:,timeID-1]=u1_array[:imagesize[0]*imagesize[1]].reshape(imagesize,order='F')
     
     # write numpy to disk in matlab
     #scipyio.savemat("MS795.%04d.mat" % (timeID), {'u0':u1_array,'MRTI0':MRTI0_array })
 
     # write output
     print "writing ", timeID
+    vtkFEMImage = vtk.vtkImageData()
+    vtkFEMImage.CopyStructure( templateImage )
+    for (arrayname,image_array) in femArrays.items():
+      vtkImageArray = vtkNumPy.numpy_to_vtk( image_array, 1 )
+      vtkImageArray.SetName( arrayname )
+      vtkFEMImage.GetPointData().AddArray( vtkImageArray )
     vtkStatsWriter = vtk.vtkDataSetWriter()
     vtkStatsWriter.SetFileTypeToBinary()
     vtkStatsWriter.SetFileName("test.%04d.vtk" % timeID )
-    vtkStatsWriter.SetInput(vtkResample.GetOutput())
+    vtkStatsWriter.SetInput(vtkFEMImage)
     vtkStatsWriter.Update()
 
   scipyio.savemat("S695.mat",{'ModelFluence':u1_array_2,'MRTI':u0star_array_2,'ModelTemp':u0_array_2})
@@ -11,34 +11,63 @@ import sys
 import re
 import os
 import math
-
-def deltapModeling(**kwargs):
+# native reader of the MRTI series
+sys.path.append( '%s/../PlanningValidation' % os.path.dirname(os.path.abspath(__file__)) )
+import mrtiio
+import femprojection
+import warmstart
+
+# petsc and libMesh are initialized once per process, the evaluation queue
+# (PlanningValidation/evalqueue.py) runs several evaluations per process on
+# a sub-communicator of COMM_WORLD
+LibMeshInit = None
+def InitializeLibraries(comm=None):
   """
-  treatment planning model 
+  initialize petsc on comm (COMM_WORLD by default) and libMesh
   """
-  # import petsc and numpy
-  import petsc4py, numpy
+  global LibMeshInit
+  if ( LibMeshInit != None ):
+    return
+  # import petsc 
+  import petsc4py
   # init petsc
   PetscOptions =  sys.argv
   PetscOptions.append("-ksp_monitor")
   PetscOptions.append("-ksp_rtol")
   PetscOptions.append("1.0e-15")
+  # the initial guess is the warm start solution w/ -warmstart_cache <dir>
+  if ( '-warmstart_cache' in PetscOptions[:-1] and PetscOptions[PetscOptions.index('-warmstart_cache')+1] != '' ):
+    PetscOptions.append("-ksp_initial_guess_nonzero")
   #PetscOptions.append("-help")
   #PetscOptions.append("-idb")
-  petsc4py.init(PetscOptions)
-  #
-  # break processors into separate communicators
+  petsc4py.init(PetscOptions,comm=comm)
   from petsc4py import PETSc
-  petscRank = PETSc.COMM_WORLD.getRank()
-  petscSize = PETSc.COMM_WORLD.Get_size()
-  sys.stdout.write("petsc rank %d petsc nproc %d\n" % (petscRank, petscSize))
+  # the MatMult count measures the Krylov work of the warm start
+  PETSc.Log.begin()
 
   # set shell context
   # TODO import vtk should be called after femLibrary ???? 
   # FIXME WHY IS THIS????
   import femLibrary
   # initialize libMesh data structures
-  libMeshInit = femLibrary.PyLibMeshInit(PetscOptions,PETSc.COMM_WORLD) 
+  LibMeshInit = femLibrary.PyLibMeshInit(PetscOptions,PETSc.COMM_WORLD) 
+# end def InitializeLibraries(comm=None):
+
+def deltapModeling(**kwargs):
+  """
+  treatment planning model 
+  """
+  # petsc and libMesh are initialized on the first evaluation
+  InitializeLibraries()
+  import numpy
+  PetscOptions =  sys.argv
+  #
+  # PETSc.COMM_WORLD is the sub-communicator of a queue evaluation
+  from petsc4py import PETSc
+  petscRank = PETSc.COMM_WORLD.getRank()
+  petscSize = PETSc.COMM_WORLD.Get_size()
+  sys.stdout.write("petsc rank %d petsc nproc %d\n" % (petscRank, petscSize))
+  import femLibrary
   
   # store control variables
   getpot = femLibrary.PylibMeshGetPot(PetscOptions) 
@@ -208,12 +237,17 @@ def deltapModeling(**kwargs):
   #For NS/NR
   getpot.SetIniPower(nsubstep,  [ [1,6,42,ntime],[1.0,0.0,1.0,0.0] ])
   deltapSystem = eqnSystems.AddPennesDeltaPSystem("StateSystem",deltat) 
-  deltapSystem.AddStorageVectors(ntime)
+  # streaming mode, w/ -storage_window W only W state and imaging vectors
+  #  are stored instead of every time step. the objective is accumulated
+  #  every time step, the stored vectors are not read back. every storage
+  #  access (store, update, set) uses the slot timeID % storageWindow
+  storageWindow = max(min(PETSc.Options().getInt('storage_window',ntime),ntime),1)
+  deltapSystem.AddStorageVectors(storageWindow)
 
   # hold imaging
   mrtiSystem = eqnSystems.AddExplicitSystem( "MRTI" ) 
   mrtiSystem.AddFirstLagrangeVariable( "u0*" ) 
-  mrtiSystem.AddStorageVectors(ntime)
+  mrtiSystem.AddStorageVectors(storageWindow)
   maskSystem = eqnSystems.AddExplicitSystem( "ImageMask" ) 
   maskSystem.AddFirstLagrangeVariable( "mask" ) 
   
@@ -249,6 +283,16 @@ def deltapModeling(**kwargs):
   spacing = templateImage.GetSpacing()
   origin  = templateImage.GetOrigin()
   print spacing, origin, dimensions
+  # image output w/ -image_output
+  #  the exodus node ordering and the cell weights of the reflected mesh
+  #  are computed before the initial condition is set, the dof map
+  #  calibration overwrites the time step 0 state. serial runs only,
+  #  evaluations of the same process reuse the projection
+  writeControl = PETSc.Options().getBool('image_output',False)
+  femProjection = None
+  if ( writeControl ):
+    femProjection = femprojection.CachedImageProjection(eqnSystems,"StateSystem",deltapSystem,"u0",
+                       meshFile,origin,spacing,dimensions,"dofmap.%04d.e" % kwargs['fileID'] )
   # setup imaging
   femImaging = femLibrary.PytttkImaging(getpot, dimensions ,origin,spacing) 
   # project onto fem 
@@ -256,50 +300,94 @@ def deltapModeling(**kwargs):
   dataArray = vtkNumPy.vtk_to_numpy(imageCells.GetArray('scalars')) 
   v1 = PETSc.Vec().createWithArray(dataArray, comm=PETSc.COMM_SELF)
   femImaging.ProjectImagingToFEMMesh("MRTI",0.0,v1,eqnSystems)  
-  mrtiSystem.StoreSystemTimeStep(nzero ) 
+  mrtiSystem.StoreSystemTimeStep(nzero % storageWindow ) 
   # check if we want to project imaging onto FEM as the IC
   if (nzero != 0):
      mrtidata = mrtiSystem.GetSolutionVector() 
      # write soln to disk for processing
      eqnSystems.SetPetscFEMSystemSolnSubVector( "StateSystem",mrtidata,0)
-     eqnSystems.UpdatePetscFEMSystemTimeStep("StateSystem",nzero) 
+     eqnSystems.UpdatePetscFEMSystemTimeStep("StateSystem",nzero % storageWindow) 
 
+  # exodus output is optional, every exodus_interval time steps
+  exodusInterval = PETSc.Options().getInt('exodus_interval',0)
   # write IC
   exodusII_IO = femLibrary.PylibMeshExodusII_IO(femMesh)
-  exodusII_IO.WriteTimeStep(MeshOutputFile,eqnSystems, 1, 0.0 )  
+  if ( exodusInterval > 0 ):
+    exodusII_IO.WriteTimeStep(MeshOutputFile,eqnSystems, 1, 0.0 )  
   
+  # the imaging projected onto the mesh is the same for every evaluation
+  #  cached w/ -imaging_cache <dir>, an empty directory disables the cache
+  imagingCacheDirectory = PETSc.Options().getString('imaging_cache','./imagingcache')
+  imageTimeIDs = range(nzero+1,ntime*nsubstep)
+  imagingKey = femprojection.ImagingCacheKey( meshFile,
+                  [imageFileNameTemplate % timeID for timeID in imageTimeIDs],
+                  RotationMatrix,Translation,dimensions,origin,spacing,'mask roi 98:158,46:106' )
+  #  each rank caches the dofs it owns
+  projectedImaging = None
+  if ( imagingCacheDirectory != '' ):
+    projectedImaging = femprojection.LoadProjectedImaging(imagingCacheDirectory,imagingKey,petscRank,petscSize,
+                                                          mrtiSystem.GetSolutionVector().getLocalSize())
+  # the projection is collective, the cache is used if every rank has its part
+  if ( not femprojection.AllRanks(projectedImaging != None) ):
+    projectedImaging = None
+  if ( projectedImaging != None ):
+    # the mask is the same every time step
+    femprojection.SetSystemSolution(eqnSystems,"ImageMask",maskSystem,projectedImaging['mask'],0)
+  imagingWriter = None
+  if ( projectedImaging == None and imagingCacheDirectory != '' ):
+    imagingWriter = femprojection.ProjectedImagingWriter(imagingCacheDirectory,imagingKey,len(imageTimeIDs),
+                                                         petscRank,petscSize)
+  # solution history of the nearest cached parameter point is the initial guess
+  #  enabled w/ -warmstart_cache <dir>, each rank caches the dofs it owns
+  warmStartDirectory = PETSc.Options().getString('warmstart_cache','')
+  warmStart = None
+  if ( warmStartDirectory != '' ):
+    warmStart = warmstart.WarmStartCache(warmStartDirectory,imagingKey,kwargs['cv'],imageTimeIDs,
+                                         petscRank,petscSize,deltapSystem.GetSolutionVector().getLocalSize())
+
   # loop over time steps and solve
   ObjectiveFunction = 0.0
-  for timeID in range(nzero+1,ntime*nsubstep):
+  for timeID in imageTimeIDs:
   #for timeID in range(1,10):
-     # project imaging onto fem mesh
-     vtkImageReader = vtk.vtkDataSetReader() 
-     vtkImageReader.SetFileName( imageFileNameTemplate % timeID )
-     vtkImageReader.Update() 
-     image_cells = vtkImageReader.GetOutput().GetPointData() 
-     data_array = vtkNumPy.vtk_to_numpy(image_cells.GetArray('scalars')) 
-     v1 = PETSc.Vec().createWithArray(data_array, comm=PETSc.COMM_SELF)
-     femImaging.ProjectImagingToFEMMesh("MRTI",0.0,v1,eqnSystems)  
-     mrtiSystem.StoreSystemTimeStep(timeID ) 
+     storageSlot = timeID % storageWindow
+     if ( projectedImaging != None ):
+       femprojection.SetSystemSolution(eqnSystems,"MRTI",mrtiSystem,
+                                       projectedImaging['mrti'][timeID-imageTimeIDs[0]],storageSlot)
+     else:
+       # project imaging onto fem mesh
+       #  the geometry is the same as the template, only the array is read
+       (imageorigin,imagespacing,imageextent,data_array) = mrtiio.ReadStructuredPoints(imageFileNameTemplate % timeID,'scalars')
+       v1 = PETSc.Vec().createWithArray(data_array, comm=PETSc.COMM_SELF)
+       femImaging.ProjectImagingToFEMMesh("MRTI",0.0,v1,eqnSystems)  
+       if ( imagingWriter != None ):
+         imagingWriter.StoreMRTI(timeID-imageTimeIDs[0],mrtiSystem.GetSolutionVector().getArray())
+     mrtiSystem.StoreSystemTimeStep(storageSlot ) 
   
-     # create image mask 
-     #  The = operator for numpy arrays just copies by reference
-     #   .copy() provides a deep copy (ie physical memory copy)
-     image_mask = data_array.copy().reshape(dimensions,order='F')
-     # Set all image pixels to large value
-     largeValue = 1.e6
-     image_mask[:,:] = largeValue 
-     # RMS error will be computed within this ROI/VOI imagemask[xcoords/column,ycoords/row]
-     #image_mask[93:153,52:112] = 1.0
-     image_mask[98:158,46:106] = 1.0
-     v2 = PETSc.Vec().createWithArray(image_mask, comm=PETSc.COMM_SELF)
-     femImaging.ProjectImagingToFEMMesh("ImageMask",largeValue,v2,eqnSystems)  
+     # create image mask, the same every time step
+     if ( projectedImaging == None and timeID == imageTimeIDs[0] ):
+       #  The = operator for numpy arrays just copies by reference
+       #   .copy() provides a deep copy (ie physical memory copy)
+       image_mask = data_array.copy().reshape(dimensions,order='F')
+       # Set all image pixels to large value
+       largeValue = 1.e6
+       image_mask[:,:] = largeValue 
+       # RMS error will be computed within this ROI/VOI imagemask[xcoords/column,ycoords/row]
+       #image_mask[93:153,52:112] = 1.0
+       image_mask[98:158,46:106] = 1.0
+       v2 = PETSc.Vec().createWithArray(image_mask, comm=PETSc.COMM_SELF)
+       femImaging.ProjectImagingToFEMMesh("ImageMask",largeValue,v2,eqnSystems)  
+       if ( imagingWriter != None ):
+         imagingWriter.StoreMask(maskSystem.GetSolutionVector().getArray())
      #print mrti_array
      #print type(mrti_array)
 
      print "time step = " ,timeID
-     eqnSystems.UpdatePetscFEMSystemTimeStep("StateSystem",timeID ) 
+     eqnSystems.UpdatePetscFEMSystemTimeStep("StateSystem",storageSlot ) 
+     if ( warmStart != None and warmStart.HasInitialGuess(timeID) ):
+       deltapSystem.GetSolutionVector().setArray( warmStart.InitialGuess(timeID) )
      deltapSystem.SystemSolve()
+     if ( warmStart != None ):
+       warmStart.Store(timeID,deltapSystem.GetSolutionVector().getArray() )
      #eqnSystems.StoreTransientSystemTimeStep("StateSystem",timeID ) 
   
      # accumulate objective function
@@ -312,39 +400,32 @@ def deltapModeling(**kwargs):
      ObjectiveFunction =( ObjectiveFunction + qoi) 
     
      # control write output
-     writeControl = False
-     if ( timeID%nsubstep == 0 and writeControl ):
+     if ( exodusInterval > 0 and timeID%exodusInterval == 0 ):
        # write exodus file
        exodusII_IO.WriteTimeStep(MeshOutputFile,eqnSystems, timeID+1, timeID*deltat )  
+     if ( timeID%nsubstep == 0 and writeControl ):
        # Interpolate FEM onto imaging data structures
-       if (vtk != None):
-         vtkExodusIIReader = vtk.vtkExodusIIReader()
-         vtkExodusIIReader.SetFileName(MeshOutputFile )
-         vtkExodusIIReader.SetPointResultArrayStatus("u0",1)
-         vtkExodusIIReader.SetTimeStep(timeID-1) 
-         vtkExodusIIReader.Update()
-         # reflect
-         vtkReflect = vtk.vtkReflectionFilter()
-         vtkReflect.SetPlaneToYMax()
-         vtkReflect.SetInput( vtkExodusIIReader.GetOutput() )
-         vtkReflect.Update()
-         # reuse ShiftScale Geometry
-         vtkResample = vtk.vtkCompositeDataProbeFilter()
-         vtkResample.SetInput( vtkImageReader.GetOutput() )
-         vtkResample.SetSource( vtkReflect.GetOutput() ) 
-         vtkResample.Update()
-         fem_point_data= vtkResample.GetOutput().GetPointData() 
-         fem_array = vtkNumPy.vtk_to_numpy(fem_point_data.GetArray('u0')) 
-         #print fem_array 
-         #print type(fem_array )
+       fem_array = femProjection.Interpolate( deltapSystem.GetSolutionVector().getArray() )
+       #print fem_array 
+       #print type(fem_array )
        # only rank 0 should write
        if ( petscRank == 0 ):
           print "writing ", timeID
+          femImage = vtk.vtkImageData()
+          femImage.CopyStructure( templateImage )
+          vtkFEMArray = vtkNumPy.numpy_to_vtk( fem_array, deep=1 )
+          vtkFEMArray.SetName( 'u0' )
+          femImage.GetPointData().SetScalars( vtkFEMArray )
           vtkTemperatureWriter = vtk.vtkDataSetWriter()
           vtkTemperatureWriter.SetFileTypeToBinary()
           vtkTemperatureWriter.SetFileName("invspio_67_11.%04d.vtk" % timeID )
-          vtkTemperatureWriter.SetInput(vtkResample.GetOutput())
+          vtkTemperatureWriter.SetInput(femImage)
           vtkTemperatureWriter.Update()
+  # cache the projected imaging for the next evaluation
+  if ( imagingWriter != None ):
+    imagingWriter.Close()
+  if ( warmStart != None ):
+    warmStart.Save()
   print 'Objective Fn'
   print ObjectiveFunction
   retval = dict([])
@@ -370,140 +451,156 @@ aprepro_regex = re.compile('^\s*\{\s*(' + tag + ')\s*=\s*(' + value +')\s*\}$')
 # regular expression for standard parameters format
 standard_regex = re.compile('^\s*(' + value +')\s+(' + tag + ')$')
 
-# open DAKOTA parameters file for reading
-paramsfile = open(sys.argv[1], 'r')
-fileID = int(sys.argv[1].split(".").pop())
-
-# extract the parameters from the file and store in a dictionary
-paramsdict = {}
-for line in paramsfile:
-    m = aprepro_regex.match(line)
-    if m:
-        paramsdict[m.group(1)] = m.group(2)
-    else:
-        m = standard_regex.match(line)
-        if m:
-            paramsdict[m.group(2)] = m.group(1)
-
-paramsfile.close()
-
-# crude error checking; handle both standard and aprepro cases
-num_vars = 0
-if ('variables' in paramsdict):
-    num_vars = int(paramsdict['variables'])
-elif ('DAKOTA_VARS' in paramsdict):
-    num_vars = int(paramsdict['DAKOTA_VARS'])
-
-num_fns = 0
-if ('functions' in paramsdict):
-    num_fns = int(paramsdict['functions'])
-elif ('DAKOTA_FNS' in paramsdict):
-    num_fns = int(paramsdict['DAKOTA_FNS'])
-
-# -------------------------------
-# Convert and send to application
-# -------------------------------
-
-# set up the data structures the rosenbrock analysis code expects
-# for this simple example, put all the variables into a single hardwired array
-continuous_vars = { 
-                    'k_0_healthy' :'.63' ,
-                    'k_0_tumor'   :'.63' ,
-                    'mu_a_healthy':'2',
-                    'mu_a_tumor'  :paramsdict['mu_a_tumor'  ],
-                    'nzero'       :int(paramsdict['nzero'  ])
-                  }
-
-try:
-   continuous_vars['w_0_healthy'] = paramsdict['w_0_healthy' ]  
-   continuous_vars['w_0_tumor'  ] = paramsdict['w_0_tumor'   ] 
-except KeyError:
-   continuous_vars['w_0_healthy'] = "0.0"
-   continuous_vars['w_0_tumor'  ] = "0.0"
-
-try:
-   continuous_vars['anfact'] = paramsdict['anfact'   ] 
-except KeyError:
-   continuous_vars['anfact'] = "0.9"
-
-try:
-   continuous_vars['mu_s_healthy'] = paramsdict['mu_s_healthy']
-   continuous_vars['mu_s_tumor'  ] = paramsdict['mu_s_tumor'  ]
-except KeyError:
-   anfact       = float(continuous_vars['anfact'] )
-   od_healthy   = float('.105')
-   od_tumor     = float('.707')
-   mu_a_healthy = float('2')
-   mu_a_tumor   = float(paramsdict['mu_a_tumor'  ])
-   #Mutr=ln(10)*OD/.01  #  .01 --> in meters  
-   #mu_s = (mutr-mua)/(1-g)
-   mu_tr_healthy= math.log(10) * od_healthy / 0.01
-   mu_tr_tumor  = math.log(10) * od_tumor   / 0.01
-   continuous_vars['mu_s_healthy'] = "%f" % ((mu_tr_healthy-mu_a_healthy)/(1.0-anfact))
-   continuous_vars['mu_s_tumor'  ] = "%f" % ((mu_tr_tumor  -mu_a_tumor  )/(1.0-anfact))
-
-try:
-   continuous_vars['x_translate'] = float( '-.0052' )
-except KeyError:
-   continuous_vars['x_translate'] = -0.0055
-
-try:
-  active_set_vector = [ int(paramsdict['ASV_%d:response_fn_%d' % (i,i) ]) for i in range(1,num_fns+1)  ] 
-except KeyError:
-  active_set_vector = [ int(paramsdict['ASV_%d:obj_fn' % (i) ]) for i in range(1,num_fns+1)  ] 
-
-# set a dictionary for passing to rosenbrock via Python kwargs
-fem_params              = {}
-fem_params['cv']        = continuous_vars
-fem_params['asv']       = active_set_vector
-fem_params['functions'] = num_fns
-fem_params['fileID']    = fileID 
-
-# execute the rosenbrock analysis as a separate Python module
-print "Running deltap model..."
-fem_results = deltapModeling(**fem_params)
-print "deltap complete."
-
-
-# ----------------------------
-# Return the results to DAKOTA
-# ----------------------------
-
-if (fem_results['rank'] == 0 ):
-  # write the results.out file for return to DAKOTA
-  # this example only has a single function, so make some assumptions;
-  # not processing DVV
-  outfile = open('results.out.tmp.%d' % fileID, 'w')
+def ParseParameters(paramsfilename):
+  """
+  model parameters of a DAKOTA parameters file
+  """
+  # open DAKOTA parameters file for reading
+  paramsfile = open(paramsfilename, 'r')
+  fileID = int(paramsfilename.split(".").pop())
+
+  # extract the parameters from the file and store in a dictionary
+  paramsdict = {}
+  for line in paramsfile:
+      m = aprepro_regex.match(line)
+      if m:
+          paramsdict[m.group(1)] = m.group(2)
+      else:
+          m = standard_regex.match(line)
+          if m:
+              paramsdict[m.group(2)] = m.group(1)
+
+  paramsfile.close()
+
+  # crude error checking; handle both standard and aprepro cases
+  num_vars = 0
+  if ('variables' in paramsdict):
+      num_vars = int(paramsdict['variables'])
+  elif ('DAKOTA_VARS' in paramsdict):
+      num_vars = int(paramsdict['DAKOTA_VARS'])
+
+  num_fns = 0
+  if ('functions' in paramsdict):
+      num_fns = int(paramsdict['functions'])
+  elif ('DAKOTA_FNS' in paramsdict):
+      num_fns = int(paramsdict['DAKOTA_FNS'])
+
+  # -------------------------------
+  # Convert and send to application
+  # -------------------------------
+
+  # set up the data structures the rosenbrock analysis code expects
+  # for this simple example, put all the variables into a single hardwired array
+  continuous_vars = { 
+                      'k_0_healthy' :'.63' ,
+                      'k_0_tumor'   :'.63' ,
+                      'mu_a_healthy':'2',
+                      'mu_a_tumor'  :paramsdict['mu_a_tumor'  ],
+                      'nzero'       :int(paramsdict['nzero'  ])
+                    }
+
+  try:
+     continuous_vars['w_0_healthy'] = paramsdict['w_0_healthy' ]  
+     continuous_vars['w_0_tumor'  ] = paramsdict['w_0_tumor'   ] 
+  except KeyError:
+     continuous_vars['w_0_healthy'] = "0.0"
+     continuous_vars['w_0_tumor'  ] = "0.0"
+
+  try:
+     continuous_vars['anfact'] = paramsdict['anfact'   ] 
+  except KeyError:
+     continuous_vars['anfact'] = "0.9"
+
+  try:
+     continuous_vars['mu_s_healthy'] = paramsdict['mu_s_healthy']
+     continuous_vars['mu_s_tumor'  ] = paramsdict['mu_s_tumor'  ]
+  except KeyError:
+     anfact       = float(continuous_vars['anfact'] )
+     od_healthy   = float('.105')
+     od_tumor     = float('.707')
+     mu_a_healthy = float('2')
+     mu_a_tumor   = float(paramsdict['mu_a_tumor'  ])
+     #Mutr=ln(10)*OD/.01  #  .01 --> in meters  
+     #mu_s = (mutr-mua)/(1-g)
+     mu_tr_healthy= math.log(10) * od_healthy / 0.01
+     mu_tr_tumor  = math.log(10) * od_tumor   / 0.01
+     continuous_vars['mu_s_healthy'] = "%f" % ((mu_tr_healthy-mu_a_healthy)/(1.0-anfact))
+     continuous_vars['mu_s_tumor'  ] = "%f" % ((mu_tr_tumor  -mu_a_tumor  )/(1.0-anfact))
+
+  try:
+     continuous_vars['x_translate'] = float( '-.0052' )
+  except KeyError:
+     continuous_vars['x_translate'] = -0.0055
+
+  try:
+    active_set_vector = [ int(paramsdict['ASV_%d:response_fn_%d' % (i,i) ]) for i in range(1,num_fns+1)  ] 
+  except KeyError:
+    active_set_vector = [ int(paramsdict['ASV_%d:obj_fn' % (i) ]) for i in range(1,num_fns+1)  ] 
+
+  # set a dictionary for passing to rosenbrock via Python kwargs
+  fem_params              = {}
+  fem_params['cv']        = continuous_vars
+  fem_params['asv']       = active_set_vector
+  fem_params['functions'] = num_fns
+  fem_params['fileID']    = fileID 
+  return fem_params
+# end def ParseParameters(paramsfilename):
+
+def RunEvaluation(paramsfilename,resultsfilename,comm=None):
+  """
+  DAKOTA evaluation, petsc is initialized on comm (COMM_WORLD by default)
+  """
+  InitializeLibraries(comm)
+  fem_params = ParseParameters(paramsfilename)
+  fileID = fem_params['fileID']
+  # execute the rosenbrock analysis as a separate Python module
+  print "Running deltap model..."
+  fem_results = deltapModeling(**fem_params)
+  print "deltap complete."
+
+
+  # Return the results to DAKOTA
+
+  if (fem_results['rank'] == 0 ):
+    # write the results.out file for return to DAKOTA
+    # this example only has a single function, so make some assumptions;
+    # not processing DVV
+    resultstmpfile = '%s/results.out.tmp.%d' % (os.path.dirname(os.path.abspath(resultsfilename)),fileID)
+    outfile = open(resultstmpfile, 'w')
   
-  # write functions
-  for func_ind in range(0, num_fns):
-      if (active_set_vector[func_ind] & 1):
-          functions = fem_results['fns']    
-          outfile.write(str(functions[func_ind]) + ' f' + str(func_ind) + '\n')
+    # write functions
+    for func_ind in range(0, fem_params['functions']):
+        if (fem_params['asv'][func_ind] & 1):
+            functions = fem_results['fns']    
+            outfile.write(str(functions[func_ind]) + ' f' + str(func_ind) + '\n')
   
-  ## write gradients
-  #for func_ind in range(0, num_fns):
-  #    if (active_set_vector[func_ind] & 2):
-  #        grad = rosen_results['fnGrads'][func_ind]
-  #        outfile.write('[ ')
-  #        for deriv in grad: 
-  #            outfile.write(str(deriv) + ' ')
-  #        outfile.write(']\n')
-  #
-  ## write Hessians
-  #for func_ind in range(0, num_fns):
-  #    if (active_set_vector[func_ind] & 4):
-  #        hessian = rosen_results['fnHessians'][func_ind]
-  #        outfile.write('[[ ')
-  #        for hessrow in hessian:
-  #            for hesscol in hessrow:
-  #                outfile.write(str(hesscol) + ' ')
-  #            outfile.write('\n')
-  #        outfile.write(']]')
-  #
-  outfile.close();outfile.flush
-  #
-  # move the temporary results file to the one DAKOTA expects
-  import shutil
-  shutil.move('results.out.tmp.%d' % fileID, sys.argv[2])
-  #os.system('mv results.out.tmp ' + sys.argv[2])
+    ## write gradients
+    #for func_ind in range(0, num_fns):
+    #    if (active_set_vector[func_ind] & 2):
+    #        grad = rosen_results['fnGrads'][func_ind]
+    #        outfile.write('[ ')
+    #        for deriv in grad: 
+    #            outfile.write(str(deriv) + ' ')
+    #        outfile.write(']\n')
+    #
+    ## write Hessians
+    #for func_ind in range(0, num_fns):
+    #    if (active_set_vector[func_ind] & 4):
+    #        hessian = rosen_results['fnHessians'][func_ind]
+    #        outfile.write('[[ ')
+    #        for hessrow in hessian:
+    #            for hesscol in hessrow:
+    #                outfile.write(str(hesscol) + ' ')
+    #            outfile.write('\n')
+    #        outfile.write(']]')
+    #
+    outfile.close();outfile.flush
+    #
+    # move the temporary results file to the one DAKOTA expects
+    import shutil
+    shutil.move(resultstmpfile, resultsfilename)
+    #os.system('mv results.out.tmp ' + sys.argv[2])
+# end def RunEvaluation(paramsfilename,resultsfilename,comm=None):
+
+if __name__ == "__main__":
+  RunEvaluation(sys.argv[1],sys.argv[2])
@@ -1,45 +1,163 @@
+# phase difference temperature maps from the real/imaginary DICOM pairs of an
+# MR thermometry acquisition
+#
+# the pairs are decoded by a pool of worker processes ahead of the consumer
+# (DecodedFrames generator), the temperature update is the vectorized phase
+# of conj(S^i) S^{i+1} accumulated in place so that only the running
+# temperature and two frames are resident
+#
+# the temperature series is appended one frame at a time to a single
+# container (temperature.series.json/.raw, see ../PlanningValidation/mrtiio.py)
+# w/ random access to any frame or VOI slab. the per frame files are optional
+# exports
+#
+# rendering is optional and offscreen, a single mapper/actor views the
+# running temperature so long acquisitions run in constant memory
+#
+# --watch follows an acquisition in progress, each real/imag pair is
+# converted as soon as both files are complete (size unchanged over a poll)
+# and appended to the series. consumers poll the sidecar frame count
+# (mrtiio.WaitForImage), the latency of every frame is appended to
+# PREFIX.series.log (one json record per line)
+#
+#   python tmap.py [--procs=N] [--export=vti --export=mat --export=rawdata]
+#                  [--render] [--snapshot=PREFIX] [--range=MIN MAX]
+#   python tmap.py --watch --rootdir=DIR --dirid=ID [--poll=SEC] [--idle=SEC]
 import vtk
 # echo vtk version info
 print "using vtk version", vtk.vtkVersion.GetVTKVersion()
 import vtk.util.numpy_support as vtkNumPy 
 import numpy
 import os
+import collections
+import multiprocessing
+import time
+import json
 import scipy.io as scipyio
+import sys
+# series container
+sys.path.append( '%s/../PlanningValidation' % os.path.dirname(os.path.abspath(__file__)) )
+import mrtiio
 
 # return image data from raw file names
-def GetRawDICOMData(filenames,fileID):
+def GetRawDICOMData(filenames,fileID,writeraw=False):
+  """
+  complex image S = real + i imag of a real/imag DICOM pair, the pair is
+  optionally written as rawdata.%04d.vtk
+  """
   print filenames,fileID
   vtkRealDcmReader = vtk.vtkDICOMImageReader()
-  vtkRealDcmReader.SetFileName("%s/%s"%(rootdir,filenames[0]) )
+  vtkRealDcmReader.SetFileName(filenames[0] )
   vtkRealDcmReader.Update()
-  vtkRealData = vtk.vtkImageCast()
-  vtkRealData.SetOutputScalarTypeToFloat()
-  vtkRealData.SetInput( vtkRealDcmReader.GetOutput() )
-  vtkRealData.Update( )
-  real_image = vtkRealData.GetOutput().GetPointData() 
-  real_array = vtkNumPy.vtk_to_numpy(real_image.GetArray(0)) 
+  real_image = vtkRealDcmReader.GetOutput().GetPointData() 
 
   vtkImagDcmReader = vtk.vtkDICOMImageReader()
-  vtkImagDcmReader.SetFileName("%s/%s"%(rootdir,filenames[1]) )
+  vtkImagDcmReader.SetFileName(filenames[1] )
   vtkImagDcmReader.Update()
-  vtkImagData = vtk.vtkImageCast()
-  vtkImagData.SetOutputScalarTypeToFloat()
-  vtkImagData.SetInput( vtkImagDcmReader.GetOutput() )
-  vtkImagData.Update( )
-  imag_image = vtkImagData.GetOutput().GetPointData() 
-  imag_array = vtkNumPy.vtk_to_numpy(imag_image.GetArray(0)) 
+  imag_image = vtkImagDcmReader.GetOutput().GetPointData() 
 
-  vtkAppend = vtk.vtkImageAppendComponents()
-  vtkAppend.SetInput( 0,vtkRealDcmReader.GetOutput() )
-  vtkAppend.SetInput( 1,vtkImagDcmReader.GetOutput() )
-  vtkAppend.Update( )
+  # cast w/ numpy instead of vtkImageCast
+  complex_array = numpy.empty(real_image.GetArray(0).GetNumberOfTuples(),dtype=numpy.complex64)
+  complex_array.real = vtkNumPy.vtk_to_numpy(real_image.GetArray(0)) 
+  complex_array.imag = vtkNumPy.vtk_to_numpy(imag_image.GetArray(0)) 
 
-  vtkDcmWriter = vtk.vtkDataSetWriter()
-  vtkDcmWriter.SetFileName("rawdata.%04d.vtk" % fileID )
-  vtkDcmWriter.SetInput(vtkAppend.GetOutput())
-  vtkDcmWriter.Update()
+  if ( writeraw ):
+    vtkAppend = vtk.vtkImageAppendComponents()
+    vtkAppend.SetInput( 0,vtkRealDcmReader.GetOutput() )
+    vtkAppend.SetInput( 1,vtkImagDcmReader.GetOutput() )
+    vtkAppend.Update( )
 
-  return (real_array,imag_array)
+    vtkDcmWriter = vtk.vtkDataSetWriter()
+    vtkDcmWriter.SetFileName("rawdata.%04d.vtk" % fileID )
+    vtkDcmWriter.SetInput(vtkAppend.GetOutput())
+    vtkDcmWriter.Update()
+
+  return complex_array
+
+# Convenience Routine
+def DecodeDICOMPair(filenamesfileID):
+  """ worker process entry point, the arguments are a single tuple """
+  (filenames,fileID,writeraw) = filenamesfileID
+  return GetRawDICOMData(filenames,fileID,writeraw)
+
+# Convenience Routine
+def DecodedFrames(realimagdata,numprocs,writeraw=False,lookahead=None):
+  """
+  generator of the complex images of the real/imag pairs in order
+  numprocs workers decode up to lookahead pairs ahead of the consumer
+  """
+  if ( numprocs <= 1 ):
+    for (fileID,filenames) in enumerate(realimagdata):
+      yield GetRawDICOMData(filenames,fileID,writeraw)
+    return
+  if ( lookahead == None ):
+    lookahead = 2 * numprocs
+  workerPool = multiprocessing.Pool(numprocs)
+  pending = collections.deque()
+  for (fileID,filenames) in enumerate(realimagdata):
+    pending.append( workerPool.apply_async(DecodeDICOMPair,((filenames,fileID,writeraw),)) )
+    if ( len(pending) >= lookahead ):
+      yield pending.popleft().get()
+  while ( len(pending) > 0 ):
+    yield pending.popleft().get()
+  workerPool.close()
+  workerPool.join()
+
+# Convenience Routine
+def DICOMPair(rootdir,dirID,idpair):
+  """ real/imag file names of the idpair-th pair of the series """
+  idfile = 2*idpair + 1
+  return ("%s/i%d.MRDC.%d"%(rootdir,dirID+idfile + 0,idfile + 0),
+          "%s/i%d.MRDC.%d"%(rootdir,dirID+idfile + 1,idfile + 1) )
+
+# Convenience Routine
+def WaitForPair(filenames,polltime,idletime):
+  """
+  wait until both files exist and their sizes are unchanged over a poll
+  returns the modification time of the newest file, None after idletime
+  seconds w/o a complete pair
+  """
+  starttime = time.time()
+  previoussizes = None
+  while ( True ):
+    if ( os.path.isfile(filenames[0]) and os.path.isfile(filenames[1]) ):
+      sizes = ( os.path.getsize(filenames[0]), os.path.getsize(filenames[1]) )
+      if ( sizes == previoussizes and min(sizes) > 0 ):
+        return max( os.path.getmtime(filenames[0]), os.path.getmtime(filenames[1]) )
+      previoussizes = sizes
+    if ( time.time() - starttime > idletime ):
+      return None
+    time.sleep(polltime)
+
+# Convenience Routine
+def WatchedFrames(rootdir,dirID,writeraw,polltime,idletime):
+  """
+  generator of (complex image, arrival time) of the pairs as they are
+  written by the scanner, ends after idletime seconds w/o a new pair
+  """
+  idpair = 0
+  while ( True ):
+    filenames = DICOMPair(rootdir,dirID,idpair)
+    arrivaltime = WaitForPair(filenames,polltime,idletime)
+    if ( arrivaltime == None ):
+      print "no new pair after %f seconds, end of acquisition" % idletime
+      return
+    yield (GetRawDICOMData(filenames,idpair,writeraw),arrivaltime)
+    idpair = idpair + 1
+
+# Convenience Routine
+def TemperatureIncrement(previous,current,tmap_factor):
+  """
+  phase difference temperature change between complex images
+
+    - \delta \theta = atan( conj(S^i) * S^{i+1} ) 
+                    = atan2(Im,Re) 
+                    = atan2( S^{i+1}_y S^i_x - S^{i+1}_x S^i_y ,
+                             S^{i+1}_x S^i_x + S^{i+1}_y S^i_y ) 
+  """
+  phase = numpy.angle( current * numpy.conj(previous) )
+  phase *= tmap_factor
+  return phase
 
 # write a numpy data to disk in vtk format
 def ConvertNumpyVTKImage(NumpyImageData):
@@ -65,22 +183,63 @@ def ConvertNumpyVTKImage(NumpyImageData):
   return dataImporter.GetOutput()
   
 
-# generate file names
-dirID =  115298
-rootdir = "/FUS4/data2/CHUN_LI/070131/e114985/s%d" % dirID
+# decoding worker processes
+from optparse import OptionParser
+parser = OptionParser()
+parser.add_option( "--procs",
+                  action="store", dest="procs", type="int", default=multiprocessing.cpu_count(),
+                  help="N worker processes decoding DICOM pairs", metavar="N")
+parser.add_option( "--export",
+                  action="append", dest="exports", default=[], choices=['vti','mat','rawdata'],
+                  help="per frame files temperature.%04d.vti, temperature.%04d.mat, rawdata.%04d.vtk", metavar="FORMAT")
+parser.add_option( "--output",
+                  action="store", dest="output", default="temperature",
+                  help="series container PREFIX.series.json/.raw", metavar="PREFIX")
+parser.add_option( "--render",
+                  action="store_true", dest="render", default=False,
+                  help="render every frame offscreen")
+parser.add_option( "--snapshot",
+                  action="store", dest="snapshot", default=None,
+                  help="write the rendered frames to PREFIX.%04d.png", metavar="PREFIX")
+parser.add_option( "--range",
+                  action="store", dest="range", type="float", nargs=2, default=(21.0,80.0),
+                  help="color map temperature range", metavar="MIN MAX")
+parser.add_option( "--rootdir",
+                  action="store", dest="rootdir", default=None,
+                  help="DICOM series DIR, default /FUS4/.../s<dirid>", metavar="DIR")
+parser.add_option( "--dirid",
+                  action="store", dest="dirid", type="int", default=8980,
+                  help="series ID of the DICOM file names i<ID+n>.MRDC.<n>", metavar="ID")
+parser.add_option( "--nsteps",
+                  action="store", dest="nsteps", type="int", default=60,
+                  help="N real/imag pairs of the offline conversion", metavar="N")
+parser.add_option( "--watch",
+                  action="store_true", dest="watch", default=False,
+                  help="convert the pairs as they arrive during the acquisition")
+parser.add_option( "--poll",
+                  action="store", dest="poll", type="float", default=0.1,
+                  help="poll for new pairs every SEC seconds", metavar="SEC")
+parser.add_option( "--idle",
+                  action="store", dest="idle", type="float", default=120.0,
+                  help="end of the acquisition after SEC seconds w/o a new pair", metavar="SEC")
+(options, args) = parser.parse_args()
 
-dirID =  8980
-rootdir = "/FUS4/data2/nanorods/20101019nanorods/e7605/s%d" % dirID
+# generate file names
+#dirID =  115298
+#rootdir = "/FUS4/data2/CHUN_LI/070131/e114985/s%d" % dirID
+dirID = options.dirid
+rootdir = options.rootdir
+if ( rootdir == None ):
+  rootdir = "/FUS4/data2/nanorods/20101019nanorods/e7605/s%d" % dirID
 
-nsteps = 60
-realimagdata = []
-for idfile in range(1,nsteps*2,2):
-  realimagdata.append( ("i%d.MRDC.%d"%(dirID+idfile + 0,idfile + 0),
-                        "i%d.MRDC.%d"%(dirID+idfile + 1,idfile + 1) )  ) 
+# the header of the first pair, in watch mode the acquisition may not have started
+if ( options.watch ):
+  if ( WaitForPair(DICOMPair(rootdir,dirID,0),options.poll,options.idle) == None ):
+    raise RuntimeError("no DICOM pair in %s after %f seconds" % (rootdir,options.idle))
 
 # get some header data
 vtkDicomInfo = vtk.vtkDICOMImageReader()
-vtkDicomInfo.SetFileName("%s/%s"%(rootdir,"i%d.MRDC.%d"%(dirID+1,1) ) )
+vtkDicomInfo.SetFileName( DICOMPair(rootdir,dirID,0)[0] )
 vtkDicomInfo.Update()
 dimensions = vtkDicomInfo.GetOutput().GetDimensions()
 spacing_mm = vtkDicomInfo.GetOutput().GetSpacing()
@@ -104,76 +263,130 @@ tmap_factor = 1.0 / (2.0 * numpy.pi * imagFreq * alpha * echoTime * 1.e-3)
 print tmap_factor
 
 deltat = 6.0
-pvd=open("temperature.pvd" ,"w")
-pvd.write('<?xml version="1.0"?>\n')
-pvd.write('<VTKFile type="Collection" version="0.1" byte_order="LittleEndian" compressor="vtkZLibDataCompressor">\n')
-pvd.write('  <Collection>\n')
-for idtime in range(nsteps):
-     pvd.write('   <DataSet timestep="%f" part="0" file="%s.%04d.vti"/>\n' % (idtime*deltat,"temperature",idtime) )
-pvd.write('  </Collection>\n')
-pvd.write('</VTKFile>\n')
+
+# Convenience Routine
+def WriteTemperatureFrame(absTemp,idframe):
+  """ append to the series container and write the per frame exports """
+  seriesWriter.AppendFrame(absTemp)
+  if ( 'vti' in options.exports ):
+    # write numpy to disk in vtk format
+    vtkTempImage = ConvertNumpyVTKImage(absTemp)
+    vtkTempWriter = vtk.vtkXMLImageDataWriter()
+    vtkTempWriter.SetFileName( "temperature.%04d.vti" % idframe)
+    vtkTempWriter.SetInput( vtkTempImage )
+    vtkTempWriter.Update()
+  if ( 'mat' in options.exports ):
+    # write numpy to disk in matlab
+    scipyio.savemat("temperature.%04d.mat" % idframe, {'temp':absTemp})
+
+# the container has the geometry of the vti exports
+seriesWriter = mrtiio.SeriesWriter(options.output,(0.,0.,0.),spacing,dimensions,deltat=deltat)
+latencyLog = open('%s.series.log' % options.output,'w')
 
 # create initial image as 1d array
 absTemp = numpy.zeros(dimensions[0]*dimensions[1]*dimensions[2],
                        dtype=numpy.float32) + 21.0
-vtkTempImage = ConvertNumpyVTKImage(absTemp)
-vtkTempWriter = vtk.vtkXMLImageDataWriter()
-vtkTempWriter.SetFileName( "temperature.%04d.vti" % 0)
-vtkTempWriter.SetInput( vtkTempImage )
-vtkTempWriter.Update()
-
-# create a rendering window and renderer
-ren = vtk.vtkRenderer()
-renWin = vtk.vtkRenderWindow()
-renWin.AddRenderer(ren)
- 
-# create a renderwindowinteractor
-iren = vtk.vtkRenderWindowInteractor()
-iren.SetRenderWindow(renWin)
-   
-# loop and compute tmap
-vtkPreviousImage = GetRawDICOMData( realimagdata.pop(0), 0  )
-for idfile,dcmfiles in enumerate(realimagdata):
-  
-  # get current data set
-  vtkCurrent_Image = GetRawDICOMData( dcmfiles , idfile + 1)
-
-  #  - \delta \theta = atan( conj(S^i) * S^{i+1} ) 
-  #                  = atan2(Im,Re) 
-  #                  = atan2( S^{i+1}_y S^i_x - S^{i+1}_x S^i_y ,
-  #                           S^{i+1}_x S^i_x + S^{i+1}_y S^i_y ) 
-  deltaTemp = tmap_factor * numpy.arctan2(
-                        vtkPreviousImage[0] * vtkCurrent_Image[1] 
-                      - vtkPreviousImage[1] * vtkCurrent_Image[0] ,
-                        vtkPreviousImage[1] * vtkCurrent_Image[1] 
-                      + vtkPreviousImage[0] * vtkCurrent_Image[0]  )
-  absTemp  = absTemp + deltaTemp 
-
-  # write numpy to disk in vtk format
-  vtkTempImage = ConvertNumpyVTKImage(absTemp)
-  vtkTempWriter = vtk.vtkXMLImageDataWriter()
-  vtkTempWriter.SetFileName( "temperature.%04d.vti" % (idfile+1))
-  vtkTempWriter.SetInput( vtkTempImage )
-  vtkTempWriter.Update()
-
-  # write numpy to disk in matlab
-  scipyio.savemat("temperature.%04d.mat" % (idfile+1), {'temp':absTemp})
+WriteTemperatureFrame(absTemp,0)
 
-  # update for next time step
-  vtkPreviousImage = vtkCurrent_Image 
+# optional offscreen rendering, one importer/mapper/actor for all frames
+#  the importer wraps the running temperature w/o a copy, absTemp is
+#  updated in place and the pipeline is marked modified every frame
+if ( options.render or options.snapshot != None ):
+  renderImporter = vtk.vtkImageImport()
+  renderImporter.SetImportVoidPointer(absTemp,1)
+  renderImporter.SetDataScalarTypeToFloat()
+  renderImporter.SetNumberOfScalarComponents(1)
+  renderImporter.SetDataExtent( 0, dimensions[0]-1, 0, dimensions[1]-1, 0, dimensions[2]-1)
+  renderImporter.SetWholeExtent(0, dimensions[0]-1, 0, dimensions[1]-1, 0, dimensions[2]-1)
+  renderImporter.SetDataSpacing( spacing )
 
   # mapper
   mapper = vtk.vtkDataSetMapper()
-  mapper.SetInput(vtkTempImage)
-   
+  mapper.SetInput(renderImporter.GetOutput())
+  mapper.SetScalarRange(options.range[0],options.range[1])
+
   # actor
   actor = vtk.vtkActor()
   actor.SetMapper(mapper)
-   
-  # assign actor to the renderer
+
+  # create a rendering window and renderer
+  ren = vtk.vtkRenderer()
   ren.AddActor(actor)
-   
-  # enable user interface interactor
-  #iren.Initialize()
-  #renWin.Render()
-  #iren.Start()
+  renWin = vtk.vtkRenderWindow()
+  renWin.SetOffScreenRendering(1)
+  renWin.AddRenderer(ren)
+  renWin.SetSize(512,512)
+
+  # screen captures
+  if ( options.snapshot != None ):
+    windowImage = vtk.vtkWindowToImageFilter()
+    windowImage.SetInput(renWin)
+    pngWriter = vtk.vtkPNGWriter()
+    pngWriter.SetInput(windowImage.GetOutput())
+
+# Convenience Routine
+def RenderTemperatureFrame(idframe):
+  """ render the running temperature offscreen, optionally save a png """
+  if ( not options.render and options.snapshot == None ):
+    return
+  renderImporter.Modified()
+  renWin.Render()
+  if ( options.snapshot != None ):
+    windowImage.Modified()
+    pngWriter.SetFileName("%s.%04d.png" % (options.snapshot,idframe))
+    pngWriter.Write()
+
+RenderTemperatureFrame(0)
+
+# loop and compute tmap
+#  offline the pairs are decoded ahead by the worker pool, in watch mode
+#  each pair is decoded as soon as it is complete
+if ( options.watch ):
+  dicomFrames = WatchedFrames( rootdir, dirID, 'rawdata' in options.exports, options.poll, options.idle )
+else:
+  realimagdata = [ DICOMPair(rootdir,dirID,idpair) for idpair in range(options.nsteps) ]
+  dicomFrames = ( (frame,None) for frame in
+                  DecodedFrames( realimagdata, options.procs, 'rawdata' in options.exports ) )
+(previousFrame,arrivaltime) = dicomFrames.next()
+for idfile,(currentFrame,arrivaltime) in enumerate(dicomFrames):
+  decodedtime = time.time()
+  
+  # running temperature updated in place
+  absTemp += TemperatureIncrement(previousFrame,currentFrame,tmap_factor)
+
+  # append the frame, consumers see it once the sidecar is renamed
+  WriteTemperatureFrame(absTemp,idfile+1)
+  writtentime = time.time()
+
+  # latency from the arrival of the pair to the frame in the series
+  if ( arrivaltime != None ):
+    latency = {'frame':idfile+1,'arrival':arrivaltime,
+               'decode':decodedtime-arrivaltime,'latency':writtentime-arrivaltime}
+  else:
+    latency = {'frame':idfile+1,'write':writtentime-decodedtime}
+  latencyLog.write('%s\n' % json.dumps(latency,sort_keys=True))
+  latencyLog.flush()
+  if ( options.watch ):
+    print "frame %d latency %f s" % (idfile+1,latency['latency'])
+
+  # update for next time step
+  previousFrame = currentFrame
+
+  # render in place
+  RenderTemperatureFrame(idfile+1)
+
+seriesWriter.Close()
+latencyLog.close()
+
+# time series of the exported frames
+if ( 'vti' in options.exports ):
+  pvd=open("temperature.pvd" ,"w")
+  pvd.write('<?xml version="1.0"?>\n')
+  pvd.write('<VTKFile type="Collection" version="0.1" byte_order="LittleEndian" compressor="vtkZLibDataCompressor">\n')
+  pvd.write('  <Collection>\n')
+  for idtime in range(seriesWriter.Header['frames']):
+       pvd.write('   <DataSet timestep="%f" part="0" file="%s.%04d.vti"/>\n' % (idtime*deltat,"temperature",idtime) )
+  pvd.write('  </Collection>\n')
+  pvd.write('</VTKFile>\n')
+  pvd.close()
+